@@ -0,0 +1,205 @@
+"""
+Agent factory for CampaignGenie application.
+Agents share one pooled OpenAI client per model and one SqliteStorage per
+table, and configured agents are kept per (agent type, session) in an LRU, so
+building agents and opening TLS connections stay off the request path.
+
+Check agents out with checkout_agent for each request instead of holding on to
+them: when the LRU is full, the least recently used agent of the same type that
+is not checked out is rebound to the requested session rather than a new one
+being built.
+"""
+
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Hashable, Optional, Tuple
+
+from pages.config import (
+    OPENAI_BASE_URL,
+    get_openai_api_key,
+    OPENAI_HTTP_MAX_CONNECTIONS,
+    OPENAI_HTTP_KEEPALIVE_SECONDS,
+    AGENT_CACHE_SIZE,
+)
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(model_id: str):
+    """
+    Get the OpenAI client of a model, creating it on first use. Its httpx
+    client keeps connections alive, so requests after the first one skip the
+    TCP and TLS handshakes.
+    """
+    import httpx
+    from openai import OpenAI
+
+    return OpenAI(
+        base_url=OPENAI_BASE_URL,
+        api_key=get_openai_api_key(),
+        http_client=httpx.Client(
+            limits=httpx.Limits(
+                max_connections=OPENAI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=OPENAI_HTTP_KEEPALIVE_SECONDS,
+            )
+        ),
+    )
+
+
+def chat_model(model_id: str):
+    """An OpenAIChat for one agent, sending requests through the shared client."""
+    from agno.models.openai import OpenAIChat
+
+    return OpenAIChat(
+        id=model_id,
+        base_url=OPENAI_BASE_URL,
+        api_key=get_openai_api_key(),
+        client=get_openai_client(model_id),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_storage(table_name: str, db_file: str):
+    """Get the process-wide SqliteStorage of an agent table."""
+    from agno.storage.sqlite import SqliteStorage
+
+    return SqliteStorage(table_name=table_name, db_file=db_file)
+
+
+def rebind_session(agent, session_id: str, user_id: Optional[str] = None) -> None:
+    """
+    Point an agno Agent at another session: drop the state of the current one
+    and load the stored state of session_id, if any.
+    """
+    agent.session_id = session_id
+    if user_id is not None:
+        agent.user_id = user_id
+    agent.agent_session = None
+    agent.session_name = None
+    agent.session_state = None
+    if agent.memory is not None:
+        agent.memory.clear()
+    if agent.storage is not None:
+        agent.read_from_storage(session_id=session_id)
+
+
+class AgentPool:
+    """
+    LRU of configured agents keyed by (agent type, session, options).
+
+    Agents are the wrappers in pages.agents: built as
+    agent_class(session_id=..., **options) and rebound with
+    bind_session(session_id, user_id). Agents between acquire and release are
+    checked out and never evicted or rebound, so a session's run can not be
+    moved to another session; when every agent is checked out the pool grows
+    past max_size until some are released.
+    """
+
+    def __init__(self, max_size: int = AGENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._agents: "OrderedDict[Tuple[Hashable, ...], Any]" = OrderedDict()
+        # id(agent) -> number of holders
+        self._checkouts: Counter = Counter()
+        self.hits = 0
+        self.rebinds = 0
+        self.builds = 0
+
+    def acquire(self, agent_class, session_id: str, **options) -> Any:
+        """Check out the agent of a type for a session; release it when done."""
+        key = (agent_class, session_id, tuple(sorted(options.items())))
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._agents.move_to_end(key)
+                self._checkouts[id(agent)] += 1
+                self.hits += 1
+                return agent
+            if len(self._agents) >= self.max_size:
+                agent = self._evict(agent_class, key[2])
+            if agent is None:
+                self.builds += 1
+            else:
+                self.rebinds += 1
+
+        # Building and rebinding read storage, so they happen outside the lock
+        if agent is None:
+            agent = agent_class(session_id=session_id, **options)
+        else:
+            agent.bind_session(session_id, options.get("user_id"))
+
+        with self._lock:
+            existing = self._agents.get(key)
+            if existing is not None:
+                # Another thread got the same agent meanwhile
+                self._agents.move_to_end(key)
+                agent = existing
+            else:
+                self._agents[key] = agent
+            self._checkouts[id(agent)] += 1
+            return agent
+
+    def release(self, agent) -> None:
+        """Return an agent checked out with acquire."""
+        with self._lock:
+            self._checkouts[id(agent)] -= 1
+            if self._checkouts[id(agent)] <= 0:
+                del self._checkouts[id(agent)]
+
+    def _evict(self, agent_class, options: Tuple) -> Optional[Any]:
+        """
+        Remove the least recently used agent that is not checked out, preferring
+        one with the same type and options, and return it if it can be rebound.
+        """
+        idle = [
+            key
+            for key, agent in self._agents.items()
+            if id(agent) not in self._checkouts
+        ]
+        for key in idle:
+            if key[0] is agent_class and key[2] == options:
+                return self._agents.pop(key)
+        if idle:
+            del self._agents[idle[0]]
+        return None
+
+    def clear(self) -> None:
+        """Forget the agents that are not checked out."""
+        with self._lock:
+            for key, agent in list(self._agents.items()):
+                if id(agent) not in self._checkouts:
+                    del self._agents[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "rebinds": self.rebinds,
+                "builds": self.builds,
+                "size": len(self._agents),
+                "checked_out": len(self._checkouts),
+                "max_size": self.max_size,
+            }
+
+
+agent_pool = AgentPool()
+
+
+@contextmanager
+def checkout_agent(agent_class, session_id: str, **options):
+    """
+    Check out the agent of a type for a session for the duration of the block:
+
+        with checkout_agent(FirstAgent, session_id, user_id="1") as agent:
+            agent.respond(message)
+
+    Do not keep the agent after the block, the pool may rebind it to another
+    session.
+    """
+    agent = agent_pool.acquire(agent_class, session_id, **options)
+    try:
+        yield agent
+    finally:
+        agent_pool.release(agent)
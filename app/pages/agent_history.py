@@ -1,9 +1,11 @@
 import streamlit as st
+from contextlib import contextmanager
 from typing import List, Dict
 import json
 from agno.storage.sqlite import SqliteStorage
 
 from pages.agents import FirstAgent, CampaignPlanner, KbgkAgent, CrawlerAgent
+from pages.agent_factory import checkout_agent, get_storage
 from pages.config import (
     FIRST_AGENT_DB_PATH,
     CAMPAIGN_PLANNER_DB_PATH,
@@ -79,22 +81,24 @@ def format_tool_results(tool_results: List[Dict]) -> str:
     return "\n".join(formatted)
 
 
-def get_agent_instance(agent_name: str, session_id: str):
-    """Get an instance of the appropriate agent class."""
-    if agent_name == "First Agent (Greetings)":
-        agent = FirstAgent(session_id=session_id)
-    elif agent_name == "Campaign Planner":
-        agent = CampaignPlanner(session_id=session_id)
-    elif agent_name == "Knowledge Base Gate Keeper":
-        agent = KbgkAgent(session_id=session_id)
-    elif agent_name == "Crawler Agent":
-        agent = CrawlerAgent(session_id=session_id)
-    else:
+AGENT_CLASSES = {
+    "First Agent (Greetings)": FirstAgent,
+    "Campaign Planner": CampaignPlanner,
+    "Knowledge Base Gate Keeper": KbgkAgent,
+    "Crawler Agent": CrawlerAgent,
+}
+
+
+@contextmanager
+def checkout_agent_instance(agent_name: str, session_id: str):
+    """Check out the pooled agent of the appropriate class for a session."""
+    if agent_name not in AGENT_CLASSES:
         raise ValueError(f"Unknown agent: {agent_name}")
 
-    agent.agent.initialize_agent()
-    agent.agent.read_from_storage(session_id=session_id)
-    return agent
+    with checkout_agent(AGENT_CLASSES[agent_name], session_id) as agent:
+        # Reload the session, other processes may have added to it
+        agent.bind_session(session_id)
+        yield agent
 
 
 def display_agent_interaction(agent_name: str, session_id: str):
@@ -103,45 +107,46 @@ def display_agent_interaction(agent_name: str, session_id: str):
     st.markdown("You can interact with the agent directly here.")
 
     try:
-        agent_instance = get_agent_instance(agent_name, session_id)
-
-        # Display agent info
-        st.info(f"**Agent:** {agent_name}\n**Session:** {session_id}")
-
-        # Input for user message
-        user_message = st.text_area(
-            "Enter your message:", height=100, placeholder="Type your message here..."
-        )
-
-        col1, col2 = st.columns([1, 1])
-
-        with col1:
-            if st.button("Send Message", type="primary"):
-                if user_message.strip():
-                    with st.spinner("Processing..."):
-                        try:
-                            if hasattr(agent_instance, "respond"):
-                                response = agent_instance.respond(user_message)
-                                st.success("Response received!")
-                                st.markdown("**Agent Response:**")
-                                st.markdown(response)
-                            else:
-                                st.error(
-                                    "This agent doesn't support direct interaction."
-                                )
-                        except Exception as e:
-                            st.error(f"Error: {str(e)}")
-                else:
-                    st.warning("Please enter a message.")
-
-        with col2:
-            if st.button("Clear Session"):
-                try:
-                    agent_instance.agent.storage.delete_session(session_id)
-                    st.success("Session cleared!")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error clearing session: {str(e)}")
+        with checkout_agent_instance(agent_name, session_id) as agent_instance:
+            # Display agent info
+            st.info(f"**Agent:** {agent_name}\n**Session:** {session_id}")
+
+            # Input for user message
+            user_message = st.text_area(
+                "Enter your message:",
+                height=100,
+                placeholder="Type your message here...",
+            )
+
+            col1, col2 = st.columns([1, 1])
+
+            with col1:
+                if st.button("Send Message", type="primary"):
+                    if user_message.strip():
+                        with st.spinner("Processing..."):
+                            try:
+                                if hasattr(agent_instance, "respond"):
+                                    response = agent_instance.respond(user_message)
+                                    st.success("Response received!")
+                                    st.markdown("**Agent Response:**")
+                                    st.markdown(response)
+                                else:
+                                    st.error(
+                                        "This agent doesn't support direct interaction."
+                                    )
+                            except Exception as e:
+                                st.error(f"Error: {str(e)}")
+                    else:
+                        st.warning("Please enter a message.")
+
+            with col2:
+                if st.button("Clear Session"):
+                    try:
+                        agent_instance.agent.storage.delete_session(session_id)
+                        st.success("Session cleared!")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error clearing session: {str(e)}")
 
     except Exception as e:
         st.error(f"Error creating agent instance: {str(e)}")
@@ -178,12 +183,13 @@ def main():
     if selected_agent:
         # Get sessions for selected agent
         try:
-            # Create a temporary agent instance to get storage
-            temp_agent = get_agent_instance(selected_agent, "temp_session")
+            storage: SqliteStorage = get_storage(
+                agents[selected_agent]["table_name"], agents[selected_agent]["db_path"]
+            )
+            session_ids = storage.get_all_session_ids()
         except Exception as e:
             st.error(f"Error accessing agent storage: {str(e)}")
             return
-        session_ids = temp_agent.agent.storage.get_all_session_ids()
 
         if not session_ids:
             st.warning(f"No sessions found for {selected_agent}")
@@ -205,8 +211,10 @@ def main():
 
             with tab1:
                 # Get messages for selected session
-                agent_instance = get_agent_instance(selected_agent, selected_session)
-                messages = get_session_messages(agent_instance, selected_session)
+                with checkout_agent_instance(
+                    selected_agent, selected_session
+                ) as agent_instance:
+                    messages = get_session_messages(agent_instance, selected_session)
 
                 if not messages:
                     st.warning(f"No messages found for session {selected_session}")
@@ -1,14 +1,13 @@
 from __future__ import annotations
 
 import os
+import threading
 import uuid
 from textwrap import dedent
-from typing import Optional
+from typing import Iterator, NamedTuple, Optional
 
 from agno.agent import Agent, Message
-from agno.models.openai import OpenAIChat
-from agno.storage.sqlite import SqliteStorage
-from agno.tools.crawl4ai import Crawl4aiTools
+from pydantic import BaseModel, Field
 
 from datetime import datetime
 
@@ -22,14 +21,18 @@ from pages.models import (
 from pages.kb import (
     campaign_planner_retriever,
     get_documents_for_user_request,
-    knowledge_base,
+    get_knowledge_base,
     search_yektanet,
     add_document_to_knowledge_base,
 )
 from pages.prompts import YEKTANET_SERVICES
+from pages.agent_factory import (
+    chat_model,
+    get_storage,
+    checkout_agent,
+    rebind_session,
+)
 from pages.config import (
-    OPENAI_BASE_URL,
-    get_openai_api_key,
     GPT_MODEL_ID,
     MINI_GPT_MODEL_ID,
     FIRST_AGENT_DB_PATH,
@@ -41,6 +44,7 @@ from pages.config import (
     AGENT_DEBUG_MODE,
     CRAWLER_AGENT_DB_PATH,
     CRAWLER_AGENT_TABLE_NAME,
+    IMAGE_LLM_RERANK_ENABLED,
 )
 from pages.mongodb_utils import (
     insert_campaign_request,
@@ -50,6 +54,16 @@ from pages.mongodb_utils import (
 )
 
 
+def crawl4ai_tools():
+    """
+    Crawl4aiTools that serve repeat crawls from the crawl cache, imported on
+    first use since crawl4ai is slow to import.
+    """
+    from pages.crawl_cache import CachedCrawl4aiTools
+
+    return CachedCrawl4aiTools(max_length=None)
+
+
 def persist_campaign_request(
     campaign_request: CampaignRequest, agent: Optional[Agent] = None, **kwargs
 ) -> None:
@@ -78,7 +92,8 @@ def persist_campaign_request(
 def ask_from_knowledge_base(question: str) -> str:
     """
     Answers a question using the knowledge base.
-    It creates an agent with the knowledge base and asks the question to it.
+    It asks the question to a pooled knowledge base agent, bound to a session
+    of its own so that each question stands alone.
 
     Args:
         question (str): The question to answer
@@ -87,25 +102,7 @@ def ask_from_knowledge_base(question: str) -> str:
         str: The answer to the question
     """
     try:
-        agent = Agent(
-            model=OpenAIChat(
-                id=MINI_GPT_MODEL_ID,
-                base_url=OPENAI_BASE_URL,
-                api_key=get_openai_api_key(),
-            ),
-            tools=[campaign_planner_retriever],
-            instructions=[
-                "Always search your knowledge before answering the question.",
-                "Only include the output in your response. No other text.",
-                "Related documents are provided to give you an idea of the available documents.",
-                "In each call num_documents MUST BE ALWAYS 2, instead you can do a few calls to get more information.",
-            ],
-            markdown=True,
-            debug_mode=AGENT_DEBUG_MODE,
-            telemetry=False,
-            monitoring=False,
-        )
-        documents = knowledge_base.search(query=question, num_documents=10)
+        documents = get_knowledge_base().search(query=question, num_documents=10)
 
         if not documents:
             return "No documents found"
@@ -122,24 +119,99 @@ def ask_from_knowledge_base(question: str) -> str:
 
         related_docs = "\n\n".join(message_parts)
 
-        response = agent.run(f"Question: {question}\n\n Documents: {related_docs}")
-        return response
+        with checkout_agent(KnowledgeBaseAgent, str(uuid.uuid4())) as agent:
+            return agent.respond(
+                f"Question: {question}\n\n Documents: {related_docs}"
+            )
     except Exception as e:
         print(f"Error during knowledge base search: {str(e)}")
         return f"Error during knowledge base search: {str(e)}"
 
 
-class FirstAgent:
+class StreamEvent(NamedTuple):
+    """
+    A piece of a streamed reply: kind is "token" (text is the next part of the
+    answer), "tool_started" or "tool_completed" (text is the tool name).
+    """
+
+    kind: str
+    text: str
+
+
+class SessionAgent:
+    """
+    An agno Agent bound to one session at a time. Runs and rebinding hold the
+    lock; the pool only rebinds agents that are not checked out, so a session
+    keeps its agent from checkout_agent until its run is done.
+    """
+
+    agent: Agent
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    def bind_session(self, session_id: str, user_id: Optional[str] = None) -> None:
+        """Continue the stored conversation of another session."""
+        with self.lock:
+            rebind_session(self.agent, session_id, user_id)
+
+    def stream_events(self, message: Message) -> Iterator[StreamEvent]:
+        """Run the agent, yielding answer tokens and tool progress as they come."""
+        from agno.run.response import RunEvent
+
+        with self.lock:
+            for chunk in self.agent.run(
+                message, stream=True, stream_intermediate_steps=True
+            ):
+                if chunk.event == RunEvent.run_response and chunk.content:
+                    yield StreamEvent("token", str(chunk.content))
+                elif chunk.event in (
+                    RunEvent.tool_call_started,
+                    RunEvent.tool_call_completed,
+                ):
+                    # chunk.tools lists the run's tool calls so far
+                    tool = (chunk.tools or [{}])[-1]
+                    name = (
+                        tool.get("tool_name")
+                        if isinstance(tool, dict)
+                        else getattr(tool, "tool_name", None)
+                    )
+                    kind = (
+                        "tool_started"
+                        if chunk.event == RunEvent.tool_call_started
+                        else "tool_completed"
+                    )
+                    yield StreamEvent(kind, name or "tool")
+
+
+def reply_tokens(events: Iterator[StreamEvent]) -> Iterator[str]:
+    """
+    Tokens of a streamed reply for st.write_stream, with tool progress shown
+    in a Streamlit status box.
+    """
+    import streamlit as st
+
+    status = None
+    for event in events:
+        if event.kind == "token":
+            yield event.text
+        elif event.kind == "tool_started":
+            if status is None:
+                status = st.status(f"Running {event.text}...")
+            status.update(label=f"Running {event.text}...", state="running")
+            status.write(f"⏳ {event.text}")
+        elif status is not None:
+            status.update(label=f"Finished {event.text}", state="complete")
+
+
+class FirstAgent(SessionAgent):
     """Collects all details needed to build a CampaignRequest."""
 
     def __init__(self, session_id: str, user_id: str = "1"):
+        super().__init__()
         self.agent = Agent(
             name="Greetings Agent",
-            model=OpenAIChat(
-                id=MINI_GPT_MODEL_ID,
-                base_url=OPENAI_BASE_URL,
-                api_key=get_openai_api_key(),
-            ),
+            model=chat_model(MINI_GPT_MODEL_ID),
             tools=[
                 persist_campaign_request,
                 agentic_crawl_url,
@@ -161,9 +233,7 @@ class FirstAgent:
                     """),
                 "Always communicate in Persian (Farsi) as the primary language.",
             ],
-            storage=SqliteStorage(
-                table_name=FIRST_AGENT_TABLE_NAME, db_file=FIRST_AGENT_DB_PATH
-            ),
+            storage=get_storage(FIRST_AGENT_TABLE_NAME, FIRST_AGENT_DB_PATH),
             add_datetime_to_instructions=True,
             # Adds the history of the conversation to the messages
             add_history_to_messages=True,
@@ -181,26 +251,30 @@ class FirstAgent:
         self.agent.read_from_storage(session_id=session_id)
 
     def respond(self, user_message: str):
-        reply = self.agent.run(
+        with self.lock:
+            reply = self.agent.run(
+                Message(role="user", content=[{"type": "text", "text": user_message}])
+            )
+        return reply.content
+
+    def respond_stream(self, user_message: str) -> Iterator[StreamEvent]:
+        """Like respond, but streams the reply and tool progress."""
+        return self.stream_events(
             Message(role="user", content=[{"type": "text", "text": user_message}])
         )
-        return reply.content
 
 
-class CampaignPlanner:
+class CampaignPlanner(SessionAgent):
     """Takes the saved CampaignRequest and drafts a CampaignPlan."""
 
     def __init__(self, session_id: str, campaign_request_id: Optional[str] = None):
+        super().__init__()
         self.session_id = session_id
         self.campaign_request_id = campaign_request_id
 
         self.agent = Agent(
             name="Campaign Planner Agent",
-            model=OpenAIChat(
-                id=GPT_MODEL_ID,
-                base_url=OPENAI_BASE_URL,
-                api_key=get_openai_api_key(),
-            ),
+            model=chat_model(GPT_MODEL_ID),
             tools=[
                 # search_yektanet,
                 # agentic_crawl_url,
@@ -214,15 +288,15 @@ class CampaignPlanner:
                           Related documents are provided to you.
                         
                         * If a similar campaign plan is provided, use it as a reference.
-                        * Use crawl_images_from_landing to crawl images from landing page and use them as user_asset.
+                        * Use crawl_images_from_landing with the landing page url and the business name to crawl images and use them as user_asset.
                         
                         * Create at most 4 ads using image.source = user_assets.
                         * Create at most 4 ads using image.source = generate.
                         * Images MUST be compatible with social norms and government rules in Iran.
                          """)
             ],
-            storage=SqliteStorage(
-                table_name=CAMPAIGN_PLANNER_TABLE_NAME, db_file=CAMPAIGN_PLANNER_DB_PATH
+            storage=get_storage(
+                CAMPAIGN_PLANNER_TABLE_NAME, CAMPAIGN_PLANNER_DB_PATH
             ),
             add_datetime_to_instructions=True,
             # Adds the history of the conversation to the messages
@@ -238,19 +312,25 @@ class CampaignPlanner:
             search_knowledge=True,
         )
 
+    def bind_session(self, session_id: str, user_id: Optional[str] = None) -> None:
+        with self.lock:
+            super().bind_session(session_id, user_id)
+            self.session_id = session_id
+
     def resume(self, feedbacks: list[str]) -> CampaignPlan:
         try:
-            reply = self.agent.run(
-                Message(
-                    role="user",
-                    content=[
-                        {
-                            "type": "text",
-                            "text": f"Update accoring to user feedback {feedbacks}",
-                        }
-                    ],
+            with self.lock:
+                reply = self.agent.run(
+                    Message(
+                        role="user",
+                        content=[
+                            {
+                                "type": "text",
+                                "text": f"Update accoring to user feedback {feedbacks}",
+                            }
+                        ],
+                    )
                 )
-            )
             campaign_plan: CampaignPlan = reply.content
             return self.insert_campaign_plan(campaign_plan)
         except Exception as e:
@@ -261,10 +341,10 @@ class CampaignPlanner:
         try:
             # TODO: Remove this after testing
             print(f"Deleting session {self.session_id}")
-            storage = SqliteStorage(
-                table_name=CAMPAIGN_PLANNER_TABLE_NAME, db_file=CAMPAIGN_PLANNER_DB_PATH
-            )
+            storage = get_storage(CAMPAIGN_PLANNER_TABLE_NAME, CAMPAIGN_PLANNER_DB_PATH)
             storage.delete_session(self.session_id)
+            # Also forget the deleted session in a pooled agent
+            self.bind_session(self.session_id)
 
             assert self.campaign_request_id is not None, (
                 "CampaignRequest ID is required"
@@ -286,7 +366,8 @@ class CampaignPlanner:
             )
             combined_input += f"Related documents:\n{documents_info}"
 
-            reply = self.agent.run(combined_input)
+            with self.lock:
+                reply = self.agent.run(combined_input)
             campaign_plan: CampaignPlan = reply.content
             return self.insert_campaign_plan(campaign_plan)
 
@@ -306,23 +387,20 @@ class CampaignPlanner:
         return campaign_plan_db
 
 
-class KbgkAgent:
+class KbgkAgent(SessionAgent):
     """Knowledge Base Gate Keeper Agent for generating and inserting documents into knowledge base."""
 
     def __init__(self, session_id: str, user_id: str = "1"):
+        super().__init__()
         self.agent = Agent(
             name="Knowledge Base Gate Keeper Agent",
-            model=OpenAIChat(
-                id=MINI_GPT_MODEL_ID,
-                base_url=OPENAI_BASE_URL,
-                api_key=get_openai_api_key(),
-            ),
+            model=chat_model(MINI_GPT_MODEL_ID),
             tools=[
-                Crawl4aiTools(max_length=None),
+                crawl4ai_tools(),
                 search_yektanet,
                 add_document_to_knowledge_base,
             ],
-            knowledge=knowledge_base,
+            knowledge=get_knowledge_base(),
             search_knowledge=True,
             instructions=[
                 dedent(
@@ -356,9 +434,7 @@ class KbgkAgent:
                     """
                 )
             ],
-            storage=SqliteStorage(
-                table_name=KBGK_AGENT_TABLE_NAME, db_file=KBGK_AGENT_DB_PATH
-            ),
+            storage=get_storage(KBGK_AGENT_TABLE_NAME, KBGK_AGENT_DB_PATH),
             add_datetime_to_instructions=True,
             add_history_to_messages=True,
             num_history_responses=5,
@@ -373,32 +449,34 @@ class KbgkAgent:
         self.agent.read_from_storage(session_id=session_id)
 
     def respond(self, user_message: str):
-        reply = self.agent.run(
+        with self.lock:
+            reply = self.agent.run(
+                Message(role="user", content=[{"type": "text", "text": user_message}])
+            )
+        return reply.content
+
+    def respond_stream(self, user_message: str) -> Iterator[StreamEvent]:
+        """Like respond, but streams the reply and tool progress."""
+        return self.stream_events(
             Message(role="user", content=[{"type": "text", "text": user_message}])
         )
-        return reply.content
 
 
-class CrawlerAgent:
+class CrawlerAgent(SessionAgent):
     def __init__(self, session_id: str, user_id: str = "1", response_model=None):
+        super().__init__()
         self.agent = Agent(
             session_id=session_id,
             user_id=user_id,
-            model=OpenAIChat(
-                id=MINI_GPT_MODEL_ID,
-                base_url=OPENAI_BASE_URL,
-                api_key=get_openai_api_key(),
-            ),
-            tools=[Crawl4aiTools(max_length=None)],
+            model=chat_model(MINI_GPT_MODEL_ID),
+            tools=[crawl4ai_tools()],
             instructions=[
                 dedent("""
                         You are a crawler agent that crawls the given url for the given goal.
                         Always communicate in Persian (Farsi) as the primary language.
                         """),
             ],
-            storage=SqliteStorage(
-                table_name=CRAWLER_AGENT_TABLE_NAME, db_file=CRAWLER_AGENT_DB_PATH
-            ),
+            storage=get_storage(CRAWLER_AGENT_TABLE_NAME, CRAWLER_AGENT_DB_PATH),
             show_tool_calls=True,
             debug_mode=AGENT_DEBUG_MODE,
             telemetry=False,
@@ -407,78 +485,113 @@ class CrawlerAgent:
         )
 
     def respond(self, url: str, goal: str):
-        reply = self.agent.run(
-            Message(
-                role="user",
-                content=[
-                    {
-                        "type": "text",
-                        "text": f"Crawl the following url: {url} for the following goal: {goal}",
-                    }
-                ],
+        with self.lock:
+            reply = self.agent.run(
+                Message(
+                    role="user",
+                    content=[
+                        {
+                            "type": "text",
+                            "text": f"Crawl the following url: {url} for the following goal: {goal}",
+                        }
+                    ],
+                )
             )
-        )
         return reply.content
 
 
+class KnowledgeBaseAgent(SessionAgent):
+    """The agent answering ask_from_knowledge_base questions."""
+
+    def __init__(self, session_id: str):
+        super().__init__()
+        self.agent = Agent(
+            session_id=session_id,
+            model=chat_model(MINI_GPT_MODEL_ID),
+            tools=[campaign_planner_retriever],
+            instructions=[
+                "Always search your knowledge before answering the question.",
+                "Only include the output in your response. No other text.",
+                "Related documents are provided to give you an idea of the available documents.",
+                "In each call num_documents MUST BE ALWAYS 2, instead you can do a few calls to get more information.",
+            ],
+            markdown=True,
+            debug_mode=AGENT_DEBUG_MODE,
+            telemetry=False,
+            monitoring=False,
+        )
+
+    def respond(self, message: str):
+        with self.lock:
+            return self.agent.run(message)
+
+
 def agentic_crawl_url(url: str, goal: str, agent: Optional[Agent] = None):
     """
     Crawl the given url for the given goal.
     The agent will use the Crawl4aiTools to crawl the url.
     The agent will return the crawled data.
     """
-    crawler_agent = CrawlerAgent(agent.session_id, agent.user_id)
-    return crawler_agent.respond(url, goal)
+    with checkout_agent(
+        CrawlerAgent, agent.session_id, user_id=agent.user_id
+    ) as crawler_agent:
+        return crawler_agent.respond(url, goal)
+
+
+MAX_NUM_IMAGES_TO_CRAWL = 40
+MAX_NUM_IMAGES_TO_RETURN = 10
+
+
+class CrawledImage(BaseModel):
+    url: str
+    image_alt: str
+
 
+# Module level, so pooled image crawler agents are reused across calls
+class ImageCrawlerResponse(BaseModel):
+    images: list[CrawledImage] = Field(..., max_length=MAX_NUM_IMAGES_TO_CRAWL)
 
-def crawl_images_from_landing(url: str, agent: Optional[Agent] = None):
+
+def crawl_images_from_landing(
+    url: str, business_name: str = "", agent: Optional[Agent] = None
+):
     """
     Crawl images to use in ad generation from a business landing page
+
+    Args:
+        url (str): The landing page URL
+        business_name (str): The business name, used to rank the images
     """
-    from pages.models import BaseModel, Field
     from agno.media import Image
-    from PIL import Image as PILImage
-    from io import BytesIO
-    import requests
-
-    MAX_NUM_IMAGES_TO_CRAWL = 40
-    MAX_NUM_IMAGES_TO_RETURN = 10
-    class CrawledImage(BaseModel):
-        url: str
-        image_alt: str
-
-    class ImageCrawlerResponse(BaseModel):
-        images: list[CrawledImage] = Field(..., max_length=MAX_NUM_IMAGES_TO_CRAWL)
-
-    goal = dedent(f"""
-        Crawl the following url and return the images that seem useful for ad generation.
-        * Choose the images based on the content of url and the business type.
-        * Return images sorted based on relavence and usefulness descending.
-        * Return at most {MAX_NUM_IMAGES_TO_CRAWL} DISTINCT images.
-""")
-    crawler_agent = CrawlerAgent(
-        agent.session_id, agent.user_id, response_model=ImageCrawlerResponse
+    from pages.image_extractor import find_landing_images
+    from pages.image_probe import probe_images
+
+    candidates = find_landing_images(
+        url, business_name, llm_rerank=IMAGE_LLM_RERANK_ENABLED
     )
-    response: ImageCrawlerResponse = crawler_agent.respond(url, goal)
-    valid_images = []
-    response_images = list({img.url for img in response.images})
-    for img_url in response_images:
-        try:
-            # Download the image
-            image_response = requests.get(img_url, timeout=5)
-            image_response.raise_for_status()  # Raise exception for bad status codes
-            
-            # Open image with PIL to check dimensions
-            pil_image = PILImage.open(BytesIO(image_response.content))
-            width, height = pil_image.size
-            
-            # Check if image meets minimum size requirements
-            if width >= 300 and height >= 300:
-                # Add to valid images list
-                valid_images.append(Image(url=img_url))
-                
-        except (requests.RequestException, PILImage.UnidentifiedImageError) as e:
-            print(f"error, {e}")
-            continue
+    response_images = [c.url for c in candidates[:MAX_NUM_IMAGES_TO_CRAWL]]
+    if not response_images:
+        # Pages that render their images with JavaScript need the browser crawl
+        goal = dedent(f"""
+            Crawl the following url and return the images that seem useful for ad generation.
+            * Choose the images based on the content of url and the business type.
+            * Return images sorted based on relavence and usefulness descending.
+            * Return at most {MAX_NUM_IMAGES_TO_CRAWL} DISTINCT images.
+    """)
+        with checkout_agent(
+            CrawlerAgent,
+            agent.session_id,
+            user_id=agent.user_id,
+            response_model=ImageCrawlerResponse,
+        ) as crawler_agent:
+            response: ImageCrawlerResponse = crawler_agent.respond(url, goal)
+        response_images = list(dict.fromkeys(img.url for img in response.images))
+    # Header-only, concurrent size checks; stops at enough usable images
+    valid_images = [
+        Image(url=img_url)
+        for img_url, _, _ in probe_images(
+            response_images, max_images=MAX_NUM_IMAGES_TO_RETURN
+        )
+    ]
     return valid_images[:MAX_NUM_IMAGES_TO_RETURN]
 
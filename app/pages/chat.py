@@ -1,5 +1,6 @@
 import streamlit as st
-from pages.agents import FirstAgent
+from pages.agents import FirstAgent, reply_tokens
+from pages.agent_factory import checkout_agent
 from typing import List
 import uuid
 from textwrap import dedent
@@ -24,12 +25,12 @@ if "session_id" in st.session_state:
     st.markdown("**Session ID:**")
     st.code(st.session_state["session_id"], language="text")
 
-if "agent" not in st.session_state:
-    st.session_state["agent"] = FirstAgent(session_id=st.session_state["session_id"])
-
 # Load messages from TinyDB on first run
 if "messages" not in st.session_state:
-    messages: List[Message] = st.session_state["agent"].agent.get_messages_for_session()
+    # Agents are pooled per session and checked out for each use instead of
+    # being kept in session_state
+    with checkout_agent(FirstAgent, st.session_state["session_id"]) as agent:
+        messages: List[Message] = agent.agent.get_messages_for_session()
     st.session_state["messages"] = [
         {"sender": m.role, "message": m.content} for m in messages
     ]
@@ -79,7 +80,15 @@ user_input = st.chat_input("Type your message...")
 if user_input:
     user_msg = {"sender": "user", "message": user_input}
     st.session_state["messages"].append(user_msg)
-    agent_response = st.session_state["agent"].respond(user_input)
+    with st.chat_message("user"):
+        st.markdown(user_input)
+    # Render the reply as it streams in; the rerun below redraws it as history
+    with st.chat_message("Assistant"), checkout_agent(
+        FirstAgent, st.session_state["session_id"]
+    ) as agent:
+        agent_response = st.write_stream(
+            reply_tokens(agent.respond_stream(user_input))
+        )
     agent_msg = {"sender": "Assistant", "message": agent_response}
     st.session_state["messages"].append(agent_msg)
     st.rerun()
@@ -99,14 +108,11 @@ new_session_id = st.sidebar.text_input(
 if st.sidebar.button("Resume Session", type="secondary"):
     if new_session_id:
         st.session_state["session_id"] = new_session_id
-        st.session_state["agent"] = FirstAgent(session_id=new_session_id)
-        from pages.agents import SqliteStorage
-
-        s: SqliteStorage = st.session_state["agent"].agent.storage
         # Load messages for the new session
-        messages: List[Message] = st.session_state[
-            "agent"
-        ].agent.get_messages_for_session(new_session_id)
+        with checkout_agent(FirstAgent, new_session_id) as agent:
+            messages: List[Message] = agent.agent.get_messages_for_session(
+                new_session_id
+            )
         for m in messages:
             if m.role == "user":
                 st.session_state["messages"].append(
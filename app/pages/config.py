@@ -24,8 +24,64 @@ KBGK_AGENT_DB_PATH = "app/pages/files/campaign_genie.db"
 CRAWLER_AGENT_DB_PATH = "app/pages/files/campaign_genie.db"
 
 # Vector database configuration
-VECTOR_DB_URI = "app/pages/files/tmp/chromadb"
+VECTOR_DB_URI = os.getenv("VECTOR_DB_URI", "app/pages/files/tmp/chromadb")
 VECTOR_DB_TABLE_NAME = "documents"
+# Vector database backend of the knowledge base: "chroma" or "lancedb"
+VECTOR_DB_BACKEND = os.getenv("VECTOR_DB_BACKEND", "chroma")
+LANCEDB_URI = os.getenv("LANCEDB_URI", "app/pages/files/tmp/lancedb")
+# LanceDB tables get an IVF-PQ index once they have this many rows; smaller
+# tables are searched exhaustively
+LANCEDB_INDEX_MIN_ROWS = int(os.getenv("LANCEDB_INDEX_MIN_ROWS", "5000"))
+LANCEDB_NPROBES = int(os.getenv("LANCEDB_NPROBES", "20"))
+# Re-rank refine_factor * k PQ candidates with the stored full vectors
+LANCEDB_REFINE_FACTOR = int(os.getenv("LANCEDB_REFINE_FACTOR", "10"))
+# LanceDB vector index: "IVF_PQ" (product quantization) or "IVF_HNSW_SQ" (int8
+# scalar quantization)
+LANCEDB_INDEX_TYPE = os.getenv("LANCEDB_INDEX_TYPE", "IVF_PQ")
+
+# Embedding cache keyed by (model, content hash)
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", "app/pages/files/tmp/embedding_cache.sqlite"
+)
+
+# In-memory knowledge base caches: query text -> embedding and
+# (query, filters, num_documents) -> documents
+KB_QUERY_CACHE_SIZE = int(os.getenv("KB_QUERY_CACHE_SIZE", "1024"))
+KB_QUERY_CACHE_TTL_SECONDS = int(os.getenv("KB_QUERY_CACHE_TTL_SECONDS", "3600"))
+KB_RETRIEVAL_CACHE_SIZE = int(os.getenv("KB_RETRIEVAL_CACHE_SIZE", "1024"))
+KB_RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv("KB_RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+# Also keep query embeddings in the shared on-disk embedding cache
+KB_QUERY_CACHE_DISK_ENABLED = (
+    os.getenv("KB_QUERY_CACHE_DISK_ENABLED", "true").lower() == "true"
+)
+
+# Passage-level retrieval: documents' full_text is split into passages stored
+# in their own collection, and planner context is capped by a token budget
+KB_PASSAGE_COLLECTION_NAME = "document_passages"
+KB_PASSAGE_MAX_CHARS = int(os.getenv("KB_PASSAGE_MAX_CHARS", "1000"))
+KB_PASSAGE_OVERLAP_CHARS = int(os.getenv("KB_PASSAGE_OVERLAP_CHARS", "150"))
+KB_PASSAGES_PER_QUERY = int(os.getenv("KB_PASSAGES_PER_QUERY", "24"))
+PLANNER_CONTEXT_TOKEN_BUDGET = int(os.getenv("PLANNER_CONTEXT_TOKEN_BUDGET", "3000"))
+# Persian text averages fewer characters per token than English
+KB_CHARS_PER_TOKEN = float(os.getenv("KB_CHARS_PER_TOKEN", "3"))
+
+# Full-text (BM25) index kept alongside the vector database
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH", "app/pages/files/tmp/lexical_index"
+)
+# Candidates taken from each retriever before reciprocal-rank fusion
+KB_HYBRID_CANDIDATES = int(os.getenv("KB_HYBRID_CANDIDATES", "10"))
+KB_RRF_K = int(os.getenv("KB_RRF_K", "60"))
+# Fall back to lexical-only retrieval if embedding the query takes longer
+KB_QUERY_EMBEDDING_TIMEOUT_SECONDS = float(
+    os.getenv("KB_QUERY_EMBEDDING_TIMEOUT_SECONDS", "5")
+)
+
+# Knowledge base bulk ingestion: CSV rows per chunk, texts per embeddings call
+# and embeddings calls in flight
+KB_INGEST_CHUNK_SIZE = int(os.getenv("KB_INGEST_CHUNK_SIZE", "500"))
+KB_EMBEDDING_BATCH_SIZE = int(os.getenv("KB_EMBEDDING_BATCH_SIZE", "100"))
+KB_INGEST_CONCURRENCY = int(os.getenv("KB_INGEST_CONCURRENCY", "4"))
 
 # MongoDB configuration
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
@@ -54,6 +110,52 @@ OPENAI_API_KEY_ENV = "METIS_API_KEY"
 MINI_GPT_MODEL_ID = "gpt-4.1-mini"
 GPT_MODEL_ID = "gpt-4.1"
 EMBEDDING_MODEL_ID = "text-embedding-3-large"
+# "openai" embeds through the API above; "local" uses a deterministic hashed
+# character n-gram embedder that needs no network (offline runs, benchmarks)
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "openai")
+LOCAL_EMBEDDING_DIMENSIONS = int(os.getenv("LOCAL_EMBEDDING_DIMENSIONS", "512"))
+# Lengths of the character n-grams the local embedder hashes
+LOCAL_EMBEDDING_NGRAM_RANGE = (2, 4)
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+# Dimensions requested from the embeddings API; None keeps the model's native
+# size (3072 for text-embedding-3-large)
+EMBEDDING_DIMENSIONS = _optional_int("EMBEDDING_DIMENSIONS")
+# Vectors in the vector store are truncated to this many leading dimensions and
+# renormalized (Matryoshka truncation); int8 codes of the full vectors are kept
+# in their metadata for re-ranking. None stores vectors as embedded.
+VECTOR_INDEX_DIMENSIONS = _optional_int("VECTOR_INDEX_DIMENSIONS")
+# Candidates fetched per requested document and re-ranked with full vectors
+# when stored vectors are compressed; 1 disables re-ranking
+KB_RERANK_CANDIDATES_FACTOR = int(os.getenv("KB_RERANK_CANDIDATES_FACTOR", "4"))
+
+# Yektanet API base URLs (override to point at a local fake server)
+YEKTANET_API_URL = os.getenv("YEKTANET_API_URL", "https://api.yektanet.com")
+YEKTANET_AD_MANAGEMENT_URL = os.getenv(
+    "YEKTANET_AD_MANAGEMENT_URL", "https://ad-management.yektanet.com"
+)
+YEKTANET_ACCOUNTS_URL = os.getenv(
+    "YEKTANET_ACCOUNTS_URL", "https://accounts.yektanet.com"
+)
+YEKTANET_ASSISTANT_URL = os.getenv(
+    "YEKTANET_ASSISTANT_URL", "https://assistant.yektanet.com"
+)
+
+# Yektanet API client settings
+YEKTANET_HTTP_CONNECT_TIMEOUT = float(os.getenv("YEKTANET_HTTP_CONNECT_TIMEOUT", "5"))
+YEKTANET_HTTP_READ_TIMEOUT = float(os.getenv("YEKTANET_HTTP_READ_TIMEOUT", "30"))
+YEKTANET_HTTP_MAX_RETRIES = int(os.getenv("YEKTANET_HTTP_MAX_RETRIES", "3"))
+YEKTANET_HTTP_BACKOFF_FACTOR = float(os.getenv("YEKTANET_HTTP_BACKOFF_FACTOR", "0.5"))
+YEKTANET_HTTP_POOL_SIZE = int(os.getenv("YEKTANET_HTTP_POOL_SIZE", "10"))
+# Seconds a publisher groups listing is trusted before it is fetched again
+PUBLISHER_GROUP_CACHE_TTL_SECONDS = int(
+    os.getenv("PUBLISHER_GROUP_CACHE_TTL_SECONDS", "3600")
+)
 
 # ============================================================================
 # Agent Configuration
@@ -65,6 +167,72 @@ CAMPAIGN_PLANNER_TABLE_NAME = "campaign_planner"
 KBGK_AGENT_TABLE_NAME = "kbgk_agent"
 CRAWLER_AGENT_TABLE_NAME = "crawler_agent"
 AGENT_DEBUG_MODE = True
+# Configured agents kept per (agent type, session); past this, the least
+# recently used agent of a type is rebound to the next session of that type
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "64"))
+# Keep-alive connection pool of each model's OpenAI client
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "20"))
+OPENAI_HTTP_KEEPALIVE_SECONDS = float(
+    os.getenv("OPENAI_HTTP_KEEPALIVE_SECONDS", "60")
+)
+
+# Crawled pages cache, keyed by normalized URL. Entries older than the TTL are
+# revalidated with ETag/Last-Modified before the page is crawled again; past
+# the size cap the least recently used pages are evicted.
+CRAWL_CACHE_PATH = os.getenv(
+    "CRAWL_CACHE_PATH", "app/pages/files/tmp/crawl_cache.sqlite"
+)
+CRAWL_CACHE_TTL_SECONDS = int(os.getenv("CRAWL_CACHE_TTL_SECONDS", "86400"))
+CRAWL_CACHE_MAX_BYTES = int(os.getenv("CRAWL_CACHE_MAX_BYTES", str(200 * 2**20)))
+
+# Landing page image discovery: images smaller than IMAGE_MIN_SIDE pixels on a
+# side are not used in ads. With IMAGE_LLM_RERANK_ENABLED the model reorders
+# the IMAGE_RERANK_CANDIDATES best images found by the heuristics.
+IMAGE_EXTRACTOR_TIMEOUT_SECONDS = float(
+    os.getenv("IMAGE_EXTRACTOR_TIMEOUT_SECONDS", "10")
+)
+IMAGE_MIN_SIDE = 300
+IMAGE_LLM_RERANK_ENABLED = (
+    os.getenv("IMAGE_LLM_RERANK_ENABLED", "false").lower() == "true"
+)
+IMAGE_RERANK_CANDIDATES = int(os.getenv("IMAGE_RERANK_CANDIDATES", "20"))
+# Image size probes: concurrent requests in total and per host, bytes read at
+# most to find the dimensions in the image header, and per-URL result cache
+IMAGE_PROBE_CONCURRENCY = int(os.getenv("IMAGE_PROBE_CONCURRENCY", "16"))
+IMAGE_PROBE_PER_HOST_CONCURRENCY = int(
+    os.getenv("IMAGE_PROBE_PER_HOST_CONCURRENCY", "4")
+)
+IMAGE_PROBE_MAX_BYTES = 64 * 1024
+IMAGE_PROBE_TIMEOUT_SECONDS = float(os.getenv("IMAGE_PROBE_TIMEOUT_SECONDS", "5"))
+IMAGE_PROBE_CACHE_SIZE = 4096
+IMAGE_PROBE_CACHE_TTL_SECONDS = 86400
+
+# ============================================================================
+# Task Consumer Configuration
+# ============================================================================
+
+# Seconds a claimed task stays reserved for a worker before others may reclaim it
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "300"))
+# Seconds between lease renewals while a task is being processed
+TASK_LEASE_RENEW_INTERVAL = TASK_LEASE_SECONDS // 3
+# Seconds before a task that made no progress is retried, doubled per retry
+TASK_RETRY_DELAY_SECONDS = int(os.getenv("TASK_RETRY_DELAY_SECONDS", "30"))
+TASK_RETRY_MAX_DELAY_SECONDS = int(os.getenv("TASK_RETRY_MAX_DELAY_SECONDS", "1800"))
+# Run tasks on an in-process worker pool instead of one at a time
+TASK_WORKER_POOL_ENABLED = (
+    os.getenv("TASK_WORKER_POOL_ENABLED", "false").lower() == "true"
+)
+# Maximum number of tasks of each type processed concurrently in pool mode
+TASK_CONCURRENCY = {
+    "generate_campaign_plan": int(os.getenv("GENERATE_CAMPAIGN_PLAN_CONCURRENCY", "2")),
+    "create_yektanet_campaign": int(
+        os.getenv("CREATE_YEKTANET_CAMPAIGN_CONCURRENCY", "4")
+    ),
+}
+
+
+# Maximum number of ads of one campaign created concurrently
+AD_CREATION_CONCURRENCY = int(os.getenv("AD_CREATION_CONCURRENCY", "4"))
 
 
 # ============================================================================
@@ -134,4 +302,14 @@ def get_mongodb_campaign_plans_collection() -> str:
 
 def get_mongodb_documents_collection() -> str:
     """Get the MongoDB Documents collection name."""
-    return MONGODB_DOCUMENTS_COLLECTION
\ No newline at end of file
+    return MONGODB_DOCUMENTS_COLLECTION
+
+
+def get_task_lease_seconds() -> int:
+    """Get the task lease duration in seconds."""
+    return TASK_LEASE_SECONDS
+
+
+def get_task_concurrency() -> dict[str, int]:
+    """Get the per task type concurrency limits of the worker pool."""
+    return dict(TASK_CONCURRENCY)
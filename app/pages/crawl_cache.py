@@ -0,0 +1,274 @@
+"""
+Crawled pages cache for CampaignGenie application.
+Keeps Crawl4ai results in SQLite keyed by normalized URL, so a landing page is
+crawled once per campaign lifecycle even though the first agent, the campaign
+planner and every feedback round ask for it again.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from agno.tools.crawl4ai import Crawl4aiTools
+
+from pages.config import (
+    CRAWL_CACHE_PATH,
+    CRAWL_CACHE_TTL_SECONDS,
+    CRAWL_CACHE_MAX_BYTES,
+)
+from pages.http_client import HttpClient
+
+# Query parameters that only track the visit and never change the page
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "_ga"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+revalidation_client = HttpClient(timeout=(5, 10), max_retries=1)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for cache keys: lowercase scheme and host, no
+    default port, fragment or tracking parameters, sorted query and no
+    trailing slash. URLs without a scheme are taken as https.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key.lower() not in TRACKING_PARAMS
+            and not key.lower().startswith("utm_")
+        )
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class CrawlCache:
+    """SQLite-backed page cache with TTL, revalidation and LRU size cap."""
+
+    def __init__(
+        self,
+        path: str = CRAWL_CACHE_PATH,
+        ttl_seconds: float = CRAWL_CACHE_TTL_SECONDS,
+        max_bytes: int = CRAWL_CACHE_MAX_BYTES,
+    ):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                content TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """The cached page of key, with its validators and fetch time."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, content, etag, last_modified, fetched_at FROM pages "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE pages SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            self._connection.commit()
+        url, content, etag, last_modified, fetched_at = row
+        return {
+            "url": url,
+            "content": content,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+        }
+
+    def put(
+        self,
+        key: str,
+        url: str,
+        content: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        now = time.time()
+        size = len(content.encode())
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages (key, url, content, etag, "
+                "last_modified, fetched_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, content, etag, last_modified, now, now, size),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def touch(self, key: str) -> None:
+        """Mark a revalidated page as fresh again."""
+        with self._lock:
+            now = time.time()
+            self._connection.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, key),
+            )
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used pages until the cache fits max_bytes."""
+        total = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM pages"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        evicted = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM pages ORDER BY accessed_at"
+        ).fetchall():
+            if total - freed <= self.max_bytes:
+                break
+            evicted.append((key,))
+            freed += size
+        self._connection.executemany("DELETE FROM pages WHERE key = ?", evicted)
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl_seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM pages")
+            self._connection.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages"
+            ).fetchone()
+        return {"pages": count, "bytes": size, "max_bytes": self.max_bytes}
+
+
+@lru_cache(maxsize=None)
+def get_crawl_cache(path: str = CRAWL_CACHE_PATH) -> CrawlCache:
+    """Get the process-wide crawl cache stored at path."""
+    return CrawlCache(path)
+
+
+def response_validators(headers: Optional[Dict]) -> Dict[str, Optional[str]]:
+    """ETag and Last-Modified among the response headers of a crawl."""
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    return {
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+    }
+
+
+def is_unchanged(url: str, entry: Dict) -> bool:
+    """
+    Whether the page is unchanged since it was cached, by a conditional GET.
+    Without validators the page is assumed to have changed.
+    """
+    headers = {}
+    if entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if not headers:
+        return False
+    try:
+        # Streamed, so a changed page's body is not downloaded here
+        response = revalidation_client.request(
+            "GET", url, endpoint="GET crawl", headers=headers, stream=True
+        )
+        response.close()
+    except Exception as e:
+        print(f"Could not revalidate {url}: {e}")
+        return False
+    return response.status_code == 304
+
+
+class CachedCrawl4aiTools(Crawl4aiTools):
+    """Crawl4aiTools whose web_crawler serves repeat crawls from the cache."""
+
+    def __init__(self, cache: Optional[CrawlCache] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache or get_crawl_cache()
+
+    def web_crawler(self, url: str, max_length: Optional[int] = None) -> str:
+        """
+        Use this function to get webpage contents using Crawl4AI.
+
+        Args:
+            url (str): The URL to crawl.
+            max_length (int, optional): The maximum length of the result.
+
+        Returns:
+            str: The results of the crawling.
+        """
+        if not url:
+            return super().web_crawler(url, max_length)
+        # Whole pages are cached, so every max_length shares one entry
+        key = normalize_url(url)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                return self.format_page(entry["content"], max_length)
+            if is_unchanged(url, entry):
+                self.cache.touch(key)
+                return self.format_page(entry["content"], max_length)
+
+        result = asyncio.run(self.crawl(url))
+        markdown = str(result.markdown or "") if result is not None else ""
+        if not getattr(result, "success", False) or not markdown:
+            return "No result"
+        # Validators come from the crawl's own response, no extra request
+        self.cache.put(
+            key,
+            url,
+            markdown,
+            **response_validators(getattr(result, "response_headers", None)),
+        )
+        return self.format_page(markdown, max_length)
+
+    async def crawl(self, url: str):
+        """The crawl4ai CrawlResult of a page, bypassing crawl4ai's own cache."""
+        from crawl4ai import AsyncWebCrawler, CacheMode
+
+        async with AsyncWebCrawler(thread_safe=True) as crawler:
+            return await crawler.arun(url=url, cache_mode=CacheMode.BYPASS)
+
+    def format_page(self, markdown: str, max_length: Optional[int] = None) -> str:
+        """The page as Crawl4aiTools.web_crawler returns it: truncated, no spaces."""
+        length = self.max_length or max_length
+        if length:
+            markdown = markdown[:length]
+        return markdown.replace(" ", "")
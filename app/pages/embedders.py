@@ -0,0 +1,148 @@
+"""
+Embedder backends for CampaignGenie application.
+The knowledge base embeds documents, passages and queries through the
+EMBEDDER_BACKEND embedder: the cached OpenAI embedder, or a deterministic
+local one that needs no network, for offline runs, tests and benchmarks.
+"""
+
+import math
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import List, Tuple
+
+from pages.config import (
+    get_openai_api_key,
+    OPENAI_BASE_URL,
+    EMBEDDER_BACKEND,
+    EMBEDDING_MODEL_ID,
+    EMBEDDING_DIMENSIONS,
+    LOCAL_EMBEDDING_DIMENSIONS,
+    LOCAL_EMBEDDING_NGRAM_RANGE,
+)
+from pages.text_utils import tokenize
+
+# Inflectional suffixes stripped for the stem feature, longest first
+PERSIAN_SUFFIXES = ("هایی", "ترین", "های", "ها", "تر", "ان", "ات", "ی")
+
+
+class Embedder:
+    """
+    Turns texts into embeddings.
+
+    The interface is the part of agno's embedders the knowledge base uses.
+    Embeddings of one embedder are only comparable with each other, so id and
+    dimensions identify the vector space.
+    """
+
+    id: str
+    dimensions: int
+
+    def get_embeddings(
+        self, texts: List[str], use_cache: bool = True
+    ) -> List[List[float]]:
+        """Embeddings of texts, in order. use_cache=False bypasses any cache."""
+        raise NotImplementedError
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.get_embeddings([text])[0]
+
+
+def persian_stem(token: str) -> str:
+    """Token without one common inflectional suffix, e.g. تبلیغات -> تبلیغ."""
+    for suffix in PERSIAN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: -len(suffix)]
+    return token
+
+
+def token_features(token: str, ngram_range: Tuple[int, int]) -> List[str]:
+    """The word, its stem and its character n-grams, padded at word edges."""
+    padded = f" {token} "
+    features = [f"w:{token}", f"s:{persian_stem(token)}"]
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        features += [f"c:{padded[i : i + n]}" for i in range(len(padded) - n + 1)]
+    return features
+
+
+@lru_cache(maxsize=100_000)
+def token_slots(
+    token: str, dimensions: int, ngram_range: Tuple[int, int]
+) -> Tuple[Tuple[int, int], ...]:
+    """
+    Hashed (index, sign) slots of a token's features. crc32 is stable across
+    processes, unlike hash().
+    """
+    slots = []
+    for feature in token_features(token, ngram_range):
+        digest = zlib.crc32(feature.encode())
+        slots.append((digest % dimensions, 1 if digest >> 31 else -1))
+    return tuple(slots)
+
+
+class LocalHashEmbedder(Embedder):
+    """
+    Deterministic embedder that runs locally: hashed features of the normalized
+    text (words, their stems and character n-grams within words) with
+    sublinear term frequencies, signed and L2-normalized.
+
+    Character n-grams make inflected and compound Persian words, spelling
+    variants and typos share most of their features. It has no notion of
+    synonyms, so retrieval quality is below the OpenAI embedder, but it is
+    stable across runs and machines and embeds thousands of texts per second.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = LOCAL_EMBEDDING_DIMENSIONS,
+        ngram_range: Tuple[int, int] = LOCAL_EMBEDDING_NGRAM_RANGE,
+    ):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+        self.id = f"local-hash-{ngram_range[0]}-{ngram_range[1]}"
+
+    def embed(self, text: str) -> List[float]:
+        counts = Counter()
+        for token, count in Counter(tokenize(text)).items():
+            for slot in token_slots(token, self.dimensions, self.ngram_range):
+                counts[slot] += count
+        vector = [0.0] * self.dimensions
+        for (index, sign), count in counts.items():
+            vector[index] += sign * (1.0 + math.log(count))
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+    def get_embeddings(
+        self, texts: List[str], use_cache: bool = True
+    ) -> List[List[float]]:
+        return [self.embed(text) for text in texts]
+
+
+@lru_cache(maxsize=None)
+def get_openai_embedder() -> Embedder:
+    """
+    Get the process-wide OpenAI embedder, creating it on first use.
+
+    Building the OpenAI client is slow and needs the OpenAI API key, so it is
+    deferred until something is embedded.
+    """
+    from pages.embedding_cache import CachedOpenAIEmbedder
+
+    embedder = CachedOpenAIEmbedder(
+        id=EMBEDDING_MODEL_ID,
+        base_url=OPENAI_BASE_URL,
+        api_key=get_openai_api_key(),
+    )
+    if EMBEDDING_DIMENSIONS:
+        embedder.dimensions = EMBEDDING_DIMENSIONS
+    return embedder
+
+
+@lru_cache(maxsize=None)
+def get_embedder(backend: str = EMBEDDER_BACKEND) -> Embedder:
+    """Get the process-wide embedder of a backend ("openai" or "local")."""
+    if backend == "openai":
+        return get_openai_embedder()
+    if backend == "local":
+        return LocalHashEmbedder()
+    raise ValueError(f"Unknown embedder backend: {backend}")
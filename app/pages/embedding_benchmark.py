@@ -0,0 +1,174 @@
+"""
+Embedding compression benchmark for CampaignGenie application.
+Measures how much retrieval quality each vector size / quantization costs on
+our corpus. Recall@k is measured against exact search with the full-precision
+embeddings, with and without re-ranking the candidates by the int8 full vectors
+that the knowledge base stores for re-ranking.
+
+Embeddings come from the embedding cache, so re-runs make no API calls.
+
+Usage (from the repository root):
+    PYTHONPATH=app python -m pages.embedding_benchmark
+    PYTHONPATH=app python -m pages.embedding_benchmark --dimensions 256 512 --k 5
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pages.config import get_documents_csv_path, KB_RERANK_CANDIDATES_FACTOR
+from pages.embedding_compression import (
+    normalize,
+    truncate_embedding,
+    quantize_int8,
+    dequantize_int8,
+)
+from pages.kb import get_embedder, _row_to_document
+
+DEFAULT_DIMENSIONS = [None, 1536, 1024, 512, 256, 128]
+QUANTIZATIONS = ["float32", "int8"]
+
+
+def load_corpus(csv_path: str) -> List[Dict]:
+    documents = [
+        _row_to_document(row) for row in pd.read_csv(csv_path).to_dict("records")
+    ]
+    return [
+        {"name": doc.name, "content": doc.content}
+        for doc in documents
+        if doc is not None
+    ]
+
+
+def compress(
+    vectors: np.ndarray, dimensions: Optional[int], quantization: str
+) -> np.ndarray:
+    """Truncate, renormalize and optionally (de)quantize vectors."""
+    compressed = []
+    for vector in vectors.tolist():
+        vector = normalize(truncate_embedding(vector, dimensions))
+        if quantization == "int8":
+            vector = dequantize_int8(*quantize_int8(vector))
+        compressed.append(vector)
+    return np.array(compressed, dtype=np.float32)
+
+
+def bytes_per_vector(dimensions: int, quantization: str) -> int:
+    # int8 codes plus one float32 scale per vector
+    return dimensions * 4 if quantization == "float32" else dimensions + 4
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def evaluate(
+    documents: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    dimensions_list: List[Optional[int]],
+    rerank_factor: int,
+) -> List[Dict]:
+    """Recall@k of every configuration against exact full-precision search."""
+    full_documents = compress(documents, None, "float32")
+    full_queries = compress(queries, None, "float32")
+    full_scores = full_queries @ full_documents.T
+    exact = top_k(full_scores, k)
+    rerank_scores = full_queries @ compress(documents, None, "int8").T
+
+    results = []
+    full_size = documents.shape[1]
+    for dimensions in dict.fromkeys(d or full_size for d in dimensions_list):
+        if dimensions > full_size:
+            continue
+        for quantization in QUANTIZATIONS:
+            scores = compress(queries, dimensions, "float32") @ compress(
+                documents, dimensions, quantization
+            ).T
+            for rerank in (False, True):
+                if rerank:
+                    candidates = top_k(scores, k * rerank_factor)
+                    reranked = np.take_along_axis(rerank_scores, candidates, axis=1)
+                    found = np.take_along_axis(
+                        candidates, top_k(reranked, k), axis=1
+                    )
+                else:
+                    found = top_k(scores, k)
+                recall = np.mean(
+                    [
+                        len(set(found[i]) & set(exact[i])) / k
+                        for i in range(len(queries))
+                    ]
+                )
+                size = bytes_per_vector(dimensions, quantization)
+                if rerank:
+                    # int8 full vectors stored next to the searched vectors
+                    size += bytes_per_vector(full_size, "int8")
+                results.append(
+                    {
+                        "dimensions": dimensions,
+                        "quantization": quantization,
+                        "rerank": rerank,
+                        f"recall@{k}": round(float(recall), 4),
+                        "bytes_per_vector": size,
+                        "corpus_mb": round(size * len(documents) / 2**20, 3),
+                        "mb_per_100k_documents": round(size * 100_000 / 2**20, 1),
+                    }
+                )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=get_documents_csv_path())
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        nargs="*",
+        default=DEFAULT_DIMENSIONS,
+        help="Stored vector sizes to compare (the full size is always included)",
+    )
+    parser.add_argument(
+        "--rerank-factor", type=int, default=KB_RERANK_CANDIDATES_FACTOR
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.csv)
+    # Document names are short, query-like descriptions of their content
+    query_texts = [doc["name"] for doc in corpus if doc["name"].strip()]
+    embedder = get_embedder()
+    documents = np.array(embedder.get_embeddings([doc["content"] for doc in corpus]))
+    queries = np.array(embedder.get_embeddings(query_texts))
+    k = min(args.k, len(corpus))
+    print(
+        f"{len(corpus)} documents, {len(query_texts)} queries, "
+        f"{documents.shape[1]} dimensions, k={k}"
+    )
+
+    results = evaluate(
+        documents, queries, k, [None, *args.dimensions], args.rerank_factor
+    )
+    print(
+        f"{'dims':>6} {'quant':>8} {'rerank':>7} {f'recall@{k}':>10} "
+        f"{'bytes/vec':>10} {'MB/100k docs':>13}"
+    )
+    for row in results:
+        print(
+            f"{row['dimensions']:>6} {row['quantization']:>8} "
+            f"{str(row['rerank']):>7} {row[f'recall@{k}']:>10.4f} "
+            f"{row['bytes_per_vector']:>10} {row['mb_per_100k_documents']:>13}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Persistent embedding cache for CampaignGenie application.
+Stores embeddings in SQLite keyed by (model, content hash), so re-adding,
+re-ingesting or rebuilding the knowledge base does not embed unchanged text again.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from array import array
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, List, Tuple, Dict, Any
+
+from agno.embedder.openai import OpenAIEmbedder
+
+from pages.config import EMBEDDING_CACHE_PATH
+
+
+def content_hash(text: str) -> str:
+    """Hash of the exact text that is embedded."""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store, safe to share between threads."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def _encode(embedding: List[float]) -> bytes:
+        return array("f", embedding).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Get the cached embeddings of the given content hashes."""
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on bound parameters
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i : i + 500]
+                rows = self._connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? "
+                    f"AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                found.update({hash: self._decode(vector) for hash, vector in rows})
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        """Store embeddings by content hash."""
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) "
+                "VALUES (?, ?, ?)",
+                [(model, hash, self._encode(vector)) for hash, vector in items.items()],
+            )
+            self._connection.commit()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [content_hash(text)]).get(content_hash(text))
+
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        self.put_many(model, {content_hash(text): embedding})
+
+    def count(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM embeddings")
+            return row.fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: str = EMBEDDING_CACHE_PATH) -> EmbeddingCache:
+    """Get the process-wide embedding cache stored at path."""
+    return EmbeddingCache(path)
+
+
+@dataclass
+class CachedOpenAIEmbedder(OpenAIEmbedder):
+    """OpenAIEmbedder that only calls the API for texts missing from the cache."""
+
+    cache_path: str = EMBEDDING_CACHE_PATH
+
+    @property
+    def cache_model(self) -> str:
+        """Cache namespace; vectors of different models or sizes never mix."""
+        return f"{self.id}:{self.dimensions}"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return get_embedding_cache(self.cache_path)
+
+    def get_embeddings(
+        self, texts: List[str], use_cache: bool = True
+    ) -> List[List[float]]:
+        """
+        Embed many texts, with one API call for all cache misses.
+        With use_cache=False the cache is neither read nor written.
+        """
+        if not use_cache:
+            response = self.response(texts)
+            return [
+                item.embedding for item in sorted(response.data, key=lambda d: d.index)
+            ]
+        hashes = [content_hash(text) for text in texts]
+        cached = self.cache.get_many(self.cache_model, list(set(hashes)))
+        missing = {
+            hash: text for hash, text in zip(hashes, texts) if hash not in cached
+        }
+        if missing:
+            response = self.response(list(missing.values()))
+            embedded = {
+                hash: item.embedding
+                for hash, item in zip(
+                    missing, sorted(response.data, key=lambda d: d.index)
+                )
+            }
+            self.cache.put_many(self.cache_model, embedded)
+            cached.update(embedded)
+        return [cached[hash] for hash in hashes]
+
+    def get_embedding(self, text: str) -> List[float]:
+        try:
+            return self.get_embeddings([text])[0]
+        except Exception as e:
+            print(f"Error getting embedding: {e}")
+            return []
+
+    def get_embedding_and_usage(
+        self, text: str
+    ) -> Tuple[List[float], Optional[Dict[str, Any]]]:
+        cached = self.cache.get(self.cache_model, text)
+        if cached is not None:
+            return cached, None
+        embedding, usage = super().get_embedding_and_usage(text)
+        if embedding:
+            self.cache.put(self.cache_model, text, embedding)
+        return embedding, usage
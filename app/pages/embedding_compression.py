@@ -0,0 +1,54 @@
+"""
+Embedding compression helpers for CampaignGenie application.
+Matryoshka truncation of the vectors searched in the vector store, and int8
+scalar quantization of the full-precision embeddings stored next to them (in
+their metadata) for re-ranking. The embedding benchmark compares both.
+"""
+
+import base64
+import math
+from array import array
+from typing import List, Optional, Tuple
+
+
+def normalize(embedding: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in embedding))
+    return [value / norm for value in embedding] if norm else list(embedding)
+
+
+def truncate_embedding(
+    embedding: List[float], dimensions: Optional[int]
+) -> List[float]:
+    """
+    Keep the leading dimensions of a Matryoshka embedding (text-embedding-3
+    models are trained so that prefixes are embeddings themselves) and
+    renormalize it for cosine search. None keeps the embedding as is.
+    """
+    if dimensions is None or dimensions >= len(embedding):
+        return list(embedding)
+    return normalize(embedding[:dimensions])
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def quantize_int8(embedding: List[float]) -> Tuple[List[int], float]:
+    """Symmetric int8 quantization; returns the codes and their scale."""
+    scale = max((abs(value) for value in embedding), default=0.0) / 127 or 1.0
+    return [round(value / scale) for value in embedding], scale
+
+
+def dequantize_int8(codes: List[int], scale: float) -> List[float]:
+    return [code * scale for code in codes]
+
+
+def pack_int8(codes: List[int]) -> str:
+    """int8 codes as a base64 string, one byte per dimension."""
+    return base64.b64encode(array("b", codes).tobytes()).decode("ascii")
+
+
+def unpack_int8(packed: str) -> List[int]:
+    return array("b", base64.b64decode(packed)).tolist()
@@ -0,0 +1,279 @@
+"""
+Shared HTTP client for CampaignGenie application.
+Keeps one keep-alive connection pool per host, applies default timeouts, retries
+transient failures with jittered exponential backoff and records per-endpoint
+metrics.
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Optional, Dict, Any, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Statuses that mean the request was not processed, so even a POST can be resent.
+# Not 502: the gateway may have passed the request on before failing.
+SAFE_TO_RESEND_STATUSES = {429, 503}
+# Failures to open a connection: the request was never sent
+NOT_SENT_ERRORS: Tuple[type, ...] = (
+    requests.exceptions.ConnectTimeout,
+    NewConnectionError,
+)
+
+
+def error_chain(error: BaseException):
+    """An error and the errors it wraps (causes, urllib3 reasons and args)."""
+    seen = set()
+    pending = [error]
+    while pending:
+        current = pending.pop()
+        if current is None or id(current) in seen:
+            continue
+        seen.add(id(current))
+        yield current
+        pending += [
+            current.__cause__,
+            current.__context__,
+            getattr(current, "reason", None),
+            *(arg for arg in current.args if isinstance(arg, BaseException)),
+        ]
+
+
+def request_not_sent(
+    error: BaseException, not_sent_errors: Tuple[type, ...] = NOT_SENT_ERRORS
+) -> bool:
+    """Whether a failed request certainly never reached the server."""
+    return any(isinstance(e, not_sent_errors) for e in error_chain(error))
+
+
+class RetryPolicy:
+    """Decides which failures are retried and how long to back off."""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 10.0,
+        retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504),
+    ):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = set(retry_statuses)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before the next attempt, honoring Retry-After when present."""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # Full jitter: spreads retries of concurrent workers over the window
+        window = min(self.max_backoff, self.backoff_factor * 2**attempt)
+        return random.uniform(0, window)
+
+    def should_retry_status(self, method: str, status_code: int, attempt: int) -> bool:
+        """Whether a response status is worth another attempt for this method."""
+        if attempt >= self.max_retries or status_code not in self.retry_statuses:
+            return False
+        return method in IDEMPOTENT_METHODS or status_code in SAFE_TO_RESEND_STATUSES
+
+    def should_retry_error(
+        self,
+        method: str,
+        error: BaseException,
+        attempt: int,
+        not_sent_errors: Tuple[type, ...] = NOT_SENT_ERRORS,
+    ) -> bool:
+        """
+        Whether a connection error or timeout is worth another attempt.
+        Non-idempotent requests are only resent when the connection could not
+        be opened: a dropped connection or read timeout may come after the
+        server acted on the request.
+        """
+        if attempt >= self.max_retries:
+            return False
+        if method in IDEMPOTENT_METHODS:
+            return True
+        return request_not_sent(error, not_sent_errors)
+
+
+class EndpointMetrics:
+    """Thread-safe request counters and latencies per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = defaultdict(self._empty_metrics)
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
+        return {
+            "requests": 0,
+            "retries": 0,
+            "errors": 0,
+            "statuses": defaultdict(int),
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+        }
+
+    def record(
+        self,
+        endpoint: str,
+        latency: float,
+        status_code: Optional[int] = None,
+        retried: bool = False,
+    ) -> None:
+        with self._lock:
+            metrics = self._metrics[endpoint]
+            metrics["requests"] += 1
+            metrics["total_latency"] += latency
+            metrics["max_latency"] = max(metrics["max_latency"], latency)
+            if status_code is None:
+                metrics["errors"] += 1
+            else:
+                metrics["statuses"][status_code] += 1
+                if status_code >= 400:
+                    metrics["errors"] += 1
+            if retried:
+                metrics["retries"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint request counts, statuses and latencies."""
+        with self._lock:
+            snapshot = {}
+            for endpoint, metrics in self._metrics.items():
+                snapshot[endpoint] = {
+                    **metrics,
+                    "statuses": dict(metrics["statuses"]),
+                    "avg_latency": metrics["total_latency"] / metrics["requests"],
+                }
+            return snapshot
+
+
+def endpoint_name(method: str, url: str) -> str:
+    """Default metrics key of a request: "<METHOD> <host><path>"."""
+    parts = urlsplit(url)
+    return f"{method} {parts.netloc}{parts.path}"
+
+
+def rewind_files(files: Optional[Dict[str, Any]]) -> None:
+    """Seek multipart file objects back to the start before resending them."""
+    for file in (files or {}).values():
+        if isinstance(file, tuple) and hasattr(file[1], "seek"):
+            file[1].seek(0)
+
+
+class HttpClient:
+    """Pooled, retrying HTTP client shared by all calls to a set of hosts."""
+
+    def __init__(
+        self,
+        timeout: Union[float, Tuple[float, float]] = (5, 30),
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 10.0,
+        pool_maxsize: int = 10,
+        retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504),
+        default_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.default_headers = default_headers or {}
+        self.retry_policy = RetryPolicy(
+            max_retries, backoff_factor, max_backoff, retry_statuses
+        )
+        self.metrics = EndpointMetrics()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        """Get the keep-alive session of the URL's host."""
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                session.headers.update(self.default_headers)
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0
+                )
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def request(
+        self, method: str, url: str, endpoint: Optional[str] = None, **kwargs
+    ) -> requests.Response:
+        """
+        Send a request through the host's pooled session.
+
+        Connection failures and retryable statuses (429/5xx) are retried with
+        jittered backoff. Non-idempotent requests are only resent when the
+        server cannot have processed them.
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            endpoint: Metrics key, defaults to "<METHOD> <host><path>"
+            **kwargs: Passed to requests.Session.request
+
+        Returns:
+            requests.Response: The last response received
+        """
+        method = method.upper()
+        endpoint = endpoint or endpoint_name(method, url)
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session_for(url)
+
+        attempt = 0
+        while True:
+            rewind_files(kwargs.get("files"))
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry = self.retry_policy.should_retry_error(method, e, attempt)
+                latency = time.perf_counter() - start
+                self.metrics.record(endpoint, latency, retried=retry)
+                if not retry:
+                    raise
+                print(f"{endpoint}: {e}, retrying")
+                time.sleep(self.retry_policy.backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            retry = self.retry_policy.should_retry_status(
+                method, response.status_code, attempt
+            )
+            self.metrics.record(
+                endpoint, time.perf_counter() - start, response.status_code, retry
+            )
+            if not retry:
+                return response
+            print(f"{endpoint}: status {response.status_code}, retrying")
+            time.sleep(
+                self.retry_policy.backoff_delay(
+                    attempt, response.headers.get("Retry-After")
+                )
+            )
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot of per-endpoint request counts, statuses and latencies."""
+        return self.metrics.snapshot()
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
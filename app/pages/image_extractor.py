@@ -0,0 +1,260 @@
+"""
+Landing page image extractor for CampaignGenie application.
+Finds the images of a page by parsing its HTML (img, srcset, picture,
+og:image and CSS backgrounds) and ranks them by cheap heuristics, so image
+discovery for ads costs one page fetch instead of a crawl and an LLM pass.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Union
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from pages.config import (
+    MINI_GPT_MODEL_ID,
+    IMAGE_EXTRACTOR_TIMEOUT_SECONDS,
+    IMAGE_MIN_SIDE,
+    IMAGE_RERANK_CANDIDATES,
+)
+from pages.http_client import HttpClient
+from pages.text_utils import tokenize
+
+CSS_URL_RE = re.compile(r"url\(\s*['\"]?([^'\")]+?)['\"]?\s*\)", re.IGNORECASE)
+# Images that are rarely usable in an ad
+UNLIKELY_IMAGE_RE = re.compile(
+    r"icon|sprite|pixel|spacer|avatar|badge|flag|placeholder|loader|loading|"
+    r"blank|emoji|captcha|logo",
+    re.IGNORECASE,
+)
+OG_IMAGE_KEYS = {"og:image", "og:image:url", "og:image:secure_url", "twitter:image"}
+LAZY_SRC_ATTRIBUTES = ("src", "data-src", "data-lazy-src", "data-original")
+# Base score per place an image was found in
+SOURCE_SCORES = {
+    "og:image": 3.0,
+    "picture": 1.5,
+    "img": 1.0,
+    "css": 0.5,
+}
+BROWSER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml",
+}
+
+page_client = HttpClient(
+    timeout=(5, IMAGE_EXTRACTOR_TIMEOUT_SECONDS),
+    max_retries=1,
+    default_headers=BROWSER_HEADERS,
+)
+
+
+@dataclass
+class ImageCandidate:
+    url: str
+    source: str
+    alt: str = ""
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # Order of appearance in the page, from 0
+    position: int = 0
+    score: float = 0.0
+
+
+def parse_dimension(value) -> Optional[int]:
+    """Pixels of a width/height attribute such as "640" or "640px"."""
+    match = re.match(r"\s*(\d+)", str(value or ""))
+    return int(match.group(1)) if match else None
+
+
+def largest_from_srcset(srcset: str) -> Optional[tuple]:
+    """(url, width) of the widest (or highest density) srcset candidate."""
+    best = None
+    for item in srcset.split(","):
+        parts = item.split()
+        if not parts:
+            continue
+        descriptor = parts[1] if len(parts) > 1 else "1x"
+        size = parse_dimension(descriptor) or 1
+        width = size if descriptor.endswith("w") else None
+        rank = size if width else size * 1000
+        if best is None or rank > best[2]:
+            best = (parts[0], width, rank)
+    return best[:2] if best else None
+
+
+def extract_images(html: Union[str, bytes], page_url: str) -> List[ImageCandidate]:
+    """
+    All image URLs referenced by a page, absolute, in order of appearance.
+    Given bytes, the encoding is detected from the page's <meta charset>.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    base = soup.find("base", href=True)
+    base_url = urljoin(page_url, base["href"]) if base else page_url
+    candidates: List[ImageCandidate] = []
+
+    def add(url: Optional[str], source: str, **kwargs) -> None:
+        if not url or url.strip().startswith("data:"):
+            return
+        candidates.append(
+            ImageCandidate(
+                url=urljoin(base_url, url.strip()),
+                source=source,
+                position=len(candidates),
+                **kwargs,
+            )
+        )
+
+    for meta in soup.find_all("meta"):
+        key = (meta.get("property") or meta.get("name") or "").lower()
+        if key in OG_IMAGE_KEYS:
+            add(meta.get("content"), "og:image")
+    for link in soup.find_all("link", rel="image_src", href=True):
+        add(link["href"], "og:image")
+
+    # One pass in document order, so positions follow the page layout
+    for element in soup.find_all(True):
+        if element.get("style"):
+            for url in CSS_URL_RE.findall(element["style"]):
+                add(url, "css", alt=element.get("aria-label") or "")
+        if element.name == "style":
+            for url in CSS_URL_RE.findall(element.get_text()):
+                add(url, "css")
+            continue
+        if element.name not in ("img", "source"):
+            continue
+        in_picture = element.find_parent("picture") is not None
+        if element.name == "source" and not in_picture:
+            continue  # <source> of audio/video
+        source = "picture" if in_picture else "img"
+        alt = element.get("alt") or element.get("title") or ""
+        width = parse_dimension(element.get("width"))
+        height = parse_dimension(element.get("height"))
+        srcset = element.get("srcset") or element.get("data-srcset")
+        largest = largest_from_srcset(srcset) if srcset else None
+        if largest:
+            url, srcset_width = largest
+            add(url, source, alt=alt, width=srcset_width or width, height=height)
+        else:
+            src = next(
+                (element.get(a) for a in LAZY_SRC_ATTRIBUTES if element.get(a)), None
+            )
+            add(src, source, alt=alt, width=width, height=height)
+    return candidates
+
+
+def score_image(candidate: ImageCandidate, business_terms: set, count: int) -> float:
+    """
+    Heuristic usefulness of an image for ads: where it was found, its declared
+    size, how early it appears and how much its alt text and file name share
+    with the business name.
+    """
+    score = SOURCE_SCORES.get(candidate.source, 0.0)
+    if candidate.width and candidate.height:
+        if min(candidate.width, candidate.height) >= IMAGE_MIN_SIDE:
+            score += 2.0
+        else:
+            score -= 3.0
+    elif candidate.width:
+        score += 1.0 if candidate.width >= IMAGE_MIN_SIDE else -2.0
+    # Hero images come first
+    score += 1.5 * (1 - candidate.position / max(count, 1))
+    if business_terms:
+        path = urlsplit(candidate.url).path
+        terms = set(tokenize(f"{candidate.alt} {re.sub(r'[-_/.]', ' ', path)}"))
+        score += 2.0 * len(business_terms & terms) / len(business_terms)
+    if UNLIKELY_IMAGE_RE.search(candidate.url) or UNLIKELY_IMAGE_RE.search(
+        candidate.alt
+    ):
+        score -= 2.0
+    if urlsplit(candidate.url).path.lower().endswith((".svg", ".gif", ".ico")):
+        score -= 1.5
+    return score
+
+
+def rank_images(
+    candidates: List[ImageCandidate], business_name: str = ""
+) -> List[ImageCandidate]:
+    """Distinct candidates, best first; an image keeps its best score."""
+    business_terms = set(tokenize(business_name))
+    best = {}
+    for candidate in candidates:
+        candidate.score = score_image(candidate, business_terms, len(candidates))
+        if candidate.url not in best or candidate.score > best[candidate.url].score:
+            best[candidate.url] = candidate
+    return sorted(best.values(), key=lambda c: c.score, reverse=True)
+
+
+def fetch_page(url: str) -> Optional[bytes]:
+    """
+    Undecoded HTML of a page, or None when it can not be fetched. Left to
+    BeautifulSoup to decode: requests falls back to ISO-8859-1 without a
+    charset in Content-Type, which garbles Persian alt text.
+    """
+    try:
+        response = page_client.get(url, endpoint="GET landing page")
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Could not fetch {url}: {e}")
+        return None
+    if "html" not in response.headers.get("Content-Type", "html"):
+        return None
+    return response.content
+
+
+def rerank_with_llm(
+    candidates: List[ImageCandidate], business_name: str
+) -> List[ImageCandidate]:
+    """
+    Let the model reorder the top candidates by usefulness for ads. The
+    heuristic order is kept when the model fails or returns garbage.
+    """
+    from pages.agent_factory import get_openai_client
+
+    top = candidates[:IMAGE_RERANK_CANDIDATES]
+    listing = "\n".join(
+        f"{i}. {c.url} (alt: {c.alt or '-'})" for i, c in enumerate(top)
+    )
+    try:
+        response = get_openai_client(MINI_GPT_MODEL_ID).chat.completions.create(
+            model=MINI_GPT_MODEL_ID,
+            response_format={"type": "json_object"},
+            messages=[
+                {
+                    "role": "user",
+                    "content": (
+                        f"Business: {business_name}\n"
+                        f"Images from its landing page:\n{listing}\n\n"
+                        "Order the images by how useful they are for an ad of "
+                        "this business, most useful first. Reply as JSON: "
+                        '{"order": [indices]}'
+                    ),
+                }
+            ],
+        )
+        order = json.loads(response.choices[0].message.content)["order"]
+    except Exception as e:
+        print(f"Image re-ranking failed: {e}")
+        return candidates
+    ranked = [
+        top[i] for i in dict.fromkeys(order) if isinstance(i, int) and 0 <= i < len(top)
+    ]
+    ranked_urls = {c.url for c in ranked}
+    return ranked + [c for c in candidates if c.url not in ranked_urls]
+
+
+def find_landing_images(
+    url: str, business_name: str = "", llm_rerank: bool = False
+) -> List[ImageCandidate]:
+    """Images of a landing page ranked for ad use, best first."""
+    html = fetch_page(url)
+    if html is None:
+        return []
+    ranked = rank_images(extract_images(html, url), business_name)
+    if llm_rerank and ranked:
+        ranked = rerank_with_llm(ranked, business_name)
+    return ranked
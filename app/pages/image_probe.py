@@ -0,0 +1,134 @@
+"""
+Image size probing for CampaignGenie application.
+Reads only the header bytes of candidate images, concurrently and with a
+per-host limit, to find which are large enough for ads without downloading
+them.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from pages.cache import TTLCache
+from pages.config import (
+    IMAGE_MIN_SIDE,
+    IMAGE_PROBE_CONCURRENCY,
+    IMAGE_PROBE_PER_HOST_CONCURRENCY,
+    IMAGE_PROBE_MAX_BYTES,
+    IMAGE_PROBE_TIMEOUT_SECONDS,
+    IMAGE_PROBE_CACHE_SIZE,
+    IMAGE_PROBE_CACHE_TTL_SECONDS,
+)
+from pages.http_client import HttpClient
+from pages.image_extractor import BROWSER_HEADERS
+
+CHUNK_SIZE = 4096
+
+probe_client = HttpClient(
+    timeout=(3, IMAGE_PROBE_TIMEOUT_SECONDS),
+    max_retries=1,
+    pool_maxsize=IMAGE_PROBE_PER_HOST_CONCURRENCY,
+    default_headers={**BROWSER_HEADERS, "Accept": "image/*"},
+)
+probe_executor = ThreadPoolExecutor(
+    max_workers=IMAGE_PROBE_CONCURRENCY, thread_name_prefix="image-probe"
+)
+# url -> (width, height) of the URLs that were read as images
+probe_cache = TTLCache(IMAGE_PROBE_CACHE_SIZE, IMAGE_PROBE_CACHE_TTL_SECONDS)
+
+host_semaphores: Dict[str, threading.Semaphore] = {}
+host_semaphores_lock = threading.Lock()
+
+
+def host_semaphore(url: str) -> threading.Semaphore:
+    """The semaphore limiting concurrent probes of the URL's host."""
+    host = urlsplit(url).netloc.lower()
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.Semaphore(
+                IMAGE_PROBE_PER_HOST_CONCURRENCY
+            )
+        return host_semaphores[host]
+
+
+def read_image_size(chunks, max_bytes: int = IMAGE_PROBE_MAX_BYTES):
+    """
+    (width, height) of an image from its leading bytes, or None if they are not
+    an image PIL can read within max_bytes.
+    """
+    from PIL import ImageFile
+
+    parser = ImageFile.Parser()
+    read = 0
+    for chunk in chunks:
+        try:
+            parser.feed(chunk)
+        except Exception:
+            return None
+        if parser.image is not None:
+            return parser.image.size
+        read += len(chunk)
+        if read >= max_bytes:
+            break
+    return None
+
+
+def probe_image_size(url: str) -> Optional[Tuple[int, int]]:
+    """
+    Dimensions of the image at url, read from its header bytes only: a range
+    request, streamed and closed as soon as the size is known, so servers that
+    ignore Range do not send the whole image either. Sizes are cached per URL;
+    failures are not, since truncated headers, error pages served with 200 and
+    network errors may all go away.
+    """
+    cached = probe_cache.get(url)
+    if cached is not None:
+        return cached
+    with host_semaphore(url):
+        try:
+            response = probe_client.get(
+                url,
+                endpoint="GET image probe",
+                headers={"Range": f"bytes=0-{IMAGE_PROBE_MAX_BYTES - 1}"},
+                stream=True,
+            )
+            try:
+                response.raise_for_status()
+                size = read_image_size(response.iter_content(CHUNK_SIZE))
+            finally:
+                response.close()
+        except Exception as e:
+            print(f"Could not probe {url}: {e}")
+            return None
+    if size is not None:
+        probe_cache.set(url, size)
+    return size
+
+
+def probe_images(
+    urls: List[str],
+    max_images: Optional[int] = None,
+    min_side: int = IMAGE_MIN_SIDE,
+) -> List[Tuple[str, int, int]]:
+    """
+    (url, width, height) of the first max_images URLs, in the order of urls
+    (best ranked first), that are images with both sides at least min_side.
+    Probes run concurrently, but results are taken in rank order, so a
+    lower-ranked image that answers first never displaces a better one; the
+    remaining probes are cancelled once enough images are found.
+    """
+    urls = list(dict.fromkeys(urls))
+    futures = [probe_executor.submit(probe_image_size, url) for url in urls]
+    images = []
+    try:
+        for url, future in zip(urls, futures):
+            size = future.result()
+            if size and min(size) >= min_side:
+                images.append((url, *size))
+                if max_images and len(images) >= max_images:
+                    break
+    finally:
+        for future in futures:
+            future.cancel()
+    return images
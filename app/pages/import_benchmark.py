@@ -0,0 +1,128 @@
+"""
+Import-time benchmark for CampaignGenie application.
+Imports each module in a fresh interpreter with `python -X importtime` and
+reports its total import time and the slowest imports it pulls in, so startup
+regressions of Streamlit pages and the task consumer stay visible.
+
+Usage (from the repository root):
+    PYTHONPATH=app python -m pages.import_benchmark
+    PYTHONPATH=app python -m pages.import_benchmark pages.kb --top 20 --max-seconds 1
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+# Modules imported at startup by the Streamlit pages and the task consumer
+DEFAULT_MODULES = [
+    "pages.config",
+    "pages.mongodb_utils",
+    "pages.yektanet_utils",
+    "pages.kb",
+    "pages.agents",
+    "pages.task_consumer",
+]
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    Parse `-X importtime` output lines of the form
+    "import time:  self [us] | cumulative | imported package".
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line
+        imports.append(
+            {
+                "self_us": int(fields[0]),
+                "cumulative_us": int(fields[1]),
+                "module": fields[2].strip(),
+                "depth": (len(fields[2]) - len(fields[2].lstrip())) // 2,
+            }
+        )
+    return imports
+
+
+def run_importtime(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+    )
+
+
+def startup_modules() -> set:
+    """Modules the interpreter imports before running any code, e.g. site."""
+    return {item["module"] for item in parse_importtime(run_importtime("pass").stderr)}
+
+
+def measure_import(module: str, baseline: set = frozenset()) -> Dict:
+    """Import module in a fresh interpreter and collect its import times."""
+    result = run_importtime(f"import {module}")
+    imports = [
+        item
+        for item in parse_importtime(result.stderr)
+        if item["module"] not in baseline
+    ]
+    # Top-level entries are the imports triggered directly by the statement
+    top_level = [item for item in imports if item["depth"] == 0]
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1]
+        if result.returncode
+        else None,
+        "total_seconds": sum(item["cumulative_us"] for item in top_level) / 1e6,
+        "imports": imports,
+    }
+
+
+def print_report(measurement: Dict, top: int) -> None:
+    status = "" if measurement["ok"] else f"  FAILED: {measurement['error']}"
+    print(f"\n{measurement['module']}: {measurement['total_seconds']:.3f}s{status}")
+    slowest = sorted(
+        measurement["imports"], key=lambda item: item["cumulative_us"], reverse=True
+    )[:top]
+    for item in slowest:
+        print(
+            f"  {item['cumulative_us'] / 1e3:9.1f} ms cumulative "
+            f"{item['self_us'] / 1e3:8.1f} ms self  {item['module']}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument(
+        "--top", type=int, default=10, help="Slowest imports listed per module"
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Exit with an error if any module takes longer to import",
+    )
+    args = parser.parse_args()
+
+    baseline = startup_modules()
+    exit_code = 0
+    for module in args.modules:
+        measurement = measure_import(module, baseline)
+        print_report(measurement, args.top)
+        if not measurement["ok"]:
+            exit_code = 1
+        elif args.max_seconds and measurement["total_seconds"] > args.max_seconds:
+            print(f"  exceeds the {args.max_seconds:.3f}s budget")
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
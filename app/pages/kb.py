@@ -1,52 +1,533 @@
-import pandas as pd
+import argparse
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import quote_plus
+from functools import lru_cache
 from typing import Optional, List, Dict
 
 from agno.knowledge.document import DocumentKnowledgeBase
 from agno.document import Document
-from agno.vectordb.chroma import ChromaDb
-from agno.embedder.openai import OpenAIEmbedder
+from pages.cache import TTLCache
+from pages.text_utils import (
+    normalize_text,
+    tokenize,
+    estimate_tokens,
+    split_into_passages,
+)
+from pages.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from pages.vector_store import VectorStore, get_vector_store
+from pages import embedders
+from pages.embedding_compression import (
+    normalize,
+    truncate_embedding,
+    cosine_similarity,
+    quantize_int8,
+    dequantize_int8,
+    pack_int8,
+    unpack_int8,
+)
 from pages.models import CampaignRequest, DocumentDB
-from pages.mongodb_utils import insert_document
+from pages.mongodb_utils import (
+    insert_document,
+    upsert_documents as upsert_documents_to_mongo,
+    delete_duplicate_documents,
+    document_hash,
+    fetch_documents,
+)
 from pages.config import (
-    get_vector_db_uri,
     VECTOR_DB_TABLE_NAME,
-    OPENAI_BASE_URL,
-    get_openai_api_key,
-    EMBEDDING_MODEL_ID,
+    EMBEDDER_BACKEND,
+    EMBEDDING_DIMENSIONS,
+    LOCAL_EMBEDDING_DIMENSIONS,
+    VECTOR_INDEX_DIMENSIONS,
+    KB_RERANK_CANDIDATES_FACTOR,
+    KB_INGEST_CHUNK_SIZE,
+    KB_EMBEDDING_BATCH_SIZE,
+    KB_INGEST_CONCURRENCY,
+    KB_QUERY_CACHE_SIZE,
+    KB_QUERY_CACHE_TTL_SECONDS,
+    KB_RETRIEVAL_CACHE_SIZE,
+    KB_RETRIEVAL_CACHE_TTL_SECONDS,
+    KB_QUERY_CACHE_DISK_ENABLED,
+    KB_HYBRID_CANDIDATES,
+    KB_RRF_K,
+    KB_QUERY_EMBEDDING_TIMEOUT_SECONDS,
+    KB_PASSAGE_COLLECTION_NAME,
+    KB_PASSAGE_MAX_CHARS,
+    KB_PASSAGE_OVERLAP_CHARS,
+    KB_PASSAGES_PER_QUERY,
+    PLANNER_CONTEXT_TOKEN_BUDGET,
+    KB_CHARS_PER_TOKEN,
 )
 
-knowledge_base = DocumentKnowledgeBase(
-    documents=[],
-    vector_db=ChromaDb(
-        collection=VECTOR_DB_TABLE_NAME,
-        path=get_vector_db_uri(),
-        persistent_client=True,
-        embedder=OpenAIEmbedder(
-            id=EMBEDDING_MODEL_ID,
-            base_url=OPENAI_BASE_URL,
-            api_key=get_openai_api_key(),
-        ),
-    ),
-)
 
+class CachedDocumentKnowledgeBase(DocumentKnowledgeBase):
+    """DocumentKnowledgeBase whose search goes through the query caches."""
+
+    def search(
+        self,
+        query: str,
+        num_documents: Optional[int] = None,
+        filters: Optional[Dict] = None,
+    ) -> List[Document]:
+        return cached_search(query, num_documents or self.num_documents, filters)
+
+
+# Caches for repeated planner / agent queries. Entries are dropped when this
+# process adds documents; other processes see new documents after the TTL.
+query_embedding_cache = TTLCache(KB_QUERY_CACHE_SIZE, KB_QUERY_CACHE_TTL_SECONDS)
+retrieval_cache = TTLCache(KB_RETRIEVAL_CACHE_SIZE, KB_RETRIEVAL_CACHE_TTL_SECONDS)
+
+# Query embeddings run here so a slow embeddings API can be timed out
+query_embedding_executor = ThreadPoolExecutor(max_workers=4)
+
+
+@lru_cache(maxsize=None)
+def get_knowledge_base() -> CachedDocumentKnowledgeBase:
+    """
+    Get the process-wide knowledge base, creating it on first use.
+
+    Its searches go through the VECTOR_DB_BACKEND vector store, so it has no
+    agno vector_db of its own.
+    """
+    return CachedDocumentKnowledgeBase(documents=[])
+
+
+def get_embedder():
+    """Get the process-wide embedder, of the EMBEDDER_BACKEND backend."""
+    return embedders.get_embedder()
+
+
+def vector_collection_name(name: str) -> str:
+    """
+    Name of a collection for the configured embedder and vector size. Vectors
+    of other embedders or sizes live in other collections, so changing
+    EMBEDDER_BACKEND, EMBEDDING_DIMENSIONS or VECTOR_INDEX_DIMENSIONS only needs
+    rebuild_knowledge_base_from_mongo, which takes unchanged OpenAI embeddings
+    from the embedding cache.
+    """
+    if EMBEDDER_BACKEND == "openai":
+        dimensions = VECTOR_INDEX_DIMENSIONS or EMBEDDING_DIMENSIONS
+        return f"{name}_d{dimensions}" if dimensions else name
+    dimensions = VECTOR_INDEX_DIMENSIONS or LOCAL_EMBEDDING_DIMENSIONS
+    return f"{name}_{EMBEDDER_BACKEND}_d{dimensions}"
+
+
+# Metadata keys of the int8 full-precision embedding stored next to a
+# compressed vector, for re-ranking
+RERANK_CODES_KEY = "rerank_int8"
+RERANK_SCALE_KEY = "rerank_scale"
+
+
+def index_vector(embedding: list[float]) -> list[float]:
+    """The compressed form of an embedding that is kept in the vector store."""
+    return truncate_embedding(embedding, VECTOR_INDEX_DIMENSIONS)
+
+
+def rerank_metadata(embedding: list[float]) -> dict:
+    """Metadata holding an embedding's int8 codes, when vectors are re-ranked."""
+    if rerank_candidates_factor() == 1:
+        return {}
+    codes, scale = quantize_int8(normalize(embedding))
+    return {RERANK_CODES_KEY: pack_int8(codes), RERANK_SCALE_KEY: scale}
+
+
+def public_metadata(metadata: Optional[dict]) -> dict:
+    """Metadata without the re-ranking codes, for callers and MongoDB."""
+    return {
+        key: value
+        for key, value in (metadata or {}).items()
+        if key not in (RERANK_CODES_KEY, RERANK_SCALE_KEY)
+    }
 
-def load_documents_from_csv_to_kb(path: str):
-    # Load documents from CSV file
-    documents_df = pd.read_csv(path)
 
-    # Create Document instances
-    for _, row in documents_df.iterrows():
-        metadata = {
+def __getattr__(name: str):
+    # Keeps `from pages.kb import knowledge_base` working, lazily
+    if name == "knowledge_base":
+        return get_knowledge_base()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_vector_collection() -> VectorStore:
+    """Get the vector store holding the knowledge base documents."""
+    return get_vector_store(vector_collection_name(VECTOR_DB_TABLE_NAME))
+
+
+def get_passage_collection() -> VectorStore:
+    """Get the vector store holding document passages."""
+    return get_vector_store(vector_collection_name(KB_PASSAGE_COLLECTION_NAME))
+
+
+def ensure_vector_indexes() -> None:
+    """Refresh the vector stores' search indexes after a bulk write."""
+    get_vector_collection().ensure_indexes()
+    get_passage_collection().ensure_indexes()
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed many texts, with a single embeddings API call for cache misses."""
+    return get_embedder().get_embeddings(texts)
+
+
+def embed_query(query: str) -> list[float]:
+    """
+    Embed a search query, memoized on its normalized text. The query itself is
+    embedded, since normalization is only meant to match equivalent queries.
+    """
+    key = normalize_text(query)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        embedding = get_embedder().get_embeddings(
+            [query], use_cache=KB_QUERY_CACHE_DISK_ENABLED
+        )[0]
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+def invalidate_retrieval_cache() -> None:
+    """Forget cached search results after the knowledge base changed."""
+    retrieval_cache.clear()
+
+
+def get_kb_cache_stats() -> dict:
+    """Hit/miss counters of the query embedding and retrieval caches."""
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "retrievals": retrieval_cache.stats(),
+    }
+
+
+def index_lexical(ids: list[str], documents: list[DocumentDB]) -> None:
+    """Add documents to the full-text index under their vector database ids."""
+    try:
+        get_lexical_index().add(
+            [
+                (doc_id, doc.name, doc.content, doc.meta_data.get("contenttype"))
+                for doc_id, doc in zip(ids, documents)
+            ]
+        )
+    except Exception as e:
+        # The vector database stays the source of truth; rebuild_lexical_index
+        # can bring the full-text index back in sync
+        print(f"Error updating lexical index: {e}")
+
+
+def document_passages(
+    doc_id: str, name: str, content: str, meta_data: dict
+) -> tuple[list[str], list[str], list[dict]]:
+    """
+    Split a document's full_text (or content) into passages.
+
+    Returns:
+        tuple: passage ids, passage texts and passage metadatas
+    """
+    text = meta_data.get("full_text")
+    if not isinstance(text, str) or not text.strip():
+        text = content
+    passages = split_into_passages(
+        text, KB_PASSAGE_MAX_CHARS, KB_PASSAGE_OVERLAP_CHARS
+    )
+    metadata = _clean_metadata(
+        {
+            "parent_id": doc_id,
+            "name": name,
+            "contenttype": meta_data.get("contenttype"),
+            "url": meta_data.get("url"),
+        }
+    )
+    return (
+        [f"{doc_id}:{i}" for i in range(len(passages))],
+        passages,
+        [{**metadata, "passage_index": i} for i in range(len(passages))],
+    )
+
+
+def add_passages(ids: list[str], documents: list[DocumentDB]) -> int:
+    """Index the passages of documents, replacing any earlier passages."""
+    passage_ids, passages, metadatas = [], [], []
+    for doc_id, doc in zip(ids, documents):
+        doc_passage_ids, doc_passages, doc_metadatas = document_passages(
+            doc_id, doc.name, doc.content, doc.meta_data
+        )
+        passage_ids += doc_passage_ids
+        passages += doc_passages
+        metadatas += doc_metadatas
+    if not passages:
+        return 0
+    collection = get_passage_collection()
+    collection.delete(where={"parent_id": {"$in": list(ids)}})
+    for i in range(0, len(passages), KB_EMBEDDING_BATCH_SIZE):
+        batch = slice(i, i + KB_EMBEDDING_BATCH_SIZE)
+        embeddings = embed_texts(passages[batch])
+        collection.upsert(
+            ids=passage_ids[batch],
+            embeddings=[index_vector(e) for e in embeddings],
+            documents=passages[batch],
+            metadatas=[
+                {**metadata, **rerank_metadata(embedding)}
+                for metadata, embedding in zip(metadatas[batch], embeddings)
+            ],
+        )
+    return len(passages)
+
+
+def reindex_passages(batch_size: int = KB_INGEST_CHUNK_SIZE) -> int:
+    """Backfill the passage collection from the documents in the vector database."""
+    collection = get_vector_collection()
+    offset = 0
+    total = 0
+    while True:
+        result = collection.get(
+            limit=batch_size, offset=offset, include=["documents", "metadatas"]
+        )
+        if not result["ids"]:
+            break
+        documents = [
+            DocumentDB(
+                name=(metadata or {}).get("name") or "",
+                content=content,
+                meta_data=metadata or {},
+            )
+            for content, metadata in zip(result["documents"], result["metadatas"])
+        ]
+        total += add_passages(result["ids"], documents)
+        offset += len(result["ids"])
+    get_passage_collection().ensure_indexes()
+    print(f"Indexed {total} passages of {offset} documents")
+    return total
+
+
+def _clean_metadata(meta_data: dict) -> dict:
+    """Drop empty values, which the vector database can not store."""
+    return {
+        key: value
+        for key, value in meta_data.items()
+        if value is not None and not (isinstance(value, float) and math.isnan(value))
+    }
+
+
+def _row_to_document(row: dict) -> Optional[DocumentDB]:
+    if not isinstance(row.get("content"), str) or not row["content"].strip():
+        return None
+    metadata = _clean_metadata(
+        {
             "contenttype": row.get("metadata_contenttype"),
             "url": row.get("metadata_url"),
             "name": row.get("name"),
             "full_text": row.get("full_text"),
         }
-        add_document_to_knowledge_base(row.get("name"), row.get("content"), metadata)
-        print("A")
+    )
+    name = row.get("name") if isinstance(row.get("name"), str) else ""
+    return DocumentDB(name=name, content=row["content"], meta_data=metadata)
+
+
+def upsert_documents(
+    documents: list[DocumentDB],
+    batch_size: int = KB_EMBEDDING_BATCH_SIZE,
+    concurrency: int = KB_INGEST_CONCURRENCY,
+    skip_existing: bool = True,
+    store_in_mongo: bool = True,
+) -> int:
+    """
+    Add or update many documents in the knowledge base in bulk.
+
+    Documents are keyed by document_hash(name, content), so adding the same
+    document twice never creates a second vector. With skip_existing, ids
+    already in the vector database are skipped before embedding; otherwise
+    they are re-written with the new metadata. Contents are embedded in
+    batches of batch_size per API call, with up to concurrency calls in flight.
+    store_in_mongo=False only indexes documents, e.g. ones read from MongoDB.
+
+    Returns:
+        int: Number of documents written to the vector database
+    """
+    unique_documents = {
+        document_hash(doc.name, doc.content): doc for doc in documents
+    }
+    if skip_existing and unique_documents:
+        existing = get_vector_collection().get(
+            ids=list(unique_documents), include=[]
+        )["ids"]
+        for doc_id in existing:
+            del unique_documents[doc_id]
+    if not unique_documents:
+        return 0
+    ids = list(unique_documents)
+    documents = list(unique_documents.values())
+    contents = [doc.content.replace("\x00", "\ufffd") for doc in documents]
+    batches = [
+        contents[i : i + batch_size] for i in range(0, len(contents), batch_size)
+    ]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        embeddings = [
+            embedding
+            for batch_embeddings in executor.map(embed_texts, batches)
+            for embedding in batch_embeddings
+        ]
+
+    get_vector_collection().upsert(
+        ids=ids,
+        embeddings=[index_vector(embedding) for embedding in embeddings],
+        documents=contents,
+        metadatas=[
+            _clean_metadata(
+                {"name": doc.name, **doc.meta_data, **rerank_metadata(embedding)}
+            )
+            for doc, embedding in zip(documents, embeddings)
+        ],
+    )
+    if store_in_mongo:
+        upsert_documents_to_mongo(documents)
+    index_lexical(ids, documents)
+    add_passages(ids, documents)
+    invalidate_retrieval_cache()
+    return len(documents)
+
+
+def add_documents_to_knowledge_base(
+    documents: list[DocumentDB],
+    batch_size: int = KB_EMBEDDING_BATCH_SIZE,
+    concurrency: int = KB_INGEST_CONCURRENCY,
+) -> int:
+    """
+    Add many documents to the knowledge base in bulk, skipping documents that
+    are already in it.
+
+    Returns:
+        int: Number of documents added
+    """
+    return upsert_documents(documents, batch_size, concurrency)
+
+
+def mongo_document_names(contents: list[str]) -> Dict[str, str]:
+    """Names of the MongoDB documents with the given contents, by content."""
+    if not contents:
+        return {}
+    return {
+        doc["content"]: doc.get("name") or ""
+        for doc in fetch_documents({"content": {"$in": list(set(contents))}})
+    }
+
+
+def dedupe_knowledge_base(batch_size: int = KB_INGEST_CHUNK_SIZE) -> int:
+    """
+    Compact the vector database: keep one vector per document_hash, stored
+    under that hash as id, and drop the duplicates with their passages and
+    full-text entries. Kept vectors are reused, so nothing is re-embedded.
+    Duplicate MongoDB documents are deleted as well. Vectors written by agno
+    keep no name in their metadata; theirs comes from the MongoDB document
+    with the same content, as upsert_documents hashes name and content.
+
+    Returns:
+        int: Number of removed vectors
+    """
+    collection = get_vector_collection()
+    kept: Dict[str, tuple] = {}
+    stale_ids = []
+    offset = 0
+    while True:
+        result = collection.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        if not len(result["ids"]):
+            break
+        metadatas = [metadata or {} for metadata in result["metadatas"]]
+        names = mongo_document_names(
+            [
+                content
+                for content, metadata in zip(result["documents"], metadatas)
+                if not metadata.get("name")
+            ]
+        )
+        for doc_id, content, metadata, embedding in zip(
+            result["ids"],
+            result["documents"],
+            metadatas,
+            result["embeddings"],
+        ):
+            name = metadata.get("name") or names.get(content, "")
+            if name:
+                metadata = {**metadata, "name": name}
+            hash = document_hash(name, content)
+            if hash in kept or doc_id != hash:
+                stale_ids.append(doc_id)
+            if hash not in kept or doc_id == hash:
+                kept[hash] = (doc_id, content, metadata, embedding)
+        offset += len(result["ids"])
+
+    # Vectors that were only stored under a legacy id move to their hash
+    rekeyed = {
+        hash: entry for hash, entry in kept.items() if entry[0] != hash
+    }
+    stale_ids = [doc_id for doc_id in stale_ids if doc_id not in kept]
+    if rekeyed:
+        collection.upsert(
+            ids=list(rekeyed),
+            embeddings=[embedding for _, _, _, embedding in rekeyed.values()],
+            documents=[content for _, content, _, _ in rekeyed.values()],
+            metadatas=[metadata for _, _, metadata, _ in rekeyed.values()],
+        )
+        rekeyed_documents = [
+            DocumentDB(
+                name=metadata.get("name") or "", content=content, meta_data=metadata
+            )
+            for _, content, metadata, _ in rekeyed.values()
+        ]
+        index_lexical(list(rekeyed), rekeyed_documents)
+        add_passages(list(rekeyed), rekeyed_documents)
+    for i in range(0, len(stale_ids), batch_size):
+        batch = stale_ids[i : i + batch_size]
+        collection.delete(ids=batch)
+        get_passage_collection().delete(where={"parent_id": {"$in": batch}})
+        get_lexical_index().delete(batch)
+    ensure_vector_indexes()
+    invalidate_retrieval_cache()
+
+    removed_from_mongo = delete_duplicate_documents()
+    print(
+        f"Removed {len(stale_ids)} duplicate vectors, re-keyed {len(rekeyed)} "
+        f"and removed {removed_from_mongo} duplicate MongoDB documents"
+    )
+    return len(stale_ids)
+
+
+def load_documents_from_csv_to_kb(
+    path: str,
+    chunk_size: int = KB_INGEST_CHUNK_SIZE,
+    batch_size: int = KB_EMBEDDING_BATCH_SIZE,
+    concurrency: int = KB_INGEST_CONCURRENCY,
+):
+    """
+    Load documents from a CSV file into the knowledge base.
+
+    The CSV is streamed in chunks of chunk_size rows and each chunk is added
+    with add_documents_to_knowledge_base.
+    """
+    import pandas as pd
+
+    start = time.perf_counter()
+    total = 0
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        documents = [
+            doc
+            for doc in (_row_to_document(row) for row in chunk.to_dict("records"))
+            if doc is not None
+        ]
+        total += add_documents_to_knowledge_base(documents, batch_size, concurrency)
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        print(
+            f"Ingested {total} documents in {elapsed:.1f}s "
+            f"({total / elapsed:.1f} docs/sec)"
+        )
+    ensure_vector_indexes()
+    return total
 
 
 def add_document_to_knowledge_base(name: str, content: str, meta_data: dict):
@@ -65,16 +546,395 @@ def add_document_to_knowledge_base(name: str, content: str, meta_data: dict):
         str: result of function, either success or error.
     Arg"""
     try:
-        id = len(knowledge_base.documents) + 1
-        doc = Document(id=id, name=name, content=content, meta_data=meta_data)
-        insert_document(DocumentDB(name=name, content=content, meta_data=meta_data), check_if_exists=True)
-        knowledge_base.add_document_to_knowledge_base(doc)
+        upsert_documents(
+            [DocumentDB(name=name, content=content, meta_data=meta_data)],
+            skip_existing=False,
+        )
         return "Document added to knowledge base successfully"
     except Exception as e:
         print(e)
         return f"Error in adding document to knowledge base: {str(e)}"
 
 
+def rerank_candidates_factor() -> int:
+    return KB_RERANK_CANDIDATES_FACTOR if VECTOR_INDEX_DIMENSIONS else 1
+
+
+def rerank_by_full_embedding(
+    query_embedding: list[float], documents: list[Document]
+) -> list[Document]:
+    """
+    Re-order candidates found with compressed vectors by the cosine distance of
+    their full-precision embeddings, decoded from the int8 codes in their
+    metadata. Candidates stored without codes keep their compressed distance.
+    The codes are removed from the returned metadata.
+    """
+    rerank = rerank_candidates_factor() > 1
+    for doc in documents:
+        codes = doc.meta_data.pop(RERANK_CODES_KEY, None)
+        scale = doc.meta_data.pop(RERANK_SCALE_KEY, None)
+        if rerank and codes is not None and scale is not None:
+            embedding = dequantize_int8(unpack_int8(codes), scale)
+            doc.meta_data["distances"] = 1 - cosine_similarity(
+                query_embedding, embedding
+            )
+    if not rerank:
+        return documents
+    return sorted(documents, key=lambda doc: doc.meta_data["distances"])
+
+
+def search_by_embedding(
+    query_embedding: list[float],
+    num_documents: int,
+    filters: Optional[Dict] = None,
+) -> list[Document]:
+    """
+    Search the vector database with an already computed query embedding.
+    With compressed vectors, more candidates are fetched and re-ranked with
+    the int8 full-precision embeddings stored next to them.
+    """
+    result = get_vector_collection().query(
+        query_embeddings=[index_vector(query_embedding)],
+        n_results=num_documents * rerank_candidates_factor(),
+        where=filters,
+        include=["documents", "metadatas", "distances"],
+    )
+    documents = []
+    for doc_id, content, metadata, distance in zip(
+        result["ids"][0],
+        result["documents"][0],
+        result["metadatas"][0],
+        result["distances"][0],
+    ):
+        meta_data = {**(metadata or {}), "distances": distance}
+        documents.append(
+            Document(
+                id=doc_id,
+                name=meta_data.get("name"),
+                content=content,
+                meta_data=meta_data,
+            )
+        )
+    return rerank_by_full_embedding(query_embedding, documents)[:num_documents]
+
+
+def get_documents_by_ids(ids: list[str]) -> list[Document]:
+    """Fetch documents from the vector database by id, in the order of ids."""
+    if not ids:
+        return []
+    result = get_vector_collection().get(ids=ids, include=["documents", "metadatas"])
+    found = {
+        doc_id: Document(
+            id=doc_id,
+            name=(metadata or {}).get("name"),
+            content=content,
+            meta_data=public_metadata(metadata),
+        )
+        for doc_id, content, metadata in zip(
+            result["ids"], result["documents"], result["metadatas"]
+        )
+    }
+    return [found[doc_id] for doc_id in ids if doc_id in found]
+
+
+def lexical_search(
+    query: str, num_documents: int, filters: Optional[Dict] = None
+) -> list[Document]:
+    """
+    Search the full-text index only. Costs no embedding call, so it also
+    works while the embeddings API is slow or unavailable.
+    """
+    hits = get_lexical_index().search(query, num_documents, filters)
+    documents = get_documents_by_ids([doc_id for doc_id, _ in hits])
+    scores = dict(hits)
+    for doc in documents:
+        doc.meta_data["lexical_score"] = scores[doc.id]
+    return documents
+
+
+def rebuild_lexical_index(batch_size: int = KB_INGEST_CHUNK_SIZE) -> int:
+    """Re-create the full-text index from the documents in the vector database."""
+    collection = get_vector_collection()
+    lexical_index = get_lexical_index()
+    lexical_index.clear()
+    total = 0
+    while True:
+        result = collection.get(
+            limit=batch_size, offset=total, include=["documents", "metadatas"]
+        )
+        if not result["ids"]:
+            break
+        lexical_index.add(
+            [
+                (doc_id, metadata.get("name"), content, metadata.get("contenttype"))
+                for doc_id, content, metadata in zip(
+                    result["ids"],
+                    result["documents"],
+                    [metadata or {} for metadata in result["metadatas"]],
+                )
+            ]
+        )
+        total += len(result["ids"])
+    print(f"Rebuilt lexical index with {total} documents")
+    return total
+
+
+def cached_search(
+    query: str,
+    num_documents: int,
+    filters: Optional[Dict] = None,
+    query_embedding: Optional[list[float]] = None,
+) -> list[Document]:
+    """
+    Search the knowledge base, reusing results of an identical earlier search.
+
+    Args:
+        query (str): The search query string
+        num_documents (int): Number of documents to return
+        filters (dict): Optional metadata filters
+        query_embedding (list): Embedding of the query, if already computed
+    """
+    key = (normalize_text(query), json.dumps(filters, sort_keys=True), num_documents)
+    documents = retrieval_cache.get(key)
+    if documents is None:
+        if query_embedding is None:
+            query_embedding = embed_query(query)
+        documents = search_by_embedding(query_embedding, num_documents, filters)
+        retrieval_cache.set(key, documents)
+    return list(documents)
+
+
+def search_by_content_type(
+    query: str, num_documents_per_type: Dict[str, int]
+) -> Dict[str, list[Document]]:
+    """
+    Embed the query once and run one filtered vector lookup per content type
+    concurrently against that embedding.
+
+    Args:
+        query (str): The search query string
+        num_documents_per_type (dict): Number of documents to return per contenttype
+
+    Returns:
+        dict: Retrieved documents per contenttype, in the order of the request
+    """
+    query_embedding = embed_query(query)
+    with ThreadPoolExecutor(max_workers=len(num_documents_per_type)) as executor:
+        futures = {
+            content_type: executor.submit(
+                cached_search,
+                query,
+                num_documents,
+                {"contenttype": content_type},
+                query_embedding,
+            )
+            for content_type, num_documents in num_documents_per_type.items()
+        }
+        return {
+            content_type: future.result() for content_type, future in futures.items()
+        }
+
+
+def embed_query_or_none(
+    query: str, timeout: float = KB_QUERY_EMBEDDING_TIMEOUT_SECONDS
+) -> Optional[list[float]]:
+    """Embed a query, or return None if the embeddings API fails or is too slow."""
+    future = query_embedding_executor.submit(embed_query, query)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        print(f"Query embedding took over {timeout}s, using lexical search only")
+    except Exception as e:
+        print(f"Error embedding query, using lexical search only: {e}")
+    return None
+
+
+def hybrid_search(
+    query: str,
+    num_documents: int,
+    filters: Optional[Dict] = None,
+    query_embedding: Optional[list[float]] = None,
+    num_candidates: int = KB_HYBRID_CANDIDATES,
+) -> list[Document]:
+    """
+    Search with both the vector database and the full-text index and merge
+    the two rankings with reciprocal-rank fusion.
+
+    Args:
+        query (str): The search query string
+        num_documents (int): Number of documents to return
+        filters (dict): Optional {"contenttype": value} filter
+        query_embedding (list): Embedding of the query; None searches the
+            full-text index only
+        num_candidates (int): Documents taken from each retriever before fusion
+    """
+    num_candidates = max(num_candidates, num_documents)
+    vector_documents = []
+    if query_embedding is not None:
+        vector_documents = cached_search(
+            query, num_candidates, filters, query_embedding
+        )
+    lexical_ids = [
+        doc_id
+        for doc_id, _ in get_lexical_index().search(query, num_candidates, filters)
+    ]
+    fused = reciprocal_rank_fusion(
+        [[doc.id for doc in vector_documents], lexical_ids], k=KB_RRF_K
+    )[:num_documents]
+
+    by_id = {doc.id: doc for doc in vector_documents}
+    missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+    by_id.update({doc.id: doc for doc in get_documents_by_ids(missing)})
+    documents = []
+    for doc_id, score in fused:
+        if doc_id in by_id:
+            doc = by_id[doc_id]
+            documents.append(
+                Document(
+                    id=doc.id,
+                    name=doc.name,
+                    content=doc.content,
+                    meta_data={**doc.meta_data, "rrf_score": score},
+                )
+            )
+    return documents
+
+
+def hybrid_search_by_content_type(
+    query: str,
+    num_documents_per_type: Dict[str, int],
+    query_embedding: Optional[list[float]] = None,
+) -> Dict[str, list[Document]]:
+    """
+    hybrid_search per content type, all with the same query embedding. Embed
+    the query with embed_query_or_none; without an embedding only the
+    full-text index is used.
+    """
+    with ThreadPoolExecutor(max_workers=len(num_documents_per_type)) as executor:
+        futures = {
+            content_type: executor.submit(
+                hybrid_search,
+                query,
+                num_documents,
+                {"contenttype": content_type},
+                query_embedding,
+            )
+            for content_type, num_documents in num_documents_per_type.items()
+        }
+        return {
+            content_type: future.result() for content_type, future in futures.items()
+        }
+
+
+def search_passages(
+    query: str,
+    parent_ids: list[str],
+    num_passages: int = KB_PASSAGES_PER_QUERY,
+    query_embedding: Optional[list[float]] = None,
+) -> list[dict]:
+    """
+    Rank the passages of the given documents against the query.
+
+    Uses the query embedding when available, otherwise the overlap of
+    normalized query words with each passage.
+
+    Returns:
+        list[dict]: Passages with "parent_id", "passage_index" and "text", best first
+    """
+    if not parent_ids:
+        return []
+    collection = get_passage_collection()
+    where = {"parent_id": {"$in": parent_ids}}
+    if query_embedding is not None:
+        result = collection.query(
+            query_embeddings=[index_vector(query_embedding)],
+            n_results=num_passages * rerank_candidates_factor(),
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        ranked = rerank_by_full_embedding(
+            query_embedding,
+            [
+                Document(content=text, meta_data={**metadata, "distances": distance})
+                for text, metadata, distance in zip(
+                    result["documents"][0],
+                    result["metadatas"][0],
+                    result["distances"][0],
+                )
+            ],
+        )[:num_passages]
+        texts = [doc.content for doc in ranked]
+        metadatas = [doc.meta_data for doc in ranked]
+    else:
+        result = collection.get(where=where, include=["documents", "metadatas"])
+        query_tokens = set(tokenize(query))
+        ranked = sorted(
+            zip(result["documents"], result["metadatas"]),
+            key=lambda item: len(query_tokens.intersection(tokenize(item[0]))),
+            reverse=True,
+        )[:num_passages]
+        texts = [text for text, _ in ranked]
+        metadatas = [metadata for _, metadata in ranked]
+    return [
+        {
+            "parent_id": metadata["parent_id"],
+            "passage_index": metadata.get("passage_index", 0),
+            "text": text,
+        }
+        for text, metadata in zip(texts, metadatas)
+    ]
+
+
+def assemble_context(
+    documents: list[Document],
+    passages: list[dict],
+    token_budget: int = PLANNER_CONTEXT_TOKEN_BUDGET,
+) -> str:
+    """
+    Build the planner context from the best passages within a token budget.
+
+    Passages are taken best first until the budget is spent, then printed
+    under their document in document rank order and in their original order.
+    Documents without indexed passages fall back to their first passage.
+    """
+    indexed = {passage["parent_id"] for passage in passages}
+    candidates = list(passages)
+    for doc in documents:
+        if doc.id not in indexed:
+            _, texts, _ = document_passages(
+                doc.id, doc.name, doc.content, doc.meta_data
+            )
+            candidates += [
+                {"parent_id": doc.id, "passage_index": 0, "text": text}
+                for text in texts[:1]
+            ]
+    selected: Dict[str, list[dict]] = {}
+    used = 0
+    for passage in candidates:
+        tokens = estimate_tokens(passage["text"], KB_CHARS_PER_TOKEN)
+        if used + tokens > token_budget:
+            continue
+        used += tokens
+        selected.setdefault(passage["parent_id"], []).append(passage)
+
+    message_parts = []
+    for doc in documents:
+        if doc.id not in selected:
+            continue
+        name = doc.meta_data.get("name", "نامشخص")
+        content_type = doc.meta_data.get("contenttype", "نامشخص")
+        text = "\n...\n".join(
+            passage["text"]
+            for passage in sorted(
+                selected[doc.id], key=lambda passage: passage["passage_index"]
+            )
+        )
+        message_parts.append(
+            f"{len(message_parts) + 1}. {name} ({content_type}) \n {text}"
+        )
+    return "\n=====\n".join(message_parts)
+
+
 def campaign_planner_retriever(
     query: str, num_documents: int = 2
 ) -> Optional[list[dict]]:
@@ -88,17 +948,11 @@ def campaign_planner_retriever(
         Optional[list[dict]]: List of retrieved documents or None if search fails
     """
     try:
-        case_studies = knowledge_base.search(
-            query=query, num_documents=2, filters={"contenttype": "casestudy"}
-        )
-        helps = knowledge_base.search(
-            query=query, num_documents=2, filters={"contenttype": "help"}
-        )
-        sample_campaign_plans = knowledge_base.search(
-            query=query, num_documents=1, filters={"contenttype": "campaign_plan"}
+        results = search_by_content_type(
+            query, {"casestudy": 2, "help": 2, "campaign_plan": 1}
         )
-        print("len", len(case_studies), len(helps), len(sample_campaign_plans))
-        documents = case_studies + helps + sample_campaign_plans
+        print("len", *(len(docs) for docs in results.values()))
+        documents = [doc for docs in results.values() for doc in docs]
         documents = [doc.to_dict() for doc in documents]
         return documents
     except Exception as e:
@@ -109,7 +963,8 @@ def campaign_planner_retriever(
 def get_documents_for_user_request(campaign_request: CampaignRequest) -> str:
     """
     Retrieve relevant documents based on business_detail and goal fields from CampaignRequest.
-    Generate a formatted message with top 10 documents including names and content types.
+    Generate a formatted message with their most relevant passages, names and content
+    types, capped at PLANNER_CONTEXT_TOKEN_BUDGET tokens.
 
     Args:
         campaign_request (CampaignRequest): The request containing business details and goal
@@ -126,35 +981,27 @@ def get_documents_for_user_request(campaign_request: CampaignRequest) -> str:
 
         # Build search query combining business info and goal
         search_query = f"{business_type} {business_name} {goal}"
+        # Embedded once for documents and passages; None if the API failed or
+        # timed out, so a slow embeddings API costs the timeout only once
+        query_embedding = embed_query_or_none(search_query)
 
-        case_studies = knowledge_base.search(
-            query=search_query, num_documents=2, filters={"contenttype": "casestudy"}
+        results = hybrid_search_by_content_type(
+            search_query,
+            {"casestudy": 2, "help": 4, "campaign_plan": 2},
+            query_embedding,
         )
-        helps = knowledge_base.search(
-            query=search_query, num_documents=4, filters={"contenttype": "help"}
-        )
-        sample_campaign_plans = knowledge_base.search(
-            query=search_query,
-            num_documents=2,
-            filters={"contenttype": "campaign_plan"},
-        )
-
-        documents = case_studies + helps + sample_campaign_plans
+        documents = [doc for docs in results.values() for doc in docs]
 
         if not documents:
             return "No documents found"
 
-        # Generate formatted message with document information
-        message_parts = []
-
-        for i, doc in enumerate(documents, 1):
-            doc_dict = doc.to_dict()
-            name = doc_dict.get("meta_data", {}).get("name", "نامشخص")
-            content_type = doc_dict.get("meta_data", {}).get("contenttype", "نامشخص")
-            full_text = doc_dict.get("meta_data", {}).get("full_text", "نامشخص")
-            message_parts.append(f"{i}. {name} ({content_type}) \n {full_text}")
-
-        return "\n=====\n".join(message_parts)
+        # Keep only the passages most relevant to the request, within budget
+        passages = search_passages(
+            search_query,
+            [doc.id for doc in documents],
+            query_embedding=query_embedding,
+        )
+        return assemble_context(documents, passages)
 
     except Exception as e:
         print(f"Error during document retrieval: {str(e)}")
@@ -265,14 +1112,53 @@ def search_yektanet(query: str) -> List[Dict[str, str]]:
         print(f"Error parsing Yektanet search results: {str(e)}")
         return []
 
+def rebuild_knowledge_base_from_mongo(batch_size: int = KB_INGEST_CHUNK_SIZE) -> int:
+    """
+    Re-add every document stored in MongoDB to the vector database.
+    Embeddings of unchanged documents come from the embedding cache.
+    """
+    documents = [DocumentDB.model_validate(doc) for doc in fetch_documents({})]
+    total = 0
+    for i in range(0, len(documents), batch_size):
+        total += upsert_documents(
+            documents[i : i + batch_size], store_in_mongo=False
+        )
+    ensure_vector_indexes()
+    print(f"Rebuilt knowledge base with {total} documents")
+    return total
+
+
 def insert_vector_db_documents_to_mongo(limit=1000):
-    for doc in knowledge_base.vector_db.search(query="", limit=limit):
-        name = doc.meta_data.get("name", "")
-        meta_data = doc.meta_data
-        meta_data.pop("distances")
-        insert_document(DocumentDB(name=name, content=doc.content, meta_data=meta_data))
+    result = get_vector_collection().get(limit=limit)
+    for content, meta_data in zip(result["documents"], result["metadatas"]):
+        meta_data = public_metadata(meta_data)
+        name = meta_data.get("name", "")
+        insert_document(DocumentDB(name=name, content=content, meta_data=meta_data))
 
 
 # Uncomment to load documents from csv.
 # from pages.config import get_documents_csv_path
 # load_documents_from_csv_to_kb(get_documents_csv_path())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the knowledge base")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dedupe = subparsers.add_parser(
+        "dedupe", help="Remove duplicate documents, vectors and passages"
+    )
+    dedupe.add_argument("--batch-size", type=int, default=KB_INGEST_CHUNK_SIZE)
+    rebuild = subparsers.add_parser(
+        "rebuild", help="Re-add the MongoDB documents to the vector database"
+    )
+    rebuild.add_argument("--batch-size", type=int, default=KB_INGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "dedupe":
+        dedupe_knowledge_base(batch_size=args.batch_size)
+    elif args.command == "rebuild":
+        rebuild_knowledge_base_from_mongo(batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import streamlit as st
-from pages.agents import KbgkAgent
+from pages.agents import KbgkAgent, reply_tokens
+from pages.agent_factory import checkout_agent
 from typing import List
 import uuid
 from textwrap import dedent
@@ -24,16 +25,12 @@ if "kbgk_session_id" in st.session_state:
     st.markdown("**Session ID:**")
     st.code(st.session_state["kbgk_session_id"], language="text")
 
-if "kbgk_agent" not in st.session_state:
-    st.session_state["kbgk_agent"] = KbgkAgent(
-        session_id=st.session_state["kbgk_session_id"]
-    )
-
 # Load messages from storage on first run
 if "kbgk_messages" not in st.session_state:
-    messages: List[Message] = st.session_state[
-        "kbgk_agent"
-    ].agent.get_messages_for_session()
+    # Agents are pooled per session and checked out for each use instead of
+    # being kept in session_state
+    with checkout_agent(KbgkAgent, st.session_state["kbgk_session_id"]) as agent:
+        messages: List[Message] = agent.agent.get_messages_for_session()
     st.session_state["kbgk_messages"] = [
         {"sender": m.role, "message": m.content} for m in messages
     ]
@@ -84,7 +81,15 @@ user_input = st.chat_input("Type your message...")
 if user_input:
     user_msg = {"sender": "user", "message": user_input}
     st.session_state["kbgk_messages"].append(user_msg)
-    agent_response = st.session_state["kbgk_agent"].respond(user_input)
+    with st.chat_message("user"):
+        st.markdown(user_input)
+    # Render the reply as it streams in; the rerun below redraws it as history
+    with st.chat_message("Assistant"), checkout_agent(
+        KbgkAgent, st.session_state["kbgk_session_id"]
+    ) as agent:
+        agent_response = st.write_stream(
+            reply_tokens(agent.respond_stream(user_input))
+        )
     agent_msg = {"sender": "Assistant", "message": agent_response}
     st.session_state["kbgk_messages"].append(agent_msg)
     st.rerun()
@@ -104,14 +109,11 @@ new_session_id = st.sidebar.text_input(
 if st.sidebar.button("Resume Session", type="secondary"):
     if new_session_id:
         st.session_state["kbgk_session_id"] = new_session_id
-        st.session_state["kbgk_agent"] = KbgkAgent(session_id=new_session_id)
-        from pages.agents import SqliteStorage
-
-        s: SqliteStorage = st.session_state["kbgk_agent"].agent.storage
         # Load messages for the new session
-        messages: List[Message] = st.session_state[
-            "kbgk_agent"
-        ].agent.get_messages_for_session(new_session_id)
+        with checkout_agent(KbgkAgent, new_session_id) as agent:
+            messages: List[Message] = agent.agent.get_messages_for_session(
+                new_session_id
+            )
         st.session_state["kbgk_messages"] = []
         for m in messages:
             if m.role == "user":
@@ -0,0 +1,138 @@
+"""
+Full-text index of the knowledge base for CampaignGenie application.
+A local tantivy (BM25) index kept alongside the Chroma collection, so exact
+brand names and keywords can be matched without embedding the query.
+"""
+
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple
+
+import tantivy
+
+from pages.config import LEXICAL_INDEX_PATH
+from pages.text_utils import tokenize
+
+# Document names usually hold the brand or business name
+NAME_BOOST = 2.0
+
+
+class LexicalIndex:
+    """
+    BM25 index over document names and contents, keyed by vector database id.
+
+    Text is normalized and tokenized with pages.text_utils.tokenize before
+    indexing and searching, so Arabic/Persian letter variants, digits, ZWNJ
+    and stopwords are handled the same way on both sides.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        Path(path).mkdir(parents=True, exist_ok=True)
+        schema_builder = tantivy.SchemaBuilder()
+        schema_builder.add_text_field("doc_id", stored=True, tokenizer_name="raw")
+        schema_builder.add_text_field("contenttype", tokenizer_name="raw")
+        schema_builder.add_text_field("name", tokenizer_name="whitespace")
+        schema_builder.add_text_field("body", tokenizer_name="whitespace")
+        self.index = tantivy.Index(schema_builder.build(), path=path, reuse=True)
+        self._lock = threading.Lock()
+
+    def add(self, documents: List[Tuple[str, str, str, Optional[str]]]) -> None:
+        """
+        Add or replace documents.
+
+        Args:
+            documents: (doc_id, name, content, contenttype) tuples
+        """
+        with self._lock:
+            writer = self.index.writer()
+            for doc_id, name, content, contenttype in documents:
+                writer.delete_documents("doc_id", doc_id)
+                writer.add_document(
+                    tantivy.Document(
+                        doc_id=doc_id,
+                        contenttype=contenttype or "",
+                        name=" ".join(tokenize(name or "")),
+                        body=" ".join(tokenize(content)),
+                    )
+                )
+            writer.commit()
+            writer.wait_merging_threads()
+            self.index.reload()
+
+    def delete(self, doc_ids: List[str]) -> None:
+        with self._lock:
+            writer = self.index.writer()
+            for doc_id in doc_ids:
+                writer.delete_documents("doc_id", doc_id)
+            writer.commit()
+            writer.wait_merging_threads()
+            self.index.reload()
+
+    def clear(self) -> None:
+        with self._lock:
+            writer = self.index.writer()
+            writer.delete_all_documents()
+            writer.commit()
+            writer.wait_merging_threads()
+            self.index.reload()
+
+    def search(
+        self, query: str, limit: int, filters: Optional[Dict] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the best matching documents of a query.
+
+        Args:
+            query (str): The search query string
+            limit (int): Number of documents to return
+            filters (dict): Optional {"contenttype": value} filter
+
+        Returns:
+            list: (doc_id, BM25 score) pairs, best first
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        query_string = " OR ".join(dict.fromkeys(tokens))
+        for field, value in (filters or {}).items():
+            if field != "contenttype":
+                raise ValueError(f"Unsupported lexical filter: {field}")
+            query_string = f'contenttype:"{value}" AND ({query_string})'
+        parsed = self.index.parse_query(
+            query_string, ["name", "body"], field_boosts={"name": NAME_BOOST}
+        )
+        searcher = self.index.searcher()
+        return [
+            (searcher.doc(address)["doc_id"][0], score)
+            for score, address in searcher.search(parsed, limit).hits
+        ]
+
+    def count(self) -> int:
+        return self.index.searcher().num_docs
+
+
+@lru_cache(maxsize=None)
+def get_lexical_index(path: str = LEXICAL_INDEX_PATH) -> LexicalIndex:
+    """Get the process-wide lexical index stored at path."""
+    return LexicalIndex(path)
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """
+    Merge ranked id lists with reciprocal-rank fusion.
+
+    Each id scores sum(1 / (k + rank)) over the lists it appears in, so ids
+    ranked well by several retrievers come first without comparing their raw
+    scores.
+
+    Returns:
+        list: (id, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -208,6 +208,8 @@ class Task(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     description: str
     session_id: str
+    # Not claimed again before this time, set when a task is retried later
+    not_before: Optional[datetime] = None
 
 
 class GenerateCampaignPlanTask(Task):
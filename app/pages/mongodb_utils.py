@@ -3,10 +3,12 @@ MongoDB utilities for CampaignGenie application.
 Handles database connections and operations for MongoDB.
 """
 
+from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, ASCENDING, UpdateOne
 from pymongo.database import Database
 from pymongo.collection import Collection
+from pymongo.change_stream import CollectionChangeStream
 from bson import ObjectId
 import hashlib
 
@@ -17,8 +19,15 @@ from pages.config import (
     get_mongodb_tasks_collection,
     get_mongodb_campaign_plans_collection,
     get_mongodb_documents_collection,
+    get_task_lease_seconds,
+)
+from pages.models import (
+    CampaignRequestDB,
+    Task,
+    CampaignPlanDB,
+    AdDescriptionDB,
+    DocumentDB,
 )
-from pages.models import CampaignRequestDB, Task, CampaignPlanDB, DocumentDB
 
 
 class MongoDBManager:
@@ -87,15 +96,51 @@ def insert_task(task: Task) -> str:
     return str(result.inserted_id)
 
 
-def update_task(task: Task) -> None:
+def update_task(task: Task, worker_id: Optional[str] = None) -> bool:
     """
     Update a Task in the Tasks collection.
+
+    Args:
+        task: The updated task
+        worker_id: If given, only update the task while this worker holds its
+            lease, so a worker that lost the lease can not overwrite the work
+            of the worker that reclaimed it
+
+    Returns:
+        bool: False if the task was not found or is leased by another worker
     """
     assert task.id is not None, "Task ID is required"
     collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
     task_dict = task.model_dump()
     task_dict.pop("id")
-    collection.update_one({"_id": ObjectId(task.id)}, {"$set": task_dict})
+    query = {"_id": ObjectId(task.id)}
+    if worker_id is not None:
+        query["worker_id"] = worker_id
+    result = collection.update_one(query, {"$set": task_dict})
+    return result.matched_count == 1
+
+
+def update_task_fields(
+    task_id: str, fields: Dict[str, Any], worker_id: Optional[str] = None
+) -> bool:
+    """
+    Set some fields of a task, e.g. its status when the task can not be parsed
+    into a Task model, only while worker_id holds its lease if given.
+
+    Returns:
+        bool: False if the task was not found or is leased by another worker
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    query = {"_id": ObjectId(task_id)}
+    if worker_id is not None:
+        query["worker_id"] = worker_id
+    result = collection.update_one(query, {"$set": fields})
+    return result.matched_count == 1
+
+
+def document_hash(name: str, content: str) -> str:
+    """Content address of a document, also used as its vector database id."""
+    return hashlib.md5((name + content).encode()).hexdigest()
 
 
 def insert_document(document: DocumentDB, check_if_exists: bool = True) -> str:
@@ -103,7 +148,7 @@ def insert_document(document: DocumentDB, check_if_exists: bool = True) -> str:
     Insert a Document into the Documents collection.
     """
     collection = get_mongodb_manager().get_collection(get_mongodb_documents_collection())
-    hash = hashlib.md5((document.name + document.content).encode()).hexdigest()
+    hash = document_hash(document.name, document.content)
     if check_if_exists:
         existing_document = collection.find_one({"hash": hash})
         if existing_document:
@@ -114,6 +159,48 @@ def insert_document(document: DocumentDB, check_if_exists: bool = True) -> str:
     return str(result.inserted_id)
 
 
+def upsert_documents(documents: List[DocumentDB]) -> int:
+    """
+    Upsert many Documents into the Documents collection with one bulk write.
+    Documents are matched by hash; an existing document gets the new metadata.
+
+    Returns:
+        int: Number of newly inserted documents
+    """
+    if not documents:
+        return 0
+    collection = get_mongodb_manager().get_collection(get_mongodb_documents_collection())
+    operations = []
+    for document in documents:
+        hash = document_hash(document.name, document.content)
+        doc = document.model_dump(exclude={"id"})
+        doc["hash"] = hash
+        operations.append(UpdateOne({"hash": hash}, {"$set": doc}, upsert=True))
+    result = collection.bulk_write(operations, ordered=False)
+    return result.upserted_count
+
+
+def delete_duplicate_documents() -> int:
+    """
+    Delete all but the oldest Document of every hash.
+
+    Returns:
+        int: Number of deleted documents
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_documents_collection())
+    duplicates = collection.aggregate(
+        [
+            {"$sort": {"_id": ASCENDING}},
+            {"$group": {"_id": "$hash", "ids": {"$push": "$_id"}}},
+            {"$match": {"ids.1": {"$exists": True}}},
+        ]
+    )
+    extra_ids = [doc_id for group in duplicates for doc_id in group["ids"][1:]]
+    if not extra_ids:
+        return 0
+    return collection.delete_many({"_id": {"$in": extra_ids}}).deleted_count
+
+
 def insert_campaign_plan(campaign_plan: CampaignPlanDB) -> str:
     """
     Insert a CampaignPlan into the CampaignPlans collection.
@@ -140,6 +227,44 @@ def update_campaign_plan(campaign_plan: CampaignPlanDB) -> None:
     )
 
 
+def update_campaign_plan_ad(
+    campaign_plan_id: str, ad_index: int, ad: AdDescriptionDB
+) -> None:
+    """
+    Update a single ad of a CampaignPlan, leaving the other ads untouched.
+
+    Args:
+        campaign_plan_id: The MongoDB ID of the campaign plan
+        ad_index: Position of the ad in ads_description
+        ad: The updated ad
+    """
+    collection = get_mongodb_manager().get_collection(
+        get_mongodb_campaign_plans_collection()
+    )
+    collection.update_one(
+        {"_id": ObjectId(campaign_plan_id)},
+        {"$set": {f"ads_description.{ad_index}": ad.model_dump()}},
+    )
+
+
+def add_created_ad_to_task(
+    task_id: str, ad_id: str, worker_id: Optional[str] = None
+) -> bool:
+    """
+    Record a created ad on a CreateYektanetCampaignTask, only while worker_id
+    holds its lease if given.
+
+    Returns:
+        bool: False if the task was not found or is leased by another worker
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    query = {"_id": ObjectId(task_id)}
+    if worker_id is not None:
+        query["worker_id"] = worker_id
+    result = collection.update_one(query, {"$addToSet": {"created_ads": ad_id}})
+    return result.matched_count == 1
+
+
 def fetch_one_campaign_request(query: Dict[str, Any]) -> Dict[str, Any]:
     """
     Fetch campaign requests from MongoDB with optional status filtering.
@@ -218,3 +343,174 @@ def fetch_tasks(query: Dict[str, Any]) -> List[Dict[str, Any]]:
             document["id"] = str(document["_id"])
             del document["_id"]
     return documents
+
+
+def ensure_task_indexes() -> None:
+    """
+    Create the indexes used to claim tasks efficiently.
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    collection.create_index(
+        [
+            ("status", ASCENDING),
+            ("lease_expires_at", ASCENDING),
+            ("created_at", ASCENDING),
+        ]
+    )
+    collection.create_index([("not_before", ASCENDING)], sparse=True)
+
+
+def claimable_tasks_query(query: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """
+    Restrict a task query to tasks that are not leased by any worker and are not
+    waiting for a retry (not_before in the future).
+    """
+    return {
+        "$and": [
+            query,
+            {
+                "$or": [
+                    {"lease_expires_at": None},
+                    {"lease_expires_at": {"$lt": now}},
+                ]
+            },
+            {"$or": [{"not_before": None}, {"not_before": {"$lte": now}}]},
+        ]
+    }
+
+
+def next_task_retry_time(query: Dict[str, Any]) -> Optional[datetime]:
+    """
+    The earliest future not_before of the tasks matching the query, or None if
+    no task is waiting for a retry.
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    task = collection.find_one(
+        {"$and": [query, {"not_before": {"$gt": datetime.utcnow()}}]},
+        {"not_before": 1},
+        sort=[("not_before", ASCENDING)],
+    )
+    return task["not_before"] if task is not None else None
+
+
+def count_claimable_tasks(query: Dict[str, Any]) -> int:
+    """
+    Count tasks matching the query that can be claimed now.
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    return collection.count_documents(claimable_tasks_query(query, datetime.utcnow()))
+
+
+def claim_one_task(
+    query: Dict[str, Any], worker_id: str, lease_seconds: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim one task matching the query for the given worker.
+
+    A task is claimable when it has no lease or its lease has expired, so tasks
+    held by crashed workers are picked up again once their lease runs out, and
+    when its not_before retry time, if any, has passed.
+
+    Args:
+        query: Query to select candidate tasks
+        worker_id: Identifier of the worker claiming the task
+        lease_seconds: Lease duration, defaults to the configured task lease
+
+    Returns:
+        Task dictionary with the lease fields set, or None if nothing is claimable
+    """
+    if lease_seconds is None:
+        lease_seconds = get_task_lease_seconds()
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    now = datetime.utcnow()
+    document = collection.find_one_and_update(
+        claimable_tasks_query(query, now),
+        {
+            "$set": {
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "in_progress": True,
+                "claimed_at": now,
+            }
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if document is None:
+        return None
+
+    document["id"] = str(document["_id"])
+    del document["_id"]
+    return document
+
+
+def renew_task_lease(
+    task_id: str, worker_id: str, lease_seconds: Optional[int] = None
+) -> bool:
+    """
+    Extend the lease of a task held by the given worker.
+
+    Returns:
+        bool: False if the worker no longer holds the lease
+    """
+    if lease_seconds is None:
+        lease_seconds = get_task_lease_seconds()
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    result = collection.update_one(
+        {"_id": ObjectId(task_id), "worker_id": worker_id},
+        {
+            "$set": {
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)
+            }
+        },
+    )
+    return result.matched_count == 1
+
+
+def release_task(task_id: str, worker_id: str) -> None:
+    """
+    Release the lease of a task held by the given worker.
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    collection.update_one(
+        {"_id": ObjectId(task_id), "worker_id": worker_id},
+        {
+            "$set": {"in_progress": False},
+            "$unset": {"worker_id": "", "lease_expires_at": "", "claimed_at": ""},
+        },
+    )
+
+
+def watch_tasks(max_await_time_ms: int = 1000) -> CollectionChangeStream:
+    """
+    Open a change stream on the Tasks collection for inserts and status updates.
+
+    Change streams require a replica set; on a standalone mongod this raises
+    pymongo.errors.OperationFailure.
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_tasks_collection())
+    pipeline = [
+        {
+            "$match": {
+                "$or": [
+                    {"operationType": {"$in": ["insert", "replace"]}},
+                    {"updateDescription.updatedFields.status": {"$exists": True}},
+                    {"updateDescription.removedFields": "lease_expires_at"},
+                ]
+            }
+        }
+    ]
+    return collection.watch(pipeline, max_await_time_ms=max_await_time_ms)
+
+
+def fetch_documents(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Fetch documents of the knowledge base from MongoDB with optional query filtering.
+    """
+    collection = get_mongodb_manager().get_collection(get_mongodb_documents_collection())
+    documents = list(collection.find(query))
+    for document in documents:
+        if "_id" in document:
+            document["id"] = str(document["_id"])
+            del document["_id"]
+    return documents
@@ -0,0 +1,251 @@
+"""
+Retrieval benchmark for CampaignGenie application.
+Runs a fixed set of labelled CampaignRequest-style queries through
+get_documents_for_user_request and campaign_planner_retriever and reports
+recall@k, MRR, p50/p95/p99 latency and embedding calls per query as JSON, so
+retrieval changes in pages.kb can be compared across runs.
+
+The knowledge base and the embedding cache are built from the documents CSV
+in a temporary directory, and by default queries and documents are embedded by
+the deterministic local embedder, so the benchmark runs offline and never
+touches the real stores.
+
+Usage (from the repository root):
+    PYTHONPATH=app python -m pages.retrieval_benchmark --output results.json
+    PYTHONPATH=app python -m pages.retrieval_benchmark --warm --repeats 5
+    PYTHONPATH=app python -m pages.retrieval_benchmark --embedder openai
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+QUERIES_PATH = "app/pages/files/benchmarks/retrieval_queries.json"
+DEFAULT_CSV_PATH = "app/pages/files/CampaignGenieDocuments - Documents.csv"
+
+
+class EmbeddingRequestCounter:
+    """
+    Counts the embedding requests and texts that reach the embedding backend:
+    API requests of the OpenAI embedder, beneath its cache, or calls of the
+    local embedder, which has no cache.
+    """
+
+    def __init__(self, embedder):
+        self.calls = 0
+        self.texts = 0
+        method = "response" if hasattr(embedder, "response") else "get_embeddings"
+        embed = getattr(embedder, method)
+
+        def counted(texts, *args, **kwargs):
+            self.calls += 1
+            self.texts += 1 if isinstance(texts, str) else len(texts)
+            return embed(texts, *args, **kwargs)
+
+        setattr(embedder, method, counted)
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def match_document(text: str, names: List[str]) -> Optional[str]:
+    """The corpus document whose (normalized) name text starts with."""
+    from pages.text_utils import normalize_text
+
+    text = re.sub(r"^\d+\. ", "", normalize_text(text))
+    matches = [name for name in names if text.startswith(normalize_text(name))]
+    return max(matches, key=len) if matches else None
+
+
+def ranking_metrics(ranking: List[str], expected: List[str], k: int) -> Dict:
+    from pages.text_utils import normalize_text
+
+    expected = {normalize_text(name) for name in expected}
+    # Unmatched results keep their rank
+    ranking = [normalize_text(name) if name else None for name in ranking]
+    first_hit = next(
+        (rank for rank, name in enumerate(ranking, 1) if name in expected), None
+    )
+    return {
+        f"recall@{k}": len(expected & set(ranking[:k])) / len(expected),
+        "recall@all": len(expected & set(ranking)) / len(expected),
+        "reciprocal_rank": 1 / first_hit if first_hit else 0.0,
+    }
+
+
+def build_knowledge_base(csv_path: str, counter: EmbeddingRequestCounter) -> Dict:
+    """Ingest the documents CSV into the (temporary) knowledge base."""
+    import pandas as pd
+    from pages import kb
+
+    documents = [
+        doc
+        for doc in (
+            kb._row_to_document(row) for row in pd.read_csv(csv_path).to_dict("records")
+        )
+        if doc is not None
+    ]
+    start = time.perf_counter()
+    kb.upsert_documents(documents, store_in_mongo=False)
+    return {
+        "documents": len(documents),
+        "seconds": round(time.perf_counter() - start, 3),
+        "embedding_calls": counter.calls,
+        "embedded_texts": counter.texts,
+    }
+
+
+def run_queries(
+    queries: List[Dict],
+    names: List[str],
+    counter: EmbeddingRequestCounter,
+    repeats: int,
+    warm: bool,
+    k: int,
+) -> Dict:
+    from pages import kb
+    from pages.models import Business, CampaignRequest
+
+    def user_request_ranking(query: Dict) -> List[str]:
+        campaign_request = CampaignRequest.model_construct(
+            business=Business(**query["business"]), goal=query["goal"]
+        )
+        context = kb.get_documents_for_user_request(campaign_request)
+        return [match_document(part, names) for part in context.split("\n=====\n")]
+
+    def planner_ranking(query: Dict) -> List[str]:
+        business = query["business"]
+        documents = kb.campaign_planner_retriever(
+            f"{business['type']} {business['name']} {query['goal']}"
+        )
+        if not isinstance(documents, list):
+            return []
+        return [match_document(doc.get("name") or "", names) for doc in documents]
+
+    results = {}
+    for function_name, retrieve in (
+        ("get_documents_for_user_request", user_request_ranking),
+        ("campaign_planner_retriever", planner_ranking),
+    ):
+        latencies = []
+        per_query = []
+        for query in queries:
+            calls_before = counter.calls
+            for _ in range(repeats):
+                if not warm:
+                    kb.query_embedding_cache.clear()
+                    kb.invalidate_retrieval_cache()
+                start = time.perf_counter()
+                ranking = retrieve(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            per_query.append(
+                {
+                    "id": query["id"],
+                    "ranking": ranking,
+                    "embedding_calls": (counter.calls - calls_before) / repeats,
+                    **ranking_metrics(ranking, query["expected"], k),
+                }
+            )
+        results[function_name] = {
+            f"recall@{k}": statistics.mean(q[f"recall@{k}"] for q in per_query),
+            "recall@all": statistics.mean(q["recall@all"] for q in per_query),
+            "mrr": statistics.mean(q["reciprocal_rank"] for q in per_query),
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "mean": statistics.mean(latencies),
+            },
+            "embedding_calls_per_query": statistics.mean(
+                q["embedding_calls"] for q in per_query
+            ),
+            "per_query": per_query,
+        }
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Keep the query caches between repeats instead of measuring cold calls",
+    )
+    parser.add_argument(
+        "--embedder",
+        choices=["local", "openai"],
+        default="local",
+        help="Embedder backend; openai calls the embeddings API",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="retrieval_benchmark_") as workdir:
+        # Must be set before pages.config is imported
+        os.environ["VECTOR_DB_URI"] = os.path.join(workdir, "chromadb")
+        os.environ["LANCEDB_URI"] = os.path.join(workdir, "lancedb")
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(workdir, "lexical_index")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(
+            workdir, "embedding_cache.sqlite"
+        )
+        os.environ["EMBEDDER_BACKEND"] = args.embedder
+        from pages import embedders, kb
+        from pages.config import VECTOR_DB_BACKEND
+
+        counter = EmbeddingRequestCounter(embedders.get_embedder())
+
+        with open(args.queries) as f:
+            queries = json.load(f)
+        ingest = build_knowledge_base(args.csv, counter)
+        names = [
+            metadata.get("name") or ""
+            for metadata in kb.get_vector_collection().get()["metadatas"]
+        ]
+        counter.calls = counter.texts = 0
+        results = run_queries(
+            queries, names, counter, args.repeats, args.warm, args.k
+        )
+
+    report = {
+        "config": {
+            "embedder": args.embedder,
+            "vector_db_backend": VECTOR_DB_BACKEND,
+            "queries": len(queries),
+            "repeats": args.repeats,
+            "warm": args.warm,
+            "k": args.k,
+        },
+        "ingest": ingest,
+        "results": results,
+    }
+    for function_name, metrics in results.items():
+        latency = metrics["latency_ms"]
+        print(
+            f"{function_name}: recall@{args.k}={metrics[f'recall@{args.k}']:.3f} "
+            f"recall@all={metrics['recall@all']:.3f} mrr={metrics['mrr']:.3f} "
+            f"p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms "
+            f"p99={latency['p99']:.1f}ms "
+            f"embedding_calls/query={metrics['embedding_calls_per_query']:.2f}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,196 @@
+import os
+import signal
+import socket
+import threading
 import time
-from datetime import datetime
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
 
 from textwrap import dedent
-from pages.yektanet_utils import create_native_campaign, generate_ad_image, create_ad
+from pages.yektanet_utils import (
+    create_native_campaign,
+    generate_ad_image,
+    create_ad,
+    warm_publisher_group_cache,
+)
 
 from pages.models import (
     GenerateCampaignPlanTask,
     CreateYektanetCampaignTask,
     CampaignPlanDB,
+    AdDescriptionDB,
 )
 from pages.agents import CampaignPlanner
+from pages.agent_factory import checkout_agent
 from pages.kb import add_document_to_knowledge_base
+from pymongo.errors import PyMongoError
+
+from pages.config import (
+    TASK_LEASE_SECONDS,
+    TASK_LEASE_RENEW_INTERVAL,
+    TASK_WORKER_POOL_ENABLED,
+    AD_CREATION_CONCURRENCY,
+    TASK_RETRY_DELAY_SECONDS,
+    TASK_RETRY_MAX_DELAY_SECONDS,
+    get_task_concurrency,
+)
 from pages.mongodb_utils import (
-    fetch_one_task,
+    claim_one_task,
+    count_claimable_tasks,
+    next_task_retry_time,
+    renew_task_lease,
+    release_task,
+    ensure_task_indexes,
+    watch_tasks,
     update_task,
+    update_task_fields,
     insert_task,
     fetch_one_campaign_plan,
     update_campaign_plan,
+    update_campaign_plan_ad,
+    add_created_ad_to_task,
 )
 
 
+def pending_tasks_query(task_type: Optional[str] = None) -> dict:
+    """Query for tasks waiting to be processed, optionally of a single type."""
+    query = {"status": {"$nin": ["completed", "failed", "pending_confirm"]}}
+    if task_type is not None:
+        query["type"] = task_type
+    return query
+
+
+# Tasks that failed more often than this are marked failed
+MAX_TASK_RETRIES = 5
+
+
+def retry_time(retry_count: int) -> datetime:
+    """When a task retried retry_count times may be claimed again."""
+    delay = TASK_RETRY_DELAY_SECONDS * 2 ** min(retry_count, 10)
+    return datetime.utcnow() + timedelta(
+        seconds=min(delay, TASK_RETRY_MAX_DELAY_SECONDS)
+    )
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker no longer holds the lease of the task it processes."""
+
+
+class TaskLease:
+    """Lease of a claimed task, shared by every thread working on the task."""
+
+    def __init__(self, task_id: str, worker_id: str):
+        self.task_id = task_id
+        self.worker_id = worker_id
+        # Set when the lease could not be renewed and may be held by another worker
+        self.lost = threading.Event()
+
+    def check(self) -> None:
+        """Raise LeaseLostError if the task may have been reclaimed.
+
+        Call before every side effect (Yektanet calls, image generation and
+        database writes), so two workers never both act on the same task.
+        """
+        if self.lost.is_set():
+            raise LeaseLostError(f"Lost lease on task {self.task_id}")
+
+
 class TaskConsumer:
-    """Consumes tasks from the task directory and processes them."""
+    """Consumes tasks from the task directory and processes them.
+
+    Tasks are claimed with a lease, so several consumers can run against the
+    same MongoDB without processing the same task twice.
+    """
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        lease_seconds: int = TASK_LEASE_SECONDS,
+        lease_renew_interval: int = TASK_LEASE_RENEW_INTERVAL,
+    ):
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self.lease_seconds = lease_seconds
+        self.lease_renew_interval = lease_renew_interval
+        # Set to stop the worker pool, and to wake it up when a slot frees up
+        self.stop_event = threading.Event()
+        self.wakeup_event = threading.Event()
 
-    def process_generate_campaign_plan(self, task: dict) -> None:
+    @contextmanager
+    def hold_lease(self, task_id: str):
+        """Keep renewing the lease of a claimed task until the block exits.
+
+        Yields the TaskLease; its lost event is set once the lease can not be
+        renewed any more, either because another worker took the task or because
+        renewals kept failing until the lease expired.
+        """
+        lease = TaskLease(task_id, self.worker_id)
+        stop = threading.Event()
+
+        def renew():
+            renewed_at = time.monotonic()
+            while not stop.wait(self.lease_renew_interval):
+                try:
+                    if renew_task_lease(task_id, self.worker_id, self.lease_seconds):
+                        renewed_at = time.monotonic()
+                        continue
+                except PyMongoError as e:
+                    print(f"Could not renew lease on task {task_id}: {e}")
+                    # Keep trying while the last renewal still holds
+                    if (
+                        time.monotonic() - renewed_at
+                        < self.lease_seconds - self.lease_renew_interval
+                    ):
+                        continue
+                print(f"Lost lease on task {task_id}")
+                lease.lost.set()
+                return
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            renewer.join()
+            release_task(task_id, self.worker_id)
+
+    def claim_task(self, task_type: Optional[str] = None) -> Optional[dict]:
+        """Claim the oldest pending task that is not leased by another worker."""
+        return claim_one_task(
+            pending_tasks_query(task_type), self.worker_id, self.lease_seconds
+        )
+
+    def process_task(self, task: dict) -> None:
+        """Dispatch a claimed task to its handler while holding its lease."""
+        with self.hold_lease(task["id"]) as lease:
+            try:
+                if task["type"] == "generate_campaign_plan":
+                    self.process_generate_campaign_plan(task, lease)
+                elif task["type"] == "create_yektanet_campaign":
+                    self.process_create_yektanet_campaign(task, lease)
+                else:
+                    print(f"Unknown task type: {task.get('type', 'NO_TYPE')}")
+                    update_task_fields(task["id"], {"status": "failed"}, self.worker_id)
+            except LeaseLostError as e:
+                print(f"{e}, leaving it to the worker that reclaimed it")
+            except Exception as e:
+                # Released as is, so back off instead of reclaiming it at once
+                print(f"Error processing task {task['id']}: {e}")
+                retry_count = task.get("retry_count", 0) + 1
+                fields = {
+                    "retry_count": retry_count,
+                    "not_before": retry_time(retry_count),
+                }
+                if retry_count > MAX_TASK_RETRIES:
+                    fields["status"] = "failed"
+                update_task_fields(task["id"], fields, self.worker_id)
+
+    def process_generate_campaign_plan(self, task: dict, lease: TaskLease) -> None:
         """Process a generate_campaign_plan task using CampaignPlanner agent."""
         try:
             task = GenerateCampaignPlanTask.model_validate(task)
@@ -41,18 +208,22 @@ class TaskConsumer:
                     campaign_plan_id=task.campaign_plan_id,
                     campaign_request_id=task.campaign_request_id,
                 )
+                lease.check()
                 insert_task(create_yektanet_task)
+                lease.check()
                 self.add_campaign_plan_to_kb(task)
                 task.status = "completed"
             else:
-                campaign_planner = CampaignPlanner(
-                    session_id=task.session_id,
+                lease.check()
+                with checkout_agent(
+                    CampaignPlanner,
+                    task.session_id,
                     campaign_request_id=task.campaign_request_id,
-                )
-                if task.status == "new":
-                    campaign_plan = campaign_planner.respond()
-                elif task.status == "retry_with_feedback":
-                    campaign_plan = campaign_planner.resume(task.feedbacks)
+                ) as campaign_planner:
+                    if task.status == "new":
+                        campaign_plan = campaign_planner.respond()
+                    elif task.status == "retry_with_feedback":
+                        campaign_plan = campaign_planner.resume(task.feedbacks)
 
                 if campaign_plan is None:
                     print(f"Error in CampaignPlanner: {campaign_plan}")
@@ -64,15 +235,19 @@ class TaskConsumer:
                     task.status = "pending_confirm"
                     task.campaign_plan_id = campaign_plan.campaign_plan_id
 
+        except LeaseLostError:
+            raise
         except Exception as e:
             print(
                 f"Error processing campaign plan task for session {task.session_id}: {e}"
             )
             task.status = "failed"
-        update_task(task)
+        if not update_task(task, lease.worker_id):
+            raise LeaseLostError(f"Lost lease on task {task.id}")
 
-    def process_create_yektanet_campaign(self, task: dict) -> None:
+    def process_create_yektanet_campaign(self, task: dict, lease: TaskLease) -> None:
         """Process a create_yektanet_campaign task."""
+        task_id = task["id"]
         try:
             task = CreateYektanetCampaignTask.model_validate(task)
             campaign_plan = fetch_one_campaign_plan(
@@ -80,13 +255,14 @@ class TaskConsumer:
             )
             campaign_plan = CampaignPlanDB.model_validate(campaign_plan)
         except Exception as e:
-            print(
-                f"Error fetching campaign plan for task: {task.campaign_plan_id} error: {e}"
-            )
+            # Retrying can not fix a missing or invalid plan
+            print(f"Error fetching campaign plan for task: {task_id} error: {e}")
+            update_task_fields(task_id, {"status": "failed"}, lease.worker_id)
             return
         try:
             if task.status == "new":
                 if campaign_plan and campaign_plan.type == "native":
+                    lease.check()
                     created_campaign_id = create_native_campaign(
                         name=campaign_plan.name,
                         daily_budget=campaign_plan.budget,
@@ -110,54 +286,108 @@ class TaskConsumer:
                     task.status = "failed"
             elif task.status == "create_ads":
                 print(f"Creating ads for campaign: {task.created_campaign_id}")
-                for ad in campaign_plan.ads_description:
-                    if ad.image.source == "generate" and ad.image.image_url is None:
-                        ad.image.image_url = generate_ad_image(ad.image.prompt)
-                    if ad.image.image_url is None:
-                        print(f"Failed to generate image for ad: {ad.title}")
-                        task.status = "failed"
-                        break
-                    if ad.created_ad_id is None:
-                        created_ad_id = create_ad(
-                            task.created_campaign_id,
-                            ad.title,
-                            ad.image.image_url,
-                            ad.landing_url,
-                            ad.call_to_action,
-                            ad.image.source
-                        )
-                        if created_ad_id is None:
-                            print(
-                                f"Failed to create ad for task: {task.campaign_plan_id}"
+                pending_ads = [
+                    (ad_index, ad)
+                    for ad_index, ad in enumerate(campaign_plan.ads_description)
+                    if ad.created_ad_id is None
+                ]
+                if pending_ads:
+                    with ThreadPoolExecutor(
+                        max_workers=min(AD_CREATION_CONCURRENCY, len(pending_ads)),
+                        thread_name_prefix="ad-worker",
+                    ) as executor:
+                        list(
+                            executor.map(
+                                lambda item: self.create_plan_ad(
+                                    task, campaign_plan, lease, *item
+                                ),
+                                pending_ads,
                             )
-                            task.status = "failed"
-                            break
-                        else:
-                            ad.created_ad_id = str(created_ad_id)
-                            task.created_ads.append(ad.created_ad_id)
-                if task.created_ads is not None and len(task.created_ads) >= len(
-                    campaign_plan.ads_description
-                ):
+                        )
+                task.created_ads = [
+                    ad.created_ad_id
+                    for ad in campaign_plan.ads_description
+                    if ad.created_ad_id is not None
+                ]
+                if len(task.created_ads) >= len(campaign_plan.ads_description):
                     task.status = "completed"
                 else:
+                    # Back off, so a Yektanet outage does not use up the retries
                     task.status = "create_ads"
                     task.retry_count += 1
-                if task.retry_count > 5:
+                    task.not_before = retry_time(task.retry_count)
+                if task.retry_count > MAX_TASK_RETRIES:
                     task.status = "failed"
             else:
                 print(f"No campaign plan found for task: {task.campaign_plan_id}")
                 task.status = "failed"
+        except LeaseLostError:
+            raise
         except Exception as e:
             task.retry_count += 1
-            if task.retry_count > 5:
+            task.not_before = retry_time(task.retry_count)
+            if task.retry_count > MAX_TASK_RETRIES:
                 task.status = "failed"
             print(
                 f"Error processing create yektanet campaign task for session {task.session_id}: {e}"
             )
 
-        update_task(task)
+        # The plan is only written while the task is still ours
+        if not update_task(task, lease.worker_id):
+            raise LeaseLostError(f"Lost lease on task {task.id}")
         update_campaign_plan(campaign_plan)
 
+    def create_plan_ad(
+        self,
+        task: CreateYektanetCampaignTask,
+        campaign_plan: CampaignPlanDB,
+        lease: TaskLease,
+        ad_index: int,
+        ad: AdDescriptionDB,
+    ) -> bool:
+        """Generate the image and create one ad, checkpointing each step.
+
+        The generated image and the created ad ID are persisted as soon as they
+        exist, so a retry of the task only redoes the ads that failed.
+
+        Returns:
+            bool: True if the ad was created
+        """
+        try:
+            if ad.image.source == "generate" and ad.image.image_url is None:
+                lease.check()
+                ad.image.image_url = generate_ad_image(ad.image.prompt)
+                if ad.image.image_url is not None:
+                    lease.check()
+                    update_campaign_plan_ad(campaign_plan.id, ad_index, ad)
+            if ad.image.image_url is None:
+                print(f"Failed to generate image for ad: {ad.title}")
+                return False
+            lease.check()
+            created_ad_id = create_ad(
+                task.created_campaign_id,
+                ad.title,
+                ad.image.image_url,
+                ad.landing_url,
+                ad.call_to_action,
+                ad.image.source,
+            )
+            if created_ad_id is None:
+                print(f"Failed to create ad {ad.title} for task: {task.campaign_plan_id}")
+                return False
+            ad.created_ad_id = str(created_ad_id)
+            # The plan keeps the ad even if the lease was lost meanwhile, so the
+            # worker that reclaimed the task does not create it again
+            update_campaign_plan_ad(campaign_plan.id, ad_index, ad)
+            if not add_created_ad_to_task(task.id, ad.created_ad_id, lease.worker_id):
+                raise LeaseLostError(f"Lost lease on task {task.id}")
+            return True
+        except LeaseLostError:
+            raise
+        except Exception as e:
+            print(f"Error creating ad {ad.title} for task {task.campaign_plan_id}: {e}")
+            return False
+
     def add_campaign_plan_to_kb(self, task: GenerateCampaignPlanTask) -> None:
         """Adds the campaign plan to the knowledge base."""
         try:
@@ -184,46 +414,203 @@ class TaskConsumer:
         except Exception as e:
             print(f"Error adding campaign plan to knowledge base: {e}")
 
-    def run_loop(self, sleep_interval: int = 10) -> None:
-        """Main loop that continuously checks for pending tasks and processes them."""
-        print(
-            f"Starting task consumer loop. Checking tasks every {sleep_interval} seconds..."
-        )
+    def open_task_events(self):
+        """Open a change stream on tasks, or return None if it is unsupported."""
+        try:
+            return watch_tasks()
+        except PyMongoError as e:
+            print(f"Change streams unavailable, falling back to polling: {e}")
+            return None
+
+    def task_event_timeout(self) -> float:
+        """
+        How long to wait for a task event: until the next retry is due, and at
+        most lease_renew_interval so that expired leases are picked up too.
+        """
+        timeout = self.lease_renew_interval
+        retry_at = next_task_retry_time(pending_tasks_query())
+        if retry_at is not None:
+            timeout = min(timeout, (retry_at - datetime.utcnow()).total_seconds())
+        return max(timeout, 0)
+
+    def wait_for_task_event(self, task_events, timeout: float) -> bool:
+        """Block until a task is inserted or updated, or until timeout passes."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if task_events.try_next() is not None:
+                return True
+            if self.wakeup_event.is_set() or self.stop_event.is_set():
+                return False
+        return False
+
+    def run_loop(self, sleep_interval: int = 10, min_sleep_interval: int = 1) -> None:
+        """Main loop that continuously checks for pending tasks and processes them.
+
+        Pending tasks are drained back to back. When the queue is empty the
+        consumer waits for a change-stream event on the Tasks collection, or, on a
+        standalone mongod, polls with an exponential backoff capped at
+        sleep_interval.
+        """
+        print(f"Starting task consumer loop as worker {self.worker_id}...")
+        ensure_task_indexes()
+        warm_publisher_group_cache()
+        task_events = self.open_task_events()
+        idle_polls = 0
 
         while True:
             try:
-                # TODO: get a task with status not one of "completed", "failed", pending_confirm
-                task = fetch_one_task(
-                    {"status": {"$nin": ["completed", "failed", "pending_confirm"]}}
-                )
+                task = self.claim_task()
 
                 if task is not None:
-                    print(f"Found a task: {task}")
-                    if task["type"] == "generate_campaign_plan":
-                        self.process_generate_campaign_plan(task)
-                    elif task["type"] == "create_yektanet_campaign":
-                        self.process_create_yektanet_campaign(task)
-                    else:
-                        print(f"Unknown task type: {task.get('type', 'NO_TYPE')}")
-                        # TODO: Mark unknown task types as failed
+                    print(f"Claimed a task: {task}")
+                    idle_polls = 0
+                    self.process_task(task)
+                    continue
+
+                if task_events is not None:
+                    # Wake up for due retries and expired leases too
+                    self.wait_for_task_event(
+                        task_events, timeout=self.task_event_timeout()
+                    )
                 else:
                     print("No pending tasks found")
-
-                # Sleep before next iteration
-                time.sleep(sleep_interval)
+                    backoff = min_sleep_interval * 2 ** min(idle_polls, 10)
+                    time.sleep(min(backoff, sleep_interval))
+                    idle_polls += 1
 
             except KeyboardInterrupt:
                 print("Task consumer loop interrupted by user")
                 break
+            except PyMongoError as e:
+                print(f"Error in task consumer loop: {e}")
+                if task_events is not None:
+                    task_events.close()
+                time.sleep(sleep_interval)
+                task_events = self.open_task_events()
             except Exception as e:
                 print(f"Error in task consumer loop: {e}")
                 time.sleep(sleep_interval)
 
+        if task_events is not None:
+            task_events.close()
+
+    def fill_pool(
+        self,
+        executor: ThreadPoolExecutor,
+        in_flight: dict[str, set[Future]],
+        limits: dict[str, int],
+    ) -> int:
+        """Claim tasks for free pool slots, busiest task type first.
+
+        Returns:
+            int: Number of tasks submitted to the pool
+        """
+        free_slots = {
+            task_type: limit - len(in_flight[task_type])
+            for task_type, limit in limits.items()
+            if limit - len(in_flight[task_type]) > 0
+        }
+        queue_depths = {
+            task_type: count_claimable_tasks(pending_tasks_query(task_type))
+            for task_type in free_slots
+        }
+
+        submitted = 0
+        for task_type in sorted(
+            free_slots,
+            key=lambda t: queue_depths[t] / limits[t],
+            reverse=True,
+        ):
+            for _ in range(min(free_slots[task_type], queue_depths[task_type])):
+                task = self.claim_task(task_type)
+                if task is None:
+                    break
+                print(f"Claimed a {task_type} task: {task['id']}")
+                future = executor.submit(self.process_task, task)
+                future.add_done_callback(lambda _: self.wakeup_event.set())
+                in_flight[task_type].add(future)
+                submitted += 1
+        return submitted
+
+    def run_pool(
+        self,
+        concurrency: Optional[dict[str, int]] = None,
+        sleep_interval: int = 10,
+        min_sleep_interval: int = 1,
+    ) -> None:
+        """Process tasks concurrently on a thread pool with per task type limits.
+
+        Tasks are network bound (LLM and Yektanet API calls), so a slow plan
+        generation does not hold up ad creation for already confirmed plans.
+        On stop (SIGTERM or Ctrl+C) no new tasks are claimed and in-flight tasks
+        are allowed to finish and release their leases.
+        """
+        limits = concurrency or get_task_concurrency()
+        in_flight: dict[str, set[Future]] = {task_type: set() for task_type in limits}
+        print(f"Starting task consumer pool as worker {self.worker_id} with {limits}")
+
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: self.stop_event.set())
+        except ValueError:
+            # Signal handlers can only be installed from the main thread
+            pass
+
+        ensure_task_indexes()
+        warm_publisher_group_cache()
+        task_events = self.open_task_events()
+        executor = ThreadPoolExecutor(
+            max_workers=sum(limits.values()), thread_name_prefix="task-worker"
+        )
+        idle_polls = 0
+
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.wakeup_event.clear()
+                    for futures in in_flight.values():
+                        futures.difference_update({f for f in futures if f.done()})
+
+                    if self.fill_pool(executor, in_flight, limits) > 0:
+                        idle_polls = 0
+                        continue
+
+                    if task_events is not None:
+                        self.wait_for_task_event(
+                            task_events, timeout=self.task_event_timeout()
+                        )
+                    else:
+                        backoff = min_sleep_interval * 2 ** min(idle_polls, 10)
+                        self.wakeup_event.wait(min(backoff, sleep_interval))
+                        idle_polls += 1
+
+                except PyMongoError as e:
+                    print(f"Error in task consumer pool: {e}")
+                    if task_events is not None:
+                        task_events.close()
+                    self.stop_event.wait(sleep_interval)
+                    task_events = self.open_task_events()
+                except Exception as e:
+                    print(f"Error in task consumer pool: {e}")
+                    self.stop_event.wait(sleep_interval)
+        except KeyboardInterrupt:
+            print("Task consumer pool interrupted by user")
+        finally:
+            self.stop_event.set()
+            running = sum(len(f) for f in in_flight.values())
+            print(f"Waiting for {running} in-flight tasks to finish...")
+            executor.shutdown(wait=True, cancel_futures=True)
+            if task_events is not None:
+                task_events.close()
+            print("Task consumer pool stopped")
+
 
 def main():
     """Main function to run the task consumer."""
     consumer = TaskConsumer()
-    consumer.run_loop()
+    if TASK_WORKER_POOL_ENABLED:
+        consumer.run_pool()
+    else:
+        consumer.run_loop()
 
 
 if __name__ == "__main__":
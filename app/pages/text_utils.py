@@ -0,0 +1,92 @@
+"""
+Text normalization helpers for CampaignGenie application.
+"""
+
+import re
+
+# Arabic code points commonly typed in place of their Persian equivalents
+PERSIAN_CHAR_MAP = str.maketrans(
+    {
+        "ي": "ی",
+        "ى": "ی",
+        "ك": "ک",
+        "ة": "ه",
+        "ۀ": "ه",
+        "أ": "ا",
+        "إ": "ا",
+        "ٱ": "ا",
+        "ؤ": "و",
+        **{chr(0x06F0 + i): str(i) for i in range(10)},  # Persian digits
+        **{chr(0x0660 + i): str(i) for i in range(10)},  # Arabic digits
+    }
+)
+# Harakat, tanwin, superscript alef and tatweel
+DIACRITICS_RE = re.compile("[\u064B-\u065F\u0670\u0640]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize Persian/English text for matching: unify Arabic and Persian
+    letters and digits, drop diacritics, turn ZWNJ into a space, lowercase and
+    collapse whitespace.
+    """
+    text = text.translate(PERSIAN_CHAR_MAP)
+    text = DIACRITICS_RE.sub("", text)
+    text = text.replace("\u200c", " ")
+    return WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+# Frequent Persian function words that carry no meaning for retrieval
+PERSIAN_STOPWORDS = frozenset(
+    "و در به از که این آن را با برای تا یا هم می ها های است بود شد شده "
+    "کرد کند کنید یک بر نیز اما اگر چه".split()
+)
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split normalized text into words, dropping Persian stopwords."""
+    return [
+        token
+        for token in TOKEN_RE.findall(normalize_text(text))
+        if token not in PERSIAN_STOPWORDS
+    ]
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    """Rough token count of text, good enough for prompt budgeting."""
+    return int(len(text) / chars_per_token) + 1
+
+
+def split_into_passages(
+    text: str, max_chars: int, overlap_chars: int = 0
+) -> list[str]:
+    """
+    Split text into passages of at most max_chars, breaking at paragraph or
+    line ends where possible. Consecutive passages share up to overlap_chars
+    of text, so a sentence cut at a boundary is still whole in one of them.
+    """
+    text = text.strip()
+    passages = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            # Prefer the last paragraph, then line, then word break
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start + max_chars // 2, end)
+                if cut != -1:
+                    end = cut
+                    break
+        passage = text[start:end].strip()
+        if passage:
+            passages.append(passage)
+        if end >= len(text):
+            break
+        start = max(end - overlap_chars, start + 1)
+        # Don't start the next passage in the middle of a word
+        space = text.find(" ", start, end)
+        if overlap_chars and space != -1:
+            start = space + 1
+    return passages
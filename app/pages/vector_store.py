@@ -0,0 +1,456 @@
+"""
+Vector store backends for CampaignGenie application.
+The knowledge base reads and writes vectors through VectorStore, so the
+documents and passages collections can live in Chroma or in LanceDB.
+
+Usage (from the repository root), to copy the Chroma collections to LanceDB:
+    PYTHONPATH=app python -m pages.vector_store migrate --from chroma --to lancedb
+"""
+
+import argparse
+import json
+import math
+import threading
+from functools import lru_cache
+from typing import Optional, Dict, List, Any, Sequence
+
+from pages.config import (
+    get_vector_db_uri,
+    VECTOR_DB_TABLE_NAME,
+    VECTOR_DB_BACKEND,
+    LANCEDB_URI,
+    LANCEDB_INDEX_MIN_ROWS,
+    LANCEDB_NPROBES,
+    LANCEDB_REFINE_FACTOR,
+    LANCEDB_INDEX_TYPE,
+    KB_PASSAGE_COLLECTION_NAME,
+    KB_INGEST_CHUNK_SIZE,
+)
+
+DEFAULT_INCLUDE = ("documents", "metadatas")
+
+
+class VectorStore:
+    """
+    A collection of (id, embedding, document, metadata) records.
+
+    The interface is the subset of Chroma's collection API the knowledge base
+    uses, with results in Chroma's shape. Filters (where) are Chroma-style
+    equality or {"$in": [...]} conditions on metadata fields, combined with AND.
+    Distances are cosine distances.
+    """
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[dict],
+    ) -> None:
+        raise NotImplementedError
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = DEFAULT_INCLUDE,
+    ) -> Dict[str, list]:
+        """Records by id and/or filter, as {"ids": [...], "documents": [...], ...}."""
+        raise NotImplementedError
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[Dict] = None,
+        include: Sequence[str] = DEFAULT_INCLUDE + ("distances",),
+    ) -> Dict[str, list]:
+        """Nearest records of each query embedding, one result list per query."""
+        raise NotImplementedError
+
+    def delete(
+        self, ids: Optional[List[str]] = None, where: Optional[Dict] = None
+    ) -> None:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def ensure_indexes(self) -> None:
+        """Build or refresh search indexes after bulk writes, if the backend has any."""
+
+
+@lru_cache(maxsize=None)
+def get_chroma_client(path: str):
+    import chromadb
+
+    return chromadb.PersistentClient(path=path)
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma collection with a cosine HNSW index, kept in memory while open."""
+
+    def __init__(self, path: str, collection_name: str):
+        self.collection = get_chroma_client(path).get_or_create_collection(
+            name=collection_name, metadata={"hnsw:space": "cosine"}
+        )
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(
+            ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+        )
+
+    def get(
+        self, ids=None, where=None, limit=None, offset=None, include=DEFAULT_INCLUDE
+    ):
+        result = self.collection.get(
+            ids=ids, where=where, limit=limit, offset=offset, include=list(include)
+        )
+        if "embeddings" in include and result.get("embeddings") is not None:
+            result["embeddings"] = [
+                list(map(float, embedding)) for embedding in result["embeddings"]
+            ]
+        return result
+
+    def query(
+        self,
+        query_embeddings,
+        n_results,
+        where=None,
+        include=DEFAULT_INCLUDE + ("distances",),
+    ):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=list(include),
+        )
+
+    def delete(self, ids=None, where=None) -> None:
+        self.collection.delete(ids=ids, where=where)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+@lru_cache(maxsize=None)
+def get_lancedb_connection(uri: str):
+    import lancedb
+
+    return lancedb.connect(uri)
+
+
+def sql_literal(value: Any) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class LanceDBVectorStore(VectorStore):
+    """
+    LanceDB table of vectors in the Lance columnar format.
+
+    Tables are memory-mapped from disk, so the corpus does not have to fit in
+    RAM. Metadata is stored as JSON, and FILTER_COLUMNS are also stored as
+    columns so filters are pushed down to the scan (prefilter) instead of being
+    applied to the top-k. Large tables are searched with a quantized IVF index
+    (IVF_PQ or int8 IVF_HNSW_SQ) whose candidates are refined with the stored
+    vectors.
+    """
+
+    FILTER_COLUMNS = ("contenttype", "parent_id")
+
+    def __init__(
+        self,
+        uri: str,
+        table_name: str,
+        index_min_rows: int = LANCEDB_INDEX_MIN_ROWS,
+        nprobes: int = LANCEDB_NPROBES,
+        refine_factor: int = LANCEDB_REFINE_FACTOR,
+        index_type: str = LANCEDB_INDEX_TYPE,
+    ):
+        self.connection = get_lancedb_connection(uri)
+        self.table_name = table_name
+        self.index_min_rows = index_min_rows
+        self.nprobes = nprobes
+        self.refine_factor = refine_factor
+        self.index_type = index_type
+        self._lock = threading.Lock()
+        self._table = None
+
+    @property
+    def table(self):
+        """The table, or None until the first upsert creates it."""
+        if self._table is None and self.table_name in self.connection.table_names():
+            self._table = self.connection.open_table(self.table_name)
+        return self._table
+
+    def _schema(self, dimensions: int):
+        import pyarrow as pa
+
+        return pa.schema(
+            [
+                pa.field("id", pa.string()),
+                pa.field("vector", pa.list_(pa.float32(), dimensions)),
+                pa.field("document", pa.string()),
+                pa.field("metadata", pa.string()),
+                *(pa.field(column, pa.string()) for column in self.FILTER_COLUMNS),
+            ]
+        )
+
+    def where_to_sql(
+        self, where: Optional[Dict] = None, ids: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """Translate Chroma-style filters into a LanceDB SQL predicate."""
+        clauses = []
+        conditions = dict(where or {})
+        if ids is not None:
+            conditions["id"] = {"$in": ids}
+        for field, condition in conditions.items():
+            if field != "id" and field not in self.FILTER_COLUMNS:
+                raise ValueError(f"Unsupported vector store filter: {field}")
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if operator == "$eq":
+                    clauses.append(f"{field} = {sql_literal(value)}")
+                elif operator == "$in":
+                    values = ", ".join(sql_literal(item) for item in value)
+                    clauses.append(f"{field} IN ({values})" if value else "false")
+                else:
+                    raise ValueError(f"Unsupported vector store operator: {operator}")
+        return " AND ".join(clauses) or None
+
+    @staticmethod
+    def _select(include: Sequence[str]) -> List[str]:
+        columns = ["id"]
+        if "documents" in include:
+            columns.append("document")
+        if "metadatas" in include:
+            columns.append("metadata")
+        if "embeddings" in include:
+            columns.append("vector")
+        return columns
+
+    @staticmethod
+    def _result(rows: List[dict], include: Sequence[str]) -> Dict[str, list]:
+        result = {"ids": [row["id"] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row["document"] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row["metadata"]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [list(map(float, row["vector"])) for row in rows]
+        if "distances" in include:
+            result["distances"] = [row["_distance"] for row in rows]
+        return result
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        import pyarrow as pa
+
+        if not ids:
+            return
+        schema = self._schema(len(embeddings[0]))
+        data = pa.Table.from_pylist(
+            [
+                {
+                    "id": doc_id,
+                    "vector": list(embedding),
+                    "document": document,
+                    "metadata": json.dumps(metadata or {}, ensure_ascii=False),
+                    **{
+                        column: (
+                            None
+                            if (metadata or {}).get(column) is None
+                            else str(metadata[column])
+                        )
+                        for column in self.FILTER_COLUMNS
+                    },
+                }
+                for doc_id, embedding, document, metadata in zip(
+                    ids, embeddings, documents, metadatas
+                )
+            ],
+            schema=schema,
+        )
+        with self._lock:
+            if self.table is None:
+                self._table = self.connection.create_table(
+                    self.table_name, schema=schema, exist_ok=True
+                )
+            self.table.merge_insert(
+                "id"
+            ).when_matched_update_all().when_not_matched_insert_all().execute(data)
+
+    def get(
+        self, ids=None, where=None, limit=None, offset=None, include=DEFAULT_INCLUDE
+    ):
+        if self.table is None or ids == []:
+            return self._result([], include)
+        predicate = self.where_to_sql(where, ids)
+        query = self.table.search().select(self._select(include))
+        if predicate:
+            query = query.where(predicate)
+        query = query.limit(limit or max(self.table.count_rows(predicate), 1))
+        if offset:
+            query = query.offset(offset)
+        return self._result(query.to_list(), include)
+
+    def query(
+        self,
+        query_embeddings,
+        n_results,
+        where=None,
+        include=DEFAULT_INCLUDE + ("distances",),
+    ):
+        results: Dict[str, list] = {key: [] for key in ("ids", *include)}
+        for embedding in query_embeddings:
+            rows = []
+            if self.table is not None:
+                query = (
+                    self.table.search(list(embedding), vector_column_name="vector")
+                    .metric("cosine")
+                    .select(self._select(include))
+                    .limit(n_results)
+                    .nprobes(self.nprobes)
+                    .refine_factor(self.refine_factor)
+                )
+                predicate = self.where_to_sql(where)
+                if predicate:
+                    query = query.where(predicate, prefilter=True)
+                rows = query.to_list()
+            for key, values in self._result(rows, include).items():
+                results[key].append(values)
+        return results
+
+    def delete(self, ids=None, where=None) -> None:
+        if self.table is None or ids == []:
+            return
+        predicate = self.where_to_sql(where, ids)
+        with self._lock:
+            self.table.delete(predicate or "true")
+
+    def count(self) -> int:
+        return 0 if self.table is None else self.table.count_rows()
+
+    @staticmethod
+    def num_sub_vectors(dimensions: int) -> int:
+        """PQ sub-vectors of ~16 dimensions each; must divide the dimensions."""
+        for sub_vectors in range(max(dimensions // 16, 1), 0, -1):
+            if dimensions % sub_vectors == 0:
+                return sub_vectors
+        return 1
+
+    def ensure_indexes(self) -> None:
+        """
+        Index the filter columns, and build the vector index once the
+        table has index_min_rows rows. Rows added after that are found by a
+        flat scan until the next optimize, so call this after bulk ingests.
+        """
+        table = self.table
+        if table is None:
+            return
+        with self._lock:
+            for column in self.FILTER_COLUMNS:
+                table.create_scalar_index(column, replace=True)
+            rows = table.count_rows()
+            vector_indexed = any(
+                "vector" in index.columns for index in table.list_indices()
+            )
+            if vector_indexed:
+                table.optimize()
+            elif rows >= self.index_min_rows:
+                dimensions = table.schema.field("vector").type.list_size
+                table.create_index(
+                    metric="cosine",
+                    vector_column_name="vector",
+                    index_type=self.index_type,
+                    num_partitions=max(int(math.sqrt(rows)), 1),
+                    num_sub_vectors=self.num_sub_vectors(dimensions),
+                    replace=True,
+                )
+
+
+@lru_cache(maxsize=None)
+def get_vector_store(name: str, backend: str = VECTOR_DB_BACKEND) -> VectorStore:
+    """Get the process-wide store of a collection in the given backend."""
+    if backend == "chroma":
+        return ChromaVectorStore(get_vector_db_uri(), name)
+    if backend == "lancedb":
+        return LanceDBVectorStore(LANCEDB_URI, name)
+    raise ValueError(f"Unknown vector database backend: {backend}")
+
+
+def migrate_vector_store(
+    source_backend: str,
+    target_backend: str,
+    names: Optional[Sequence[str]] = None,
+    batch_size: int = KB_INGEST_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Copy collections between backends, reusing the stored embeddings.
+    Records already in the target are overwritten, so re-running is safe.
+    By default copies the document and passage collections the knowledge base
+    reads for the configured embedder and vector size.
+
+    Returns:
+        dict: Number of copied records per collection
+    """
+    if names is None:
+        # Imported here, pages.kb imports this module
+        from pages.kb import vector_collection_name
+
+        names = [
+            vector_collection_name(VECTOR_DB_TABLE_NAME),
+            vector_collection_name(KB_PASSAGE_COLLECTION_NAME),
+        ]
+    copied = {}
+    for name in names:
+        source = get_vector_store(name, source_backend)
+        target = get_vector_store(name, target_backend)
+        offset = 0
+        while True:
+            result = source.get(
+                limit=batch_size,
+                offset=offset,
+                include=("documents", "metadatas", "embeddings"),
+            )
+            if not result["ids"]:
+                break
+            target.upsert(
+                result["ids"],
+                result["embeddings"],
+                result["documents"],
+                result["metadatas"],
+            )
+            offset += len(result["ids"])
+            print(f"{name}: copied {offset} records")
+        target.ensure_indexes()
+        copied[name] = offset
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Manage knowledge base vector stores"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser(
+        "migrate", help="Copy collections between backends"
+    )
+    migrate.add_argument("--from", dest="source", default="chroma")
+    migrate.add_argument("--to", dest="target", default="lancedb")
+    migrate.add_argument("--batch-size", type=int, default=KB_INGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        copied = migrate_vector_store(
+            args.source, args.target, batch_size=args.batch_size
+        )
+        print(f"Migrated {copied} from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
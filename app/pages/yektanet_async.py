@@ -0,0 +1,353 @@
+"""
+Async Yektanet API client for CampaignGenie application.
+Non-blocking counterparts of the campaign, publisher group and ad functions in
+pages.yektanet_utils, for use from an asyncio worker. Request bodies, response
+parsing, authentication and retry policy are shared with the sync functions.
+"""
+
+import asyncio
+import time
+import weakref
+from io import BytesIO
+from typing import Optional, Any, Dict
+
+import httpx
+from PIL import Image
+
+from pages.config import (
+    YEKTANET_API_URL,
+    YEKTANET_AD_MANAGEMENT_URL,
+    YEKTANET_HTTP_CONNECT_TIMEOUT,
+    YEKTANET_HTTP_READ_TIMEOUT,
+    YEKTANET_HTTP_MAX_RETRIES,
+    YEKTANET_HTTP_BACKOFF_FACTOR,
+    YEKTANET_HTTP_POOL_SIZE,
+)
+from pages.http_client import RetryPolicy, EndpointMetrics, endpoint_name, rewind_files
+from pages.yektanet_utils import (
+    PUBLISHER_GROUPS,
+    token_manager,
+    build_native_campaign_payload,
+    build_publisher_group_payload,
+    build_ad_form,
+    parse_created_id,
+    publisher_group_cache,
+    resize_image,
+)
+
+# httpx counterparts of http_client.NOT_SENT_ERRORS
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Per event loop and (name, campaign type), so concurrent coroutines create a
+# publisher group once; the sync functions use publisher_group_cache.create_lock
+publisher_group_locks: "weakref.WeakKeyDictionary[Any, Dict[tuple, asyncio.Lock]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def publisher_group_lock(pg_name: str, campaign_type: str) -> asyncio.Lock:
+    """The lock serializing get-or-create of a publisher group on this loop."""
+    locks = publisher_group_locks.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault((pg_name, campaign_type), asyncio.Lock())
+
+
+class AsyncYektanetClient:
+    """
+    Pooled, retrying async client for the Yektanet APIs.
+
+    One instance owns an httpx.AsyncClient, so it must be used from a single
+    event loop. Use it as an async context manager to close its connections.
+    """
+
+    def __init__(
+        self,
+        api_url: str = YEKTANET_API_URL,
+        ad_management_url: str = YEKTANET_AD_MANAGEMENT_URL,
+        timeout: Optional[httpx.Timeout] = None,
+        max_connections: int = YEKTANET_HTTP_POOL_SIZE,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
+        self.api_url = api_url
+        self.ad_management_url = ad_management_url
+        self.retry_policy = retry_policy or RetryPolicy(
+            YEKTANET_HTTP_MAX_RETRIES, YEKTANET_HTTP_BACKOFF_FACTOR
+        )
+        self.metrics = EndpointMetrics()
+        self.client = httpx.AsyncClient(
+            timeout=timeout
+            or httpx.Timeout(
+                YEKTANET_HTTP_READ_TIMEOUT, connect=YEKTANET_HTTP_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def __aenter__(self) -> "AsyncYektanetClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def request(
+        self, method: str, url: str, endpoint: Optional[str] = None, **kwargs
+    ) -> httpx.Response:
+        """Send a request, retrying transient failures like HttpClient.request."""
+        method = method.upper()
+        endpoint = endpoint or endpoint_name(method, url)
+
+        attempt = 0
+        while True:
+            rewind_files(kwargs.get("files"))
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                retry = self.retry_policy.should_retry_error(
+                    method, e, attempt, NOT_SENT_ERRORS
+                )
+                latency = time.perf_counter() - start
+                self.metrics.record(endpoint, latency, retried=retry)
+                if not retry:
+                    raise
+                print(f"{endpoint}: {e!r}, retrying")
+                await asyncio.sleep(self.retry_policy.backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            retry = self.retry_policy.should_retry_status(
+                method, response.status_code, attempt
+            )
+            self.metrics.record(
+                endpoint, time.perf_counter() - start, response.status_code, retry
+            )
+            if not retry:
+                return response
+            print(f"{endpoint}: status {response.status_code}, retrying")
+            await asyncio.sleep(
+                self.retry_policy.backoff_delay(
+                    attempt, response.headers.get("Retry-After")
+                )
+            )
+            attempt += 1
+
+    async def authorized_request(
+        self, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        """Send a request with the shared JWT, refreshing and retrying once on 401."""
+        headers = await asyncio.to_thread(token_manager.headers)
+        response = await self.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            token_manager.invalidate(headers)
+            headers = await asyncio.to_thread(token_manager.headers)
+            response = await self.request(method, url, headers=headers, **kwargs)
+        return response
+
+    async def create_native_campaign(
+        self,
+        name: str,
+        daily_budget: int,
+        cost_per_click: int,
+        page_keywords: list[str],
+        page_categories: list[str],
+        user_segments: list[str],
+        publisher_group_name: str = None,
+    ) -> Optional[int]:
+        if publisher_group_name:
+            publisher_group_id = str(
+                await self.get_or_create_publisher_group(publisher_group_name, "native")
+            )
+        else:
+            publisher_group_id = ""
+        advertiser_id = await asyncio.to_thread(
+            lambda: token_manager.advertiser_id
+        )
+        response = await self.authorized_request(
+            "POST",
+            f"{self.api_url}/api/v2/adv/campaigns/",
+            json=build_native_campaign_payload(
+                name,
+                daily_budget,
+                cost_per_click,
+                page_keywords,
+                page_categories,
+                user_segments,
+                publisher_group_id,
+                advertiser_id,
+            ),
+        )
+        campaign_id = parse_created_id(response.status_code, response.text)
+        if campaign_id is not None:
+            print(f"{campaign_id}: Created campaign")
+        return campaign_id
+
+    async def list_publisher_groups(self) -> Optional[list[dict]]:
+        print("Fetching publisher groups...")
+        response = await self.authorized_request(
+            "GET", f"{self.api_url}/api/v2/adv/publishers/groups/"
+        )
+        if response.status_code != 200:
+            print(response.text, response.status_code)
+            return None
+        groups = response.json()
+        publisher_group_cache.load(groups)
+        return groups
+
+    async def get_or_create_publisher_group(self, pg_name, campaign_type):
+        pg_id = publisher_group_cache.get(pg_name, campaign_type)
+        if pg_id is not None:
+            return pg_id
+
+        async with publisher_group_lock(pg_name, campaign_type):
+            # Another coroutine may have created it while this one waited
+            pg_id = publisher_group_cache.get(pg_name, campaign_type)
+            if pg_id is not None:
+                return pg_id
+            if await self.list_publisher_groups() is None:
+                return ""
+            pg_id = publisher_group_cache.get(pg_name, campaign_type)
+            if pg_id is None:
+                assert pg_name in PUBLISHER_GROUPS, "Invalid publisher_group_name"
+                pg_id = await self.create_publisher_group(
+                    pg_name, PUBLISHER_GROUPS[pg_name], campaign_type
+                )
+        return pg_id
+
+    async def create_publisher_group(
+        self, title: str, publishers: list[str], campaign_type: str
+    ):
+        print(f"Creating publisher group: {title}")
+        response = await self.authorized_request(
+            "POST",
+            f"{self.api_url}/api/v2/adv/publishers/groups/create/",
+            json=build_publisher_group_payload(title, publishers, campaign_type),
+        )
+        group_id = parse_created_id(response.status_code, response.text)
+        if group_id is not None:
+            print(f"Created publisher group with ID: {group_id}")
+            publisher_group_cache.set(title, campaign_type, group_id)
+        else:
+            publisher_group_cache.invalidate()
+        return group_id
+
+    async def read_and_resize_image(
+        self, image_path: str, image_source: str
+    ) -> BytesIO:
+        if image_source == "user_asset":
+            response = await self.request(
+                "GET", image_path, endpoint="GET user_asset_image"
+            )
+            response.raise_for_status()
+            return await asyncio.to_thread(
+                lambda: resize_image(Image.open(BytesIO(response.content)))
+            )
+        return await asyncio.to_thread(lambda: resize_image(Image.open(image_path)))
+
+    async def create_ad(
+        self,
+        campaign_id: int,
+        ad_title: str,
+        image_path: str,
+        ad_url: str,
+        ad_cta_title: str,
+        image_source: str,
+    ):
+        image_file = await self.read_and_resize_image(image_path, image_source)
+        print(f"{campaign_id}: Creating ad")
+        response = await self.authorized_request(
+            "POST",
+            f"{self.ad_management_url}/v1/ad/",
+            data=build_ad_form(campaign_id, ad_title, ad_url, ad_cta_title),
+            files={"image": ("image.png", image_file, "image/png")},
+        )
+        ad_id = parse_created_id(response.status_code, response.text)
+        if ad_id is not None:
+            print(f"{campaign_id}: Created ad {ad_id}")
+        return ad_id
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot of per-endpoint request counts, statuses and latencies."""
+        return self.metrics.snapshot()
+
+
+async def create_native_campaign(
+    name: str,
+    daily_budget: int,
+    cost_per_click: int,
+    page_keywords: list[str],
+    page_categories: list[str],
+    user_segments: list[str],
+    publisher_group_name: str = None,
+    *,
+    client: Optional[AsyncYektanetClient] = None,
+) -> Optional[int]:
+    """Async create_native_campaign; pass a shared client to reuse connections."""
+    if client is not None:
+        return await client.create_native_campaign(
+            name,
+            daily_budget,
+            cost_per_click,
+            page_keywords,
+            page_categories,
+            user_segments,
+            publisher_group_name,
+        )
+    async with AsyncYektanetClient() as client:
+        return await client.create_native_campaign(
+            name,
+            daily_budget,
+            cost_per_click,
+            page_keywords,
+            page_categories,
+            user_segments,
+            publisher_group_name,
+        )
+
+
+async def get_or_create_publisher_group(
+    pg_name, campaign_type, *, client: Optional[AsyncYektanetClient] = None
+):
+    """Async get_or_create_publisher_group."""
+    if client is not None:
+        return await client.get_or_create_publisher_group(pg_name, campaign_type)
+    async with AsyncYektanetClient() as client:
+        return await client.get_or_create_publisher_group(pg_name, campaign_type)
+
+
+async def create_publisher_group(
+    title: str,
+    publishers: list[str],
+    campaign_type: str,
+    *,
+    client: Optional[AsyncYektanetClient] = None,
+):
+    """Async create_publisher_group."""
+    if client is not None:
+        return await client.create_publisher_group(title, publishers, campaign_type)
+    async with AsyncYektanetClient() as client:
+        return await client.create_publisher_group(title, publishers, campaign_type)
+
+
+async def create_ad(
+    campaign_id: int,
+    ad_title: str,
+    image_path: str,
+    ad_url: str,
+    ad_cta_title: str,
+    image_source: str,
+    *,
+    client: Optional[AsyncYektanetClient] = None,
+):
+    """Async create_ad; pass a shared client to overlap many ads on one loop."""
+    if client is not None:
+        return await client.create_ad(
+            campaign_id, ad_title, image_path, ad_url, ad_cta_title, image_source
+        )
+    async with AsyncYektanetClient() as client:
+        return await client.create_ad(
+            campaign_id, ad_title, image_path, ad_url, ad_cta_title, image_source
+        )
@@ -1,7 +1,10 @@
+import base64
 import json
 import requests
 import random
 import os
+import threading
+import time
 import uuid
 from typing import Optional
 from textwrap import dedent
@@ -11,13 +14,35 @@ from PIL import Image
 
 import dotenv
 
+from pages.config import (
+    YEKTANET_API_URL,
+    YEKTANET_AD_MANAGEMENT_URL,
+    YEKTANET_ACCOUNTS_URL,
+    YEKTANET_ASSISTANT_URL,
+    YEKTANET_HTTP_CONNECT_TIMEOUT,
+    YEKTANET_HTTP_READ_TIMEOUT,
+    YEKTANET_HTTP_MAX_RETRIES,
+    YEKTANET_HTTP_BACKOFF_FACTOR,
+    YEKTANET_HTTP_POOL_SIZE,
+    PUBLISHER_GROUP_CACHE_TTL_SECONDS,
+)
+from pages.http_client import HttpClient
+
 dotenv.load_dotenv(".env", verbose=True, override=True)
 
-ADVERTISER_ID = ""
 SESSION_ID = os.getenv("SESSION_ID")
 COOKIES = f"sessionid={SESSION_ID}"
 ACCOUNT_ID = os.getenv("ACCOUNT_ID")
 
+# Shared keep-alive connection pools for api, ad-management, assistant and
+# accounts hosts. Transient 429/5xx responses are retried with backoff.
+yektanet_client = HttpClient(
+    timeout=(YEKTANET_HTTP_CONNECT_TIMEOUT, YEKTANET_HTTP_READ_TIMEOUT),
+    max_retries=YEKTANET_HTTP_MAX_RETRIES,
+    backoff_factor=YEKTANET_HTTP_BACKOFF_FACTOR,
+    pool_maxsize=YEKTANET_HTTP_POOL_SIZE,
+)
+
 PUBLISHER_GROUPS = {
     "BEAUTY-HEALTH": [
         27776, #khabarjoo24.com
@@ -119,35 +144,242 @@ SEGMENT_MAP = {
 }
 
 
+class YektanetTokenManager:
+    """
+    Caches the Yektanet JWT and advertiser ID and refreshes the token only when
+    it is about to expire or has been rejected. Safe to share between threads.
+    """
+
+    def __init__(
+        self, refresh_margin_seconds: int = 60, default_ttl_seconds: int = 300
+    ):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.default_ttl_seconds = default_ttl_seconds
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._advertiser_id: Optional[str] = None
+
+    @staticmethod
+    def token_expiry(token: str) -> Optional[float]:
+        """Read the exp claim of a JWT without verifying its signature."""
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    def _fetch_token(self) -> str:
+        print("Refreshing token")
+        response = yektanet_client.get(
+            url=f"{YEKTANET_ACCOUNTS_URL}/api/v2/token/access/internal/?account={ACCOUNT_ID}",
+            headers={
+                "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:140.0) Gecko/20100101 Firefox/140.0",
+                "Accept": "application/json, text/plain, */*",
+                "Accept-Language": "en-US,en;q=0.5",
+                "Referer": "https://panel.yektanet.com/",
+                "Origin": "https://panel.yektanet.com",
+                "Connection": "keep-alive",
+                "Cookie": COOKIES,
+                "Sec-Fetch-Dest": "empty",
+                "Sec-Fetch-Mode": "cors",
+                "Sec-Fetch-Site": "same-site",
+                "TE": "trailers",
+            },
+        )
+        if response.status_code != 200:
+            print("Refresh_token", response)
+        return json.loads(response.text)["token"]
+
+    def _refresh(self) -> None:
+        token = self._fetch_token()
+        expires_at = self.token_expiry(token)
+        self._token = token
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl_seconds
+        self._expires_at = expires_at
+        if self._advertiser_id is None:
+            response = yektanet_client.get(
+                f"{YEKTANET_API_URL}/api/v2/adv/profile/",
+                headers=self._headers(),
+            )
+            self._advertiser_id = str(json.loads(response.text)["id"])
+
+    def _headers(self) -> dict:
+        return {"Authorization": "JWT " + self._token, "Cookie": COOKIES}
+
+    def _ensure_token(self) -> None:
+        if (
+            self._token is None
+            or time.time() >= self._expires_at - self.refresh_margin_seconds
+        ):
+            self._refresh()
+
+    def headers(self) -> dict:
+        """Get authorization headers, refreshing the token if needed."""
+        with self._lock:
+            self._ensure_token()
+            return self._headers()
+
+    @property
+    def advertiser_id(self) -> str:
+        with self._lock:
+            self._ensure_token()
+            return self._advertiser_id
+
+    def invalidate(self, headers: Optional[dict] = None) -> None:
+        """
+        Drop the cached token. When headers are given, only drop it if they still
+        carry the current token, so concurrent 401s trigger a single refresh.
+        """
+        with self._lock:
+            if headers is None or headers.get("Authorization") == "JWT " + str(
+                self._token
+            ):
+                self._token = None
+
+    def refresh(self) -> None:
+        """Force a token refresh."""
+        with self._lock:
+            self._refresh()
+
+
+token_manager = YektanetTokenManager()
+
+
 def refresh_token():
-    global HEADERS, ADVERTISER_ID
-    print("Refreshing token")
-    response = requests.get(
-        url=f"https://accounts.yektanet.com/api/v2/token/access/internal/?account={ACCOUNT_ID}",
-        headers={
-            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:140.0) Gecko/20100101 Firefox/140.0",
-            "Accept": "application/json, text/plain, */*",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Referer": "https://panel.yektanet.com/",
-            "Origin": "https://panel.yektanet.com",
-            "Connection": "keep-alive",
-            "Cookie": COOKIES,
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-site",
-            "TE": "trailers",
+    """Force a refresh of the shared Yektanet token."""
+    token_manager.refresh()
+
+
+def authorized_request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request with the cached JWT, refreshing and retrying once on 401."""
+    headers = token_manager.headers()
+    response = yektanet_client.request(method, url, headers=headers, **kwargs)
+    if response.status_code == 401:
+        token_manager.invalidate(headers)
+        response = yektanet_client.request(
+            method, url, headers=token_manager.headers(), **kwargs
+        )
+    return response
+
+
+def get_yektanet_http_metrics() -> dict:
+    """Per-endpoint request, retry, error and latency metrics of Yektanet calls."""
+    return yektanet_client.get_metrics()
+
+
+def build_native_campaign_payload(
+    name: str,
+    daily_budget: int,
+    cost_per_click: int,
+    page_keywords: list[str],
+    page_categories: list[str],
+    user_segments: list[str],
+    publisher_group_id: str,
+    advertiser_id: str,
+) -> dict:
+    """Request body of the native campaign creation API."""
+    page_categories = [
+        category for category in page_categories if category in CATEGORY_MAP
+    ]
+    user_segments = [segment for segment in user_segments if segment in SEGMENT_MAP]
+    return {
+        "title": name,
+        "campaign_type": "native",
+        "only_re_targeting": False,
+        "only_related_content": True,
+        "is_keyword": len(page_keywords) > 0,
+        "is_category": len(page_categories) > 0,
+        "is_audience_sharing": False,
+        "is_autotargeting": False,
+        "segmentation_selected": len(user_segments) > 0,
+        "auto_publishers_select": not publisher_group_id,
+        "display_publisher_group": publisher_group_id,
+        "publishers_visible": True,
+        "core_partners": [],
+        "is_fixed": False,
+        "property_type": None,
+        "minimum_interval_between_duplicates": 24,
+        "cost_limit": daily_budget,
+        "bid": cost_per_click,
+        "use_campaign_total_balance": False,
+        "bidding_strategy": "cpc",
+        "monetization_type": "cpc",
+        "utm_campaign": f"adv_{advertiser_id}_{''.join(random.choices('123456789', k=7))}",
+        "utm_medium": "native-targeted",
+        "utm_term_status": "محتوا",
+        "utm_term": "",
+        "utm_content_status": "ناشر",
+        "utm_content": "",
+        "utm_source": "yektanet",
+        "is_daily": False,
+        "is_periodic": False,
+        "device_os_type": "all",
+        "display_all_os_versions": True,
+        "display_all_mobile_brands": True,
+        "display_mobile_brand": [],
+        "display_all_countries": True,
+        "countries": [],
+        "display_location": [],
+        "show_only_in_capital": False,
+        "display_in_all_isp": True,
+        "display_isp": [
+            "Shatel",
+            "Iran Cell",
+            "Mobile Communication Company",
+            "Rightel",
+            "Asiatech",
+            "Mobin Net",
+            "Telecommunication",
+            "Pars Online",
+            "Afranet",
+            "Respina",
+            "Information Technology Company",
+            "Neda Rayaneh",
+            "Other",
+        ],
+        "publisher_floating_bids": [],
+        "publisher_group_floating_bids": [],
+        "subcategories": [
+            {"category_id": CATEGORY_MAP.get(category), "subcategory_id": 0}
+            for category in page_categories
+        ],
+        "keywords": [{"keyword": keyword} for keyword in page_keywords],
+        "negative_keywords": [],
+        "broad_allowed": True,
+        "goal": {"type": "9", "tags": []},
+        "config": {
+            "segment_ids": [SEGMENT_MAP.get(segment) for segment in user_segments],
         },
-    )
-    if response.status_code != 200:
-        print("Refresh_token", response)
-    HEADERS = {
-        "Authorization": "JWT " + json.loads(response.text)["token"],
-        "Cookie": COOKIES,
+        "segmentation_enabled": len(user_segments) > 0,
+        "target_suppliers": ["web", "push"],
+        "is_push_supplier_active": True,
+        "is_adivery_supplier_active": False,
+        "is_divar": False,
+        "divar_config": {
+            "cities": [],
+            "category_slugs": [],
+            "categories": [],
+            "keywords": [],
+            "neighborhoods": [],
+            "min_price": None,
+            "max_price": None,
+            "brands": [],
+            "smart_targeting": True,
+        },
+        "is_rubika": False,
+        "user_apply": False,  # Indicates campaign should be active or not
     }
-    response = requests.get(
-        "https://api.yektanet.com/api/v2/adv/profile/", headers=HEADERS
-    )
-    ADVERTISER_ID = json.loads(response.text)["id"]
+
+
+def parse_created_id(status_code: int, text: str) -> Optional[int]:
+    """Extract the id of a created object, or None if creation failed."""
+    if status_code != 201:
+        print(text, status_code)
+        return None
+    return json.loads(text)["id"]
 
 
 def create_native_campaign(
@@ -159,174 +391,163 @@ def create_native_campaign(
     user_segments: list[str],
     publisher_group_name: str = None
 ) -> Optional[int]:
-    page_categories = [
-        category for category in page_categories if category in CATEGORY_MAP
-    ]
-    user_segments = [segment for segment in user_segments if segment in SEGMENT_MAP]
-    refresh_token()
     if publisher_group_name:
         publisher_group_id = str(get_or_create_publisher_group(publisher_group_name, "native"))
-        auto_publishers_select = False
     else:
         publisher_group_id = ""
-        auto_publishers_select = True
-    campaign_creation_request = requests.post(
-        url="https://api.yektanet.com/api/v2/adv/campaigns/",
-        headers=HEADERS,
-        json={
-            "title": name,
-            "campaign_type": "native",
-            "only_re_targeting": False,
-            "only_related_content": True,
-            "is_keyword": len(page_keywords) > 0,
-            "is_category": len(page_categories) > 0,
-            "is_audience_sharing": False,
-            "is_autotargeting": False,
-            "segmentation_selected": len(user_segments) > 0,
-            "auto_publishers_select": auto_publishers_select,
-            "display_publisher_group": publisher_group_id,
-            "publishers_visible": True,
-            "core_partners": [],
-            "is_fixed": False,
-            "property_type": None,
-            "minimum_interval_between_duplicates": 24,
-            "cost_limit": daily_budget,
-            "bid": cost_per_click,
-            "use_campaign_total_balance": False,
-            "bidding_strategy": "cpc",
-            "monetization_type": "cpc",
-            "utm_campaign": f"adv_{ADVERTISER_ID}_{''.join(random.choices('123456789', k=7))}",
-            "utm_medium": "native-targeted",
-            "utm_term_status": "محتوا",
-            "utm_term": "",
-            "utm_content_status": "ناشر",
-            "utm_content": "",
-            "utm_source": "yektanet",
-            "is_daily": False,
-            "is_periodic": False,
-            "device_os_type": "all",
-            "display_all_os_versions": True,
-            "display_all_mobile_brands": True,
-            "display_mobile_brand": [],
-            "display_all_countries": True,
-            "countries": [],
-            "display_location": [],
-            "show_only_in_capital": False,
-            "display_in_all_isp": True,
-            "display_isp": [
-                "Shatel",
-                "Iran Cell",
-                "Mobile Communication Company",
-                "Rightel",
-                "Asiatech",
-                "Mobin Net",
-                "Telecommunication",
-                "Pars Online",
-                "Afranet",
-                "Respina",
-                "Information Technology Company",
-                "Neda Rayaneh",
-                "Other",
-            ],
-            "publisher_floating_bids": [],
-            "publisher_group_floating_bids": [],
-            "subcategories": [
-                {"category_id": CATEGORY_MAP.get(category), "subcategory_id": 0}
-                for category in page_categories
-            ],
-            "keywords": [{"keyword": keyword} for keyword in page_keywords],
-            "negative_keywords": [],
-            "broad_allowed": True,
-            "goal": {"type": "9", "tags": []},
-            "config": {
-                "segment_ids": [SEGMENT_MAP.get(segment) for segment in user_segments],
-            },
-            "segmentation_enabled": len(user_segments) > 0,
-            "target_suppliers": ["web", "push"],
-            "is_push_supplier_active": True,
-            "is_adivery_supplier_active": False,
-            "is_divar": False,
-            "divar_config": {
-                "cities": [],
-                "category_slugs": [],
-                "categories": [],
-                "keywords": [],
-                "neighborhoods": [],
-                "min_price": None,
-                "max_price": None,
-                "brands": [],
-                "smart_targeting": True,
-            },
-            "is_rubika": False,
-            "user_apply": False,  # Indicates campaign should be active or not
-        },
+    campaign_creation_request = authorized_request(
+        "POST",
+        url=f"{YEKTANET_API_URL}/api/v2/adv/campaigns/",
+        json=build_native_campaign_payload(
+            name,
+            daily_budget,
+            cost_per_click,
+            page_keywords,
+            page_categories,
+            user_segments,
+            publisher_group_id,
+            token_manager.advertiser_id,
+        ),
     )
-    if campaign_creation_request.status_code != 201:
-        print(campaign_creation_request.text, campaign_creation_request.status_code)
-        return None
-    campaign_id = json.loads(campaign_creation_request.text)["id"]
-    print(f"{campaign_id}: Created campaign")
+    campaign_id = parse_created_id(
+        campaign_creation_request.status_code, campaign_creation_request.text
+    )
+    if campaign_id is not None:
+        print(f"{campaign_id}: Created campaign")
     return campaign_id
 
-def get_or_create_publisher_group(pg_name, campaign_type):
-    refresh_token()  # Refresh JWT if needed
+
+def index_publisher_groups(groups: list[dict]) -> dict[tuple[str, str], int]:
+    """Index a publisher groups listing by (title, campaign_type)."""
+    return {(group["title"], group["campaign_type"]): group["id"] for group in groups}
+
+
+class PublisherGroupCache:
+    """
+    (name, campaign_type) -> id index of the advertiser's publisher groups.
+
+    The index is filled from one listing call and expires after a TTL, so
+    campaigns for the same PUBLISHER_GROUPS entry skip the listing entirely.
+    """
+
+    def __init__(self, ttl_seconds: int = PUBLISHER_GROUP_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._index: dict[tuple[str, str], int] = {}
+        self._loaded_at: Optional[float] = None
+        # Serializes get-or-create so concurrent workers create a group once
+        self.create_lock = threading.Lock()
+
+    def is_fresh(self) -> bool:
+        with self._lock:
+            return (
+                self._loaded_at is not None
+                and time.monotonic() - self._loaded_at < self.ttl_seconds
+            )
+
+    def load(self, groups: list[dict]) -> None:
+        with self._lock:
+            self._index = index_publisher_groups(groups)
+            self._loaded_at = time.monotonic()
+
+    def get(self, pg_name: str, campaign_type: str) -> Optional[int]:
+        if not self.is_fresh():
+            return None
+        with self._lock:
+            return self._index.get((pg_name, campaign_type))
+
+    def set(self, pg_name: str, campaign_type: str, pg_id: int) -> None:
+        with self._lock:
+            self._index[(pg_name, campaign_type)] = pg_id
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = {}
+            self._loaded_at = None
+
+
+publisher_group_cache = PublisherGroupCache()
+
+
+def list_publisher_groups() -> Optional[list[dict]]:
+    """Fetch the advertiser's publisher groups and refresh the lookup cache."""
     print("Fetching publisher groups...")
 
-    response = requests.get(
-        url="https://api.yektanet.com/api/v2/adv/publishers/groups/",
-        headers=HEADERS,  # Authorization: JWT <token>
+    response = authorized_request(
+        "GET",
+        url=f"{YEKTANET_API_URL}/api/v2/adv/publishers/groups/",
         timeout=30,
     )
 
     if response.status_code != 200:
         print(response.text, response.status_code)
-        return ""
+        return None
 
     groups = response.json()
-    pg_id = None
-    for group in groups:
-        if group['title'] == pg_name and group["campaign_type"] == campaign_type:
-            pg_id = group['id']
-    if pg_id is None:
-        assert pg_name in PUBLISHER_GROUPS, "Invalid publisher_group_name"
-        pg_id = create_publisher_group(pg_name, PUBLISHER_GROUPS[pg_name], campaign_type)
-    return pg_id
+    publisher_group_cache.load(groups)
+    return groups
 
 
-def create_publisher_group(title: str, publishers: list[str], campaign_type: str):
-    refresh_token()  # Assuming you have this from your existing code
-    print(f"Creating publisher group: {title}")
+def warm_publisher_group_cache() -> None:
+    """Load the publisher group index, e.g. when a worker starts."""
+    try:
+        list_publisher_groups()
+    except Exception as e:
+        print(f"Error warming publisher group cache: {e}")
+
+
+def get_or_create_publisher_group(pg_name, campaign_type):
+    pg_id = publisher_group_cache.get(pg_name, campaign_type)
+    if pg_id is not None:
+        return pg_id
+
+    with publisher_group_cache.create_lock:
+        pg_id = publisher_group_cache.get(pg_name, campaign_type)
+        if pg_id is not None:
+            return pg_id
+        if list_publisher_groups() is None:
+            return ""
+        pg_id = publisher_group_cache.get(pg_name, campaign_type)
+        if pg_id is None:
+            assert pg_name in PUBLISHER_GROUPS, "Invalid publisher_group_name"
+            pg_id = create_publisher_group(pg_name, PUBLISHER_GROUPS[pg_name], campaign_type)
+    return pg_id
+
 
-    payload = {
+def build_publisher_group_payload(
+    title: str, publishers: list[str], campaign_type: str
+) -> dict:
+    """Request body of the publisher group creation API."""
+    return {
         "title": title,
         "publishers": publishers,  # Must be list of strings (IDs as strings)
         "campaign_type": campaign_type
     }
 
-    group_creation_request = requests.post(
-        url="https://api.yektanet.com/api/v2/adv/publishers/groups/create/",
-        headers=HEADERS,  # Must include Authorization: JWT <token>
-        json=payload,
+
+def create_publisher_group(title: str, publishers: list[str], campaign_type: str):
+    print(f"Creating publisher group: {title}")
+
+    group_creation_request = authorized_request(
+        "POST",
+        url=f"{YEKTANET_API_URL}/api/v2/adv/publishers/groups/create/",
+        json=build_publisher_group_payload(title, publishers, campaign_type),
         timeout=30,
     )
 
-    if group_creation_request.status_code != 201:
-        print(group_creation_request.text, group_creation_request.status_code)
-        return None
-
-    group_id = json.loads(group_creation_request.text)["id"]
-    print(f"Created publisher group with ID: {group_id}")
+    group_id = parse_created_id(
+        group_creation_request.status_code, group_creation_request.text
+    )
+    if group_id is not None:
+        print(f"Created publisher group with ID: {group_id}")
+        publisher_group_cache.set(title, campaign_type, group_id)
+    else:
+        publisher_group_cache.invalidate()
     return group_id
 
 
-def read_and_resize_image(image_path: str, image_source: str) -> BytesIO:
-    if image_source == "user_asset":
-        # Download image into memory    
-        response = requests.get(image_path)
-        response.raise_for_status()
-        img = Image.open(BytesIO(response.content))
-    else:
-        img = Image.open(image_path)
+def resize_image(img: Image.Image) -> BytesIO:
+    """Shrink an ad image to fit 600px and encode it as PNG."""
     max_side = 600
     img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
 
@@ -336,33 +557,48 @@ def read_and_resize_image(image_path: str, image_source: str) -> BytesIO:
     return image_file
 
 
+def read_and_resize_image(image_path: str, image_source: str) -> BytesIO:
+    if image_source == "user_asset":
+        # Download image into memory    
+        response = yektanet_client.get(image_path, endpoint="GET user_asset_image")
+        response.raise_for_status()
+        img = Image.open(BytesIO(response.content))
+    else:
+        img = Image.open(image_path)
+    return resize_image(img)
+
+
+def build_ad_form(
+    campaign_id: int, ad_title: str, ad_url: str, ad_cta_title: str
+) -> dict:
+    """Form fields of the ad creation API; the image is sent as a file."""
+    return {
+        "campaign": campaign_id,
+        "title": ad_title,
+        "item_url": ad_url,
+        "description": "",
+        "user_apply": "off",  # This indicates that the ad should be active or not
+        "cta_color": "#FF0000",
+        "cta_title": ad_cta_title[:13],
+        "image_source": "manual",
+    }
+
+
 def create_ad(
     campaign_id: int, ad_title: str, image_path: str, ad_url: str, ad_cta_title: str, image_source: str
 ):
     image_file = read_and_resize_image(image_path, image_source)
-    refresh_token()
     print(f"{campaign_id}: Creating ad")
-    ad_creation_request = requests.post(
-        url="https://ad-management.yektanet.com/v1/ad/",
-        headers=HEADERS,
-        data={
-            "campaign": campaign_id,
-            "title": ad_title,
-            "item_url": ad_url,
-            "description": "",
-            "user_apply": "off",  # This indicates that the ad should be active or not
-            "cta_color": "#FF0000",
-            "cta_title": ad_cta_title[:13],
-            "image_source": "manual",
-        },
+    ad_creation_request = authorized_request(
+        "POST",
+        url=f"{YEKTANET_AD_MANAGEMENT_URL}/v1/ad/",
+        data=build_ad_form(campaign_id, ad_title, ad_url, ad_cta_title),
         files={"image": ("image.png", image_file, "image/png")},
         timeout=30,
     )
-    if ad_creation_request.status_code != 201:
-        print(ad_creation_request.text, ad_creation_request.status_code)
-        return None
-    ad_id = json.loads(ad_creation_request.text)["id"]
-    print(f"{campaign_id}: Created ad {ad_id}")
+    ad_id = parse_created_id(ad_creation_request.status_code, ad_creation_request.text)
+    if ad_id is not None:
+        print(f"{campaign_id}: Created ad {ad_id}")
     return ad_id
 
 
@@ -383,12 +619,8 @@ def generate_ad_image(ad_image_description: str, model:str = "gpt-image"):
 
 def openai_generate_ad_image(ad_image_description: str):
     import base64
-    from openai import OpenAI
-    from pages.config import OPENAI_BASE_URL, get_openai_api_key
-    client = OpenAI(
-        base_url=OPENAI_BASE_URL,
-        api_key=get_openai_api_key(),
-    )    
+    from pages.agent_factory import get_openai_client
+    client = get_openai_client("gpt-image-1")
     print("Generating image")
     refined_prompt = ad_image_description + "\n" + REFINED_PROMPT
 
@@ -426,11 +658,10 @@ def openai_generate_ad_image(ad_image_description: str):
 
 def dastyaar_generate_ad_image(ad_image_description: str):
     print("Generating image")
-    refresh_token()
     refined_prompt = ad_image_description + "\n" + REFINED_PROMPT
-    image_creation_request = requests.post(
-        url="https://assistant.yektanet.com/api/v2/facilitator/assets/images/",
-        headers=HEADERS,
+    image_creation_request = authorized_request(
+        "POST",
+        url=f"{YEKTANET_ASSISTANT_URL}/api/v2/facilitator/assets/images/",
         json={
             "raw_prompt": refined_prompt,
             "campaign_id": None,
@@ -445,7 +676,9 @@ def dastyaar_generate_ad_image(ad_image_description: str):
     image_url = json.loads(image_creation_request.text)["images"][0]["image"]
     print(f"Generated image {image_url}")
     print(f"Downloading Image")
-    resp = requests.get(image_url, timeout=20)
+    resp = yektanet_client.get(
+        image_url, endpoint="GET dastyaar_generated_image", timeout=20
+    )
     resp.raise_for_status()
     img = Image.open(BytesIO(resp.content)).convert("RGB")
     # max_side = 600
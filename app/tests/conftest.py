@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the application as `pages.*`, like PYTHONPATH=app does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,91 @@
+import pytest
+
+from pages import agent_factory
+from pages.agent_factory import AgentPool, checkout_agent
+
+
+class FakeAgent:
+    def __init__(self, session_id: str, user_id: str = "1"):
+        self.session_id = session_id
+        self.user_id = user_id
+
+    def bind_session(self, session_id: str, user_id=None) -> None:
+        self.session_id = session_id
+        if user_id is not None:
+            self.user_id = user_id
+
+
+class OtherAgent(FakeAgent):
+    pass
+
+
+def test_acquire_returns_the_agent_of_the_session():
+    pool = AgentPool(max_size=2)
+    agent = pool.acquire(FakeAgent, "a")
+    pool.release(agent)
+
+    assert pool.acquire(FakeAgent, "a") is agent
+    assert pool.stats()["hits"] == 1
+
+
+def test_full_pool_rebinds_an_idle_agent_of_the_same_type():
+    pool = AgentPool(max_size=2)
+    other = pool.acquire(OtherAgent, "a")
+    agent = pool.acquire(FakeAgent, "b")
+    pool.release(other)
+    pool.release(agent)
+
+    rebound = pool.acquire(FakeAgent, "c")
+
+    assert rebound is agent
+    assert rebound.session_id == "c"
+    assert pool.stats()["rebinds"] == 1
+
+
+def test_agents_with_other_options_are_evicted_not_rebound():
+    pool = AgentPool(max_size=1)
+    agent = pool.acquire(FakeAgent, "a", user_id="1")
+    pool.release(agent)
+
+    other = pool.acquire(FakeAgent, "b", user_id="2")
+
+    assert other is not agent
+    assert (other.session_id, other.user_id) == ("b", "2")
+    assert pool.stats()["size"] == 1
+
+
+def test_checked_out_agents_are_never_rebound():
+    pool = AgentPool(max_size=1)
+    agent = pool.acquire(FakeAgent, "a")
+
+    other = pool.acquire(FakeAgent, "b")
+
+    assert other is not agent
+    assert agent.session_id == "a"
+    assert pool.stats()["size"] == 2
+
+
+def test_released_agents_become_evictable():
+    pool = AgentPool(max_size=1)
+    agent = pool.acquire(FakeAgent, "a")
+    pool.acquire(FakeAgent, "a")
+    pool.release(agent)
+
+    # Still checked out once
+    assert pool.acquire(FakeAgent, "b") is not agent
+    pool.release(agent)
+    pool.clear()
+    assert pool.stats()["size"] == 1
+
+
+def test_checkout_agent_releases_the_agent(monkeypatch):
+    pool = AgentPool(max_size=1)
+    monkeypatch.setattr(agent_factory, "agent_pool", pool)
+
+    with pytest.raises(RuntimeError):
+        with checkout_agent(FakeAgent, "a") as agent:
+            assert pool.stats()["checked_out"] == 1
+            raise RuntimeError
+
+    assert pool.stats()["checked_out"] == 0
+    assert pool.acquire(FakeAgent, "b") is agent
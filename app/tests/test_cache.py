@@ -0,0 +1,37 @@
+from pages import cache
+from pages.cache import TTLCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    entries = TTLCache(max_size=2, ttl_seconds=None)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+
+    assert entries.get("a") == 1
+    assert entries.get("b") is None
+    assert entries.get("c") == 3
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    entries = TTLCache(max_size=2, ttl_seconds=10)
+    entries.set("a", 1)
+
+    now[0] += 9
+    assert entries.get("a") == 1
+    now[0] += 1
+    assert entries.get("a", "expired") == "expired"
+    assert entries.stats()["size"] == 0
+
+
+def test_stats_count_hits_and_misses():
+    entries = TTLCache()
+    entries.set("a", 1)
+    entries.get("a")
+    entries.get("b")
+
+    stats = entries.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
@@ -0,0 +1,73 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from pages.http_client import RetryPolicy, request_not_sent
+
+
+def connection_refused() -> requests.ConnectionError:
+    """A ConnectionError as requests raises it when no connection was opened."""
+    reason = NewConnectionError(None, "Failed to establish a new connection")
+    return requests.ConnectionError(MaxRetryError(None, "/api", reason))
+
+
+@pytest.fixture
+def policy() -> RetryPolicy:
+    return RetryPolicy(max_retries=3)
+
+
+def test_idempotent_requests_retry_retryable_statuses(policy):
+    assert policy.should_retry_status("GET", 500, 0)
+    assert policy.should_retry_status("PUT", 502, 2)
+    assert not policy.should_retry_status("GET", 404, 0)
+
+
+def test_post_only_retries_statuses_that_were_not_processed(policy):
+    assert policy.should_retry_status("POST", 429, 0)
+    assert policy.should_retry_status("POST", 503, 0)
+    assert not policy.should_retry_status("POST", 500, 0)
+    assert not policy.should_retry_status("POST", 502, 0)
+
+
+def test_no_retry_after_max_retries(policy):
+    assert not policy.should_retry_status("GET", 503, 3)
+    assert not policy.should_retry_error("GET", requests.ConnectTimeout(), 3)
+
+
+def test_idempotent_requests_retry_any_connection_error(policy):
+    assert policy.should_retry_error("GET", requests.ReadTimeout(), 0)
+    assert policy.should_retry_error("DELETE", requests.ConnectionError(), 0)
+
+
+def test_post_retries_only_when_the_request_was_not_sent(policy):
+    assert policy.should_retry_error("POST", requests.ConnectTimeout(), 0)
+    assert policy.should_retry_error("POST", connection_refused(), 0)
+    assert not policy.should_retry_error("POST", requests.ReadTimeout(), 0)
+    assert not policy.should_retry_error("POST", requests.ConnectionError(), 0)
+
+
+def test_request_not_sent_follows_exception_causes():
+    try:
+        try:
+            raise NewConnectionError(None, "refused")
+        except NewConnectionError as e:
+            raise requests.ConnectionError("wrapped") from e
+    except requests.ConnectionError as e:
+        assert request_not_sent(e)
+
+
+def test_not_sent_errors_can_be_replaced(policy):
+    class Refused(Exception):
+        pass
+
+    assert policy.should_retry_error("POST", Refused(), 0, (Refused,))
+    assert not policy.should_retry_error(
+        "POST", requests.ConnectTimeout(), 0, (Refused,)
+    )
+
+
+def test_backoff_honors_retry_after_up_to_max_backoff():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=10)
+    assert policy.backoff_delay(0, "3") == 3
+    assert policy.backoff_delay(0, "60") == 10
+    assert 0 <= policy.backoff_delay(10) <= 10
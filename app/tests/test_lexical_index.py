@@ -0,0 +1,12 @@
+from pages.lexical_index import reciprocal_rank_fusion
+
+
+def test_ids_ranked_by_several_retrievers_come_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_empty_rankings_fuse_to_nothing():
+    assert reciprocal_rank_fusion([[], []]) == []
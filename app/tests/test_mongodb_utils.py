@@ -0,0 +1,93 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from bson import ObjectId
+
+from pages import mongodb_utils
+from pages.models import Task
+
+
+@pytest.fixture
+def collection(monkeypatch) -> MagicMock:
+    """The tasks collection, replaced by a mock."""
+    collection = MagicMock()
+    manager = MagicMock()
+    manager.get_collection.return_value = collection
+    monkeypatch.setattr(mongodb_utils, "get_mongodb_manager", lambda: manager)
+    return collection
+
+
+def matched(count: int) -> MagicMock:
+    return MagicMock(matched_count=count)
+
+
+def test_claim_one_task_leases_the_task_to_the_worker(collection):
+    task_id = ObjectId()
+    collection.find_one_and_update.return_value = {"_id": task_id, "type": "x"}
+
+    task = mongodb_utils.claim_one_task({"type": "x"}, "worker-1", lease_seconds=60)
+
+    assert task == {"id": str(task_id), "type": "x"}
+    query, update = collection.find_one_and_update.call_args.args
+    assert {"type": "x"} in query["$and"]
+    assert update["$set"]["worker_id"] == "worker-1"
+    assert update["$set"]["lease_expires_at"] > datetime.utcnow()
+
+
+def test_claim_one_task_skips_leased_and_delayed_tasks(collection):
+    collection.find_one_and_update.return_value = None
+
+    assert mongodb_utils.claim_one_task({}, "worker-1", lease_seconds=60) is None
+    query = collection.find_one_and_update.call_args.args[0]
+    lease, retry = query["$and"][1], query["$and"][2]
+    assert {"lease_expires_at": None} in lease["$or"]
+    assert {"not_before": None} in retry["$or"]
+
+
+def test_renew_task_lease_is_fenced_by_worker(collection):
+    task_id = str(ObjectId())
+    collection.update_one.return_value = matched(1)
+    assert mongodb_utils.renew_task_lease(task_id, "worker-1", lease_seconds=60)
+    query = collection.update_one.call_args.args[0]
+    assert query == {"_id": ObjectId(task_id), "worker_id": "worker-1"}
+
+    collection.update_one.return_value = matched(0)
+    assert not mongodb_utils.renew_task_lease(task_id, "worker-1", lease_seconds=60)
+
+
+def test_update_task_is_fenced_by_worker(collection):
+    task = Task(id=str(ObjectId()), type="x", description="", session_id="s")
+    collection.update_one.return_value = matched(0)
+
+    assert not mongodb_utils.update_task(task, "worker-1")
+    query, update = collection.update_one.call_args.args
+    assert query == {"_id": ObjectId(task.id), "worker_id": "worker-1"}
+    assert "id" not in update["$set"]
+
+
+def test_update_task_without_worker_updates_any_lease(collection):
+    task = Task(id=str(ObjectId()), type="x", description="", session_id="s")
+    collection.update_one.return_value = matched(1)
+
+    assert mongodb_utils.update_task(task)
+    assert collection.update_one.call_args.args[0] == {"_id": ObjectId(task.id)}
+
+
+def test_update_task_fields_is_fenced_by_worker(collection):
+    task_id = str(ObjectId())
+    collection.update_one.return_value = matched(1)
+
+    assert mongodb_utils.update_task_fields(task_id, {"status": "failed"}, "worker-1")
+    query, update = collection.update_one.call_args.args
+    assert query == {"_id": ObjectId(task_id), "worker_id": "worker-1"}
+    assert update == {"$set": {"status": "failed"}}
+
+
+def test_next_task_retry_time_is_the_earliest_future_not_before(collection):
+    not_before = datetime(2030, 1, 1)
+    collection.find_one.return_value = {"not_before": not_before}
+    assert mongodb_utils.next_task_retry_time({}) == not_before
+
+    collection.find_one.return_value = None
+    assert mongodb_utils.next_task_retry_time({}) is None
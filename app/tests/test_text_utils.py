@@ -0,0 +1,31 @@
+from pages.text_utils import split_into_passages
+
+
+def test_short_text_is_one_passage():
+    assert split_into_passages("  one passage  ", 100) == ["one passage"]
+    assert split_into_passages("", 100) == []
+
+
+def test_passages_break_at_paragraphs():
+    text = "first paragraph here\n\nsecond paragraph here"
+    assert split_into_passages(text, 30) == [
+        "first paragraph here",
+        "second paragraph here",
+    ]
+
+
+def test_passages_respect_max_chars_and_cover_the_text():
+    words = [f"word{i}" for i in range(200)]
+    passages = split_into_passages(" ".join(words), 50, overlap_chars=10)
+
+    assert all(len(passage) <= 50 for passage in passages)
+    covered = {word for passage in passages for word in passage.split()}
+    assert covered == set(words)
+
+
+def test_consecutive_passages_overlap_on_whole_words():
+    words = [f"word{i}" for i in range(50)]
+    passages = split_into_passages(" ".join(words), 60, overlap_chars=15)
+
+    for previous, passage in zip(passages, passages[1:]):
+        assert passage.split()[0] in previous.split()